@@ -0,0 +1 @@
+"""Các benchmark hiệu năng cho luồng dữ liệu Checkstock"""
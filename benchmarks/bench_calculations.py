@@ -0,0 +1,92 @@
+"""
+Benchmark calculate_inventory_fields: bản vectorized so với bản dùng apply theo dòng
+
+Chạy: python -m benchmarks.bench_calculations --rows 1000000
+"""
+import argparse
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from data.locks import LOCKS
+from data.materials import MATERIALS
+from utils.calculations import calculate_inventory_fields
+
+
+def legacy_calculate_inventory_fields(df):
+    """Bản cài đặt cũ (copy toàn bộ + apply theo dòng), giữ lại để so sánh"""
+    df_calc = df.copy()
+    numeric_cols = ['Tồn đầu (Bag)', 'Tồn đầu (Weight)', 'Nhập (Bag)', 'Nhập (Weight)',
+                    'Sử dụng (Bag)', 'Sử dụng (Weight)']
+    for col in numeric_cols:
+        if col in df_calc.columns:
+            df_calc[col] = pd.to_numeric(df_calc[col], errors='coerce').fillna(0)
+    df_calc['Tồn cuối (Bag)'] = df_calc['Tồn đầu (Bag)'] + df_calc['Nhập (Bag)'] - df_calc['Sử dụng (Bag)']
+    df_calc['Tồn cuối (Weight)'] = df_calc['Tồn đầu (Weight)'] + df_calc['Nhập (Weight)'] - df_calc['Sử dụng (Weight)']
+    df_calc['Trung bình'] = df_calc.apply(
+        lambda x: x['Tồn cuối (Weight)'] / x['Tồn cuối (Bag)'] if x['Tồn cuối (Bag)'] > 0 else 0,
+        axis=1
+    ).round(2)
+    df_calc['Ngày nhập'] = pd.to_datetime(df_calc['Ngày nhập'], errors='coerce')
+    df_calc['Tuổi lưu kho'] = (datetime.now() - df_calc['Ngày nhập']).dt.days
+    return df_calc
+
+
+def make_frame(n_rows, seed=0):
+    """Tạo DataFrame giao dịch ngẫu nhiên có cùng cột với worksheet Inventory"""
+    rng = np.random.default_rng(seed)
+    import_bags = rng.integers(0, 200, n_rows)
+    usage_bags = rng.integers(0, 150, n_rows)
+    return pd.DataFrame({
+        'Ngày nhập': pd.Timestamp('2022-01-01') + pd.to_timedelta(rng.integers(0, 1000, n_rows), unit='D'),
+        'Name': rng.choice(MATERIALS, n_rows),
+        'Lock': rng.choice(LOCKS, n_rows),
+        'Tồn đầu (Bag)': rng.integers(0, 500, n_rows),
+        'Tồn đầu (Weight)': rng.uniform(0, 25000, n_rows).round(1),
+        'Nhập (Bag)': import_bags,
+        'Nhập (Weight)': (import_bags * 50.0).round(1),
+        'Sử dụng (Bag)': usage_bags,
+        'Sử dụng (Weight)': (usage_bags * 50.0).round(1),
+    })
+
+
+def best_of(func, repeat):
+    """Thời gian tốt nhất (giây) sau repeat lần chạy"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--legacy-rows", type=int, default=100_000,
+                        help="Số dòng cho bản cũ (apply theo dòng rất chậm)")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    df = make_frame(args.rows)
+    vectorized = best_of(lambda: calculate_inventory_fields(df), args.repeat)
+    in_place = best_of(lambda: calculate_inventory_fields(df.copy(), inplace=True), 1)
+    print(f"vectorized   {args.rows:>10,} dòng: {vectorized:8.3f}s")
+    print(f"inplace      {args.rows:>10,} dòng: {in_place:8.3f}s (gồm cả df.copy())")
+
+    legacy_df = df.head(args.legacy_rows)
+    legacy = best_of(lambda: legacy_calculate_inventory_fields(legacy_df), 1)
+    legacy_per_row = legacy / len(legacy_df)
+    print(f"legacy       {len(legacy_df):>10,} dòng: {legacy:8.3f}s "
+          f"(ước tính {legacy_per_row * args.rows:.1f}s cho {args.rows:,} dòng)")
+    print(f"tăng tốc ước tính: {legacy_per_row * args.rows / vectorized:.0f}x")
+
+    before = legacy_calculate_inventory_fields(legacy_df).memory_usage(deep=True).sum()
+    after = calculate_inventory_fields(legacy_df).memory_usage(deep=True).sum()
+    print(f"bộ nhớ kết quả: {before / 1e6:.1f} MB -> {after / 1e6:.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
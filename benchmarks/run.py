@@ -0,0 +1,205 @@
+"""
+Chạy bộ benchmark cho toàn bộ luồng dữ liệu và xuất kết quả JSON
+
+Chạy: python -m benchmarks.run --rows 100000 --output results.json
+So sánh: python -m benchmarks.run --rows 100000 --compare baseline.json
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+import database
+from benchmarks.bench_calculations import best_of
+from benchmarks.workload import generate_movements, to_text_upload_frame, to_upload_frame
+from utils.calculations import calculate_inventory_fields, calculate_totals
+from utils.cleaning import clean_inventory_dataframe
+from utils.export import iter_dataframe_chunks, write_csv, write_xlsx
+from utils.fake_sheets import attach_fake_backend
+from utils.google_sheets import GoogleSheetsManager, build_transaction_row, dataframe_to_values
+from utils.sheets_scheduler import SheetsScheduler
+
+SUITES = ["calculations", "cleaning", "database", "sheets", "export"]
+
+# Giới hạn số dòng của worksheet giả lập (Google Sheets tối đa 10 triệu ô, 19 cột)
+MAX_SHEET_ROWS = 500_000
+
+# Tỷ lệ chậm đi (so với baseline) bị coi là suy giảm hiệu năng
+REGRESSION_THRESHOLD = 1.25
+
+def _git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        ).stdout.strip() or None
+    except OSError:
+        return None
+
+class BenchmarkRun:
+    """Gom kết quả các benchmark: mỗi kết quả có tên, số dòng, thời gian tốt nhất và thông số phụ"""
+
+    def __init__(self, repeat):
+        self.repeat = repeat
+        self.results = []
+
+    def time(self, name, rows, func, repeat=None, **extra):
+        seconds = best_of(func, repeat or self.repeat)
+        self.results.append({
+            "name": name,
+            "rows": rows,
+            "seconds": round(seconds, 6),
+            "rows_per_second": round(rows / seconds) if seconds > 0 else None,
+            **extra,
+        })
+        print(f"{name:<32} {rows:>10,} dòng {seconds:>9.3f}s", file=sys.stderr)
+
+def bench_calculations(run, movements):
+    raw = movements.drop(columns=["Tồn cuối (Bag)", "Tồn cuối (Weight)", "Trung bình", "Tuổi lưu kho"])
+    run.time("calculate_inventory_fields", len(raw), lambda: calculate_inventory_fields(raw))
+    calculated = calculate_inventory_fields(raw)
+    run.time("calculate_totals", len(calculated), lambda: calculate_totals(calculated))
+
+def bench_cleaning(run, upload, text_upload):
+    run.time("clean_inventory_dataframe", len(upload), lambda: clean_inventory_dataframe(upload))
+    run.time("clean_inventory_dataframe[text]", len(text_upload),
+             lambda: clean_inventory_dataframe(text_upload))
+
+def bench_database(run, upload):
+    clean = clean_inventory_dataframe(upload)
+    with tempfile.TemporaryDirectory() as directory:
+        previous_db = database.DB
+        database.DB = os.path.join(directory, "bench.db")
+        try:
+            database.init_db()
+            run.time("database.save_dataframe", len(clean),
+                     lambda: database.save_dataframe(clean, "inventory"), repeat=1)
+            run.time("database.load_table", len(clean), lambda: database.load_table("inventory"))
+            # Upload lại cùng dữ liệu: toàn bộ dòng không đổi
+            run.time("database.upsert_unchanged", len(clean),
+                     lambda: database.upsert_dataframe_chunks([clean]), repeat=1)
+        finally:
+            database.close_connection()
+            database.DB = previous_db
+
+def bench_sheets(run, movements):
+    movements = movements.head(MAX_SHEET_ROWS)
+    manager = GoogleSheetsManager()
+    worksheet_title = "Inventory"
+    attach_fake_backend(manager, "bench")
+    # Không giới hạn quota: chỉ đo chi phí phía client
+    manager.scheduler = SheetsScheduler(read_quota=10 ** 9, write_quota=10 ** 9, max_retries=0)
+    worksheet = manager.get_worksheet(worksheet_title)
+
+    def timed(name, rows, func, repeat=None):
+        """Đo thời gian và số request trung bình mỗi lần chạy"""
+        before = worksheet.request_count
+        run.time(name, rows, func, repeat=repeat)
+        runs = repeat or run.repeat
+        run.results[-1]["requests"] = (worksheet.request_count - before) / runs
+
+    rows = len(movements)
+    run.time("sheets.dataframe_to_values", rows, lambda: dataframe_to_values(movements))
+    timed("sheets.update_inventory_data", rows, lambda: manager.update_inventory_data(movements), repeat=1)
+    timed("sheets.get_all_data", rows, lambda: manager.get_all_data(worksheet_title))
+
+    # Đồng bộ tăng dần sau khi thêm 100 dòng
+    new_rows = [build_transaction_row(row, row_id=f"bench-{i}")
+                for i, row in enumerate(movements.head(100).to_dict("records"))]
+
+    def append_then_sync():
+        manager.append_rows(new_rows, worksheet_title)
+        manager.sync_data(worksheet_title)
+
+    timed("sheets.append_rows+sync_data", len(new_rows), append_then_sync)
+
+def compare(results, baseline_path, threshold=REGRESSION_THRESHOLD):
+    """In tỷ lệ thời gian so với baseline; trả về danh sách benchmark bị chậm đi"""
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = {(r["name"], r["rows"]): r for r in json.load(f)["results"]}
+    regressions = []
+    for result in results:
+        old = baseline.get((result["name"], result["rows"]))
+        if not old or not old["seconds"]:
+            continue
+        ratio = result["seconds"] / old["seconds"]
+        flag = "  <-- chậm đi" if ratio > threshold else ""
+        print(f"{result['name']:<32} {old['seconds']:>9.3f}s -> {result['seconds']:>9.3f}s "
+              f"({ratio:.2f}x){flag}", file=sys.stderr)
+        if ratio > threshold:
+            regressions.append(result["name"])
+    return regressions
+
+def bench_export(run, movements):
+    with tempfile.TemporaryDirectory() as directory:
+        for name, writer, extension in (("export.write_csv", write_csv, "csv"),
+                                        ("export.write_xlsx", write_xlsx, "xlsx")):
+            path = os.path.join(directory, f"bench.{extension}")
+            run.time(name, len(movements), lambda: writer(iter_dataframe_chunks(movements), path), repeat=1)
+            run.results[-1]["bytes"] = os.path.getsize(path)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--days", type=int, default=3 * 365, help="Khoảng thời gian của dữ liệu (ngày)")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--suite", action="append", choices=SUITES, help="Mặc định chạy tất cả")
+    parser.add_argument("--output", help="File JSON kết quả (mặc định in ra stdout)")
+    parser.add_argument("--compare", help="File JSON baseline để so sánh")
+    parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD)
+    args = parser.parse_args()
+    suites = args.suite or SUITES
+
+    started = time.perf_counter()
+    movements = generate_movements(args.rows, days=args.days, seed=args.seed)
+    upload = to_upload_frame(movements)
+    print(f"sinh dữ liệu {args.rows:,} dòng: {time.perf_counter() - started:.2f}s", file=sys.stderr)
+
+    run = BenchmarkRun(args.repeat)
+    if "calculations" in suites:
+        bench_calculations(run, movements)
+    if "cleaning" in suites:
+        bench_cleaning(run, upload, to_text_upload_frame(movements))
+    if "database" in suites:
+        bench_database(run, upload)
+    if "sheets" in suites:
+        bench_sheets(run, movements)
+    if "export" in suites:
+        bench_export(run, movements)
+
+    report = {
+        "meta": {
+            "revision": _git_revision(),
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "pandas": pd.__version__,
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "rows": args.rows,
+            "days": args.days,
+            "seed": args.seed,
+            "repeat": args.repeat,
+        },
+        "results": run.results,
+    }
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+    if args.compare and compare(run.results, args.compare, args.threshold):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+Sinh dữ liệu xuất nhập kho giả lập cho benchmark (vectorized, 10k đến 10M dòng)
+
+Mỗi cặp (nguyên liệu, vị trí) có độ phổ biến khác nhau, mỗi nguyên liệu có khối lượng bao riêng,
+giao dịch là nhập (ít, số lượng lớn) hoặc sử dụng (nhiều, số lượng nhỏ) rải đều trong khoảng ngày.
+"""
+import numpy as np
+import pandas as pd
+
+from data.locks import LOCKS
+from data.materials import MATERIALS
+from utils.google_sheets import INVENTORY_HEADERS
+from utils.ledger import rebuild_balances
+
+# Tỷ lệ giao dịch nhập trên tổng số giao dịch
+RECEIPT_RATIO = 0.35
+
+# Trung bình số giao dịch của mỗi cặp (nguyên liệu, vị trí) đang dùng
+ROWS_PER_PAIR = 200
+
+def _active_pairs(rng, n_rows, materials, locks):
+    """Các cặp (nguyên liệu, vị trí) có giao dịch và xác suất chọn của từng cặp (phân bố lệch)"""
+    n_pairs = int(np.clip(n_rows // ROWS_PER_PAIR, 1, len(materials) * len(locks)))
+    flat = rng.choice(len(materials) * len(locks), size=n_pairs, replace=False)
+    weights = 1.0 / np.arange(1, n_pairs + 1) ** 0.8
+    return flat // len(locks), flat % len(locks), weights / weights.sum()
+
+def generate_movements(n_rows, days=3 * 365, start="2022-01-01", seed=0,
+                       materials=None, locks=None, with_balances=True):
+    """DataFrame giao dịch theo INVENTORY_HEADERS, sắp theo thời gian"""
+    rng = np.random.default_rng(seed)
+    materials = np.array(list(dict.fromkeys(materials or MATERIALS)), dtype=object)
+    locks = np.array(list(dict.fromkeys(locks or LOCKS)), dtype=object)
+
+    material_pos, lock_pos, weights = _active_pairs(rng, n_rows, materials, locks)
+    pair = rng.choice(len(weights), size=n_rows, p=weights)
+
+    # Thời điểm giao dịch tăng dần trong khoảng ngày
+    seconds = np.sort(rng.integers(0, days * 86400, n_rows))
+    timestamps = pd.Timestamp(start) + pd.to_timedelta(seconds, unit="s")
+
+    bag_weight = rng.uniform(25, 50, len(materials)).round(1)[material_pos[pair]]
+    is_receipt = rng.random(n_rows) < RECEIPT_RATIO
+    bags = np.where(is_receipt, rng.integers(20, 400, n_rows), rng.integers(1, 60, n_rows))
+    weight = (bags * bag_weight * rng.normal(1.0, 0.01, n_rows)).round(1)
+    zeros = np.zeros(n_rows)
+
+    stamps = np.datetime_as_string(timestamps.to_numpy(dtype="datetime64[s]"), unit="s")
+    suppliers = np.array([f"NCC{i}" for i in range(1, 40)], dtype=object)
+    df = pd.DataFrame({
+        "ID": np.arange(1, n_rows + 1).astype(str),
+        "Ngày nhập": timestamps.normalize(),
+        "Name": materials[material_pos[pair]],
+        "Lock": locks[lock_pos[pair]],
+        "Tồn đầu (Bag)": zeros,
+        "Tồn đầu (Weight)": zeros,
+        "Nhập (Bag)": np.where(is_receipt, bags, 0),
+        "Nhập (Weight)": np.where(is_receipt, weight, 0.0),
+        "Sử dụng (Bag)": np.where(is_receipt, 0, bags),
+        "Sử dụng (Weight)": np.where(is_receipt, 0.0, weight),
+        "Tồn cuối (Bag)": zeros,
+        "Tồn cuối (Weight)": zeros,
+        "Trung bình": zeros,
+        "Tuổi lưu kho": zeros,
+        "Code/NCC": suppliers[rng.integers(0, len(suppliers), n_rows)],
+        "Ngày công thức": timestamps.normalize(),
+        "Ngày sản xuất": timestamps.normalize() - pd.to_timedelta(rng.integers(0, 30, n_rows), unit="D"),
+        "Created_At": stamps,
+        "Updated_At": stamps,
+    }, columns=INVENTORY_HEADERS)
+    return rebuild_balances(df, inplace=True) if with_balances else df
+
+def to_upload_frame(movements):
+    """Dạng file Excel upload (tên cột chưa chuẩn hoá), số bao âm là xuất"""
+    bags = movements["Nhập (Bag)"] - movements["Sử dụng (Bag)"]
+    weight = movements["Nhập (Weight)"] - movements["Sử dụng (Weight)"]
+    return pd.DataFrame({
+        # Thời điểm đầy đủ của giao dịch (file chỉ có ngày thì các dòng cùng khoá phân biệt bằng row_seq)
+        "Ngay nhap": pd.to_datetime(movements["Created_At"]),
+        "Ten nguyen lieu": movements["Name"],
+        "Lo": movements["Lock"],
+        "So bao": bags,
+        "Khoiluong": weight,
+        " Code/NCC ": movements["Code/NCC"],
+    })
+
+def to_text_upload_frame(movements):
+    """Như to_upload_frame nhưng mọi ô là chuỗi kiểu Việt Nam (dd/mm/yyyy, 1.234,5) như file nhập tay"""
+    upload = to_upload_frame(movements)
+    weight = upload["Khoiluong"].map("{:,.1f}".format).str.translate(str.maketrans(",.", ".,"))
+    return pd.DataFrame({
+        "Ngày nhập": upload["Ngay nhap"].dt.strftime("%d/%m/%Y"),
+        "Tên nguyên liệu": upload["Ten nguyen lieu"],
+        "Lô": upload["Lo"],
+        "Số bao": upload["So bao"].astype(str),
+        "Khối lượng": weight,
+        "Mã NCC": upload[" Code/NCC "],
+    }).astype(object)
@@ -0,0 +1,8 @@
+# Nhóm tuổi tồn kho (ngày): (từ, đến hoặc None, nhãn)
+AGING_BUCKETS = [
+    (0, 30, "0-30 ngày"),
+    (31, 90, "31-90 ngày"),
+    (91, 180, "91-180 ngày"),
+    (181, 365, "181-365 ngày"),
+    (366, None, "> 365 ngày"),
+]
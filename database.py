@@ -1,30 +1,827 @@
 import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import date, datetime
+
+import numpy as np
 import pandas as pd
 
+from data.aging import AGING_BUCKETS
+from utils.data_cache import data_cache, DB_NAMESPACE
+from utils.instrumentation import instrumented
+
 DB = "inventory.db"
 
+# Pragma áp dụng cho mọi kết nối mới
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-65536",      # ~64 MB page cache
+    "PRAGMA mmap_size=268435456",    # 256 MB memory-mapped I/O
+    "PRAGMA busy_timeout=30000",
+)
+
+# Index cho các cột hay lọc/sắp xếp của bảng inventory (rowid luôn là cột cuối ngầm định)
+INVENTORY_INDEXES = {
+    "idx_inventory_ten_nguyen_lieu": ("ten_nguyen_lieu",),
+    "idx_inventory_lo": ("lo",),
+    "idx_inventory_ngay_nhap": ("ngay_nhap",),
+    "idx_inventory_ten_nguyen_lieu_ngay_nhap": ("ten_nguyen_lieu", "ngay_nhap"),
+    "idx_inventory_lo_ngay_nhap": ("lo", "ngay_nhap"),
+}
+
+# Các cột được phép sắp xếp khi phân trang (đều có index)
+PAGE_SORT_COLUMNS = ["ngay_nhap", "ten_nguyen_lieu", "lo", "id"]
+
+# Số dòng mặc định của một trang
+DEFAULT_PAGE_SIZE = 50
+
+# Các cột tạo khoá ổn định của một dòng tồn kho (dùng những cột có trong dữ liệu)
+# Nhiều giao dịch thật có thể cùng khoá (cùng ngày, nguyên liệu, lô): chúng được phân biệt bằng
+# row_seq, thứ tự xuất hiện trong nhóm cùng khoá của file upload
+KEY_COLUMNS = ["ngay_nhap", "ten_nguyen_lieu", "lo", "code/ncc"]
+
+# Các cột tính lại mỗi lần chuẩn hoá, không tính vào hash nội dung
+DERIVED_COLUMNS = ["age"]
+
+# Các cột nguồn gốc (vd. nguon_sheet do utils.excel_ingest gắn): được lưu nhưng không tính vào hash
+# nội dung, cùng một dòng nằm ở sheet khác vẫn là trùng lặp
+PROVENANCE_COLUMNS = ["nguon_sheet"]
+
+# Các cột nội bộ của bảng inventory
+INTERNAL_COLUMNS = ["id", "row_key", "row_seq", "row_hash"]
+
+# Cột tuỳ chọn của khối upload: vị trí của khối trong file (vd. thứ tự sheet) khi các khối đến không
+# theo thứ tự; chỉ dùng để sắp xếp trong staging, không lưu vào bảng đích
+SOURCE_ORDER_COLUMN = "_source_order"
+
+# Bảng tổng hợp của inventory: tên bảng -> các cột nhóm
+AGGREGATES = {
+    "agg_material": ["ten_nguyen_lieu"],
+    "agg_lock": ["lo"],
+    "agg_day": ["ngay"],
+    "agg_material_lock": ["ten_nguyen_lieu", "lo"],
+}
+
+# Các giá trị được cộng dồn trong mỗi bảng tổng hợp; so_dong_nhap/so_dong_xuat đếm các dòng có
+# số bao dương/âm (tăng/giảm tồn), không phải giao dịch nhập/xuất
+AGGREGATE_MEASURES = ["so_dong", "so_bao", "khoiluong", "so_dong_nhap", "so_dong_xuat"]
+
+# Số điểm tối đa của một chuỗi thời gian gửi lên biểu đồ
+MAX_SERIES_POINTS = 200
+
+# Độ chi tiết của chuỗi thời gian: tên -> (biểu thức nhóm trên agg_day.ngay, số ngày mỗi điểm)
+SERIES_GRAINS = {
+    "ngày": ("ngay", 1),
+    "tuần": ("date(ngay, 'weekday 0', '-6 days')", 7),
+    "tháng": ("strftime('%Y-%m-01', ngay)", 31),
+}
+
+# Mỗi thread (mỗi session Streamlit) dùng lại kết nối của riêng nó
+_local = threading.local()
+
+# Các file DB đã chạy init_db trong process này
+_initialized = set()
+_init_lock = threading.Lock()
+
+def get_connection():
+    """Lấy kết nối SQLite của thread hiện tại (tạo mới và cấu hình pragma nếu chưa có)"""
+    connections = getattr(_local, "connections", None)
+    if connections is None:
+        connections = _local.connections = {}
+    conn = connections.get(DB)
+    if conn is None:
+        # isolation_level=None: tự quản lý transaction bằng BEGIN/COMMIT
+        conn = sqlite3.connect(DB, timeout=30, isolation_level=None, check_same_thread=False)
+        for pragma in PRAGMAS:
+            conn.execute(pragma)
+        connections[DB] = conn
+    return conn
+
+def close_connection():
+    """Đóng kết nối của thread hiện tại tới DB (nếu có)"""
+    conn = getattr(_local, "connections", {}).pop(DB, None)
+    if conn is not None:
+        conn.close()
+
+@contextmanager
+def transaction(conn=None):
+    """Chạy một khối lệnh trong một transaction ghi (BEGIN IMMEDIATE ... COMMIT)"""
+    conn = conn or get_connection()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("COMMIT")
+
+def quote_identifier(name):
+    """Đặt tên bảng/cột trong dấu nháy kép an toàn cho SQL"""
+    return '"' + str(name).replace('"', '""') + '"'
+
+def table_exists(table, conn=None):
+    conn = conn or get_connection()
+    row = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)
+    ).fetchone()
+    return row is not None
+
+def table_columns(table, conn=None):
+    conn = conn or get_connection()
+    return [row[1] for row in conn.execute(f"PRAGMA table_info({quote_identifier(table)})")]
+
+@instrumented()
 def init_db():
-    conn = sqlite3.connect(DB)
-    conn.execute("""
-        CREATE TABLE IF NOT EXISTS inventory (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            ngay_nhap TEXT,
-            ten_nguyen_lieu TEXT,
-            lo TEXT,
-            so_bao REAL,
-            khoiluong REAL,
-            age INTEGER
+    with transaction() as conn:
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS inventory (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                ngay_nhap TEXT,
+                ten_nguyen_lieu TEXT,
+                lo TEXT,
+                so_bao REAL,
+                khoiluong REAL,
+                age INTEGER,
+                row_key INTEGER,
+                row_seq INTEGER NOT NULL DEFAULT 0,
+                row_hash INTEGER
+            )
+        """)
+        # Bảng tạo từ phiên bản cũ chưa có cột khoá
+        existing = set(table_columns("inventory", conn))
+        for col, definition in (("row_key", "INTEGER"), ("row_seq", "INTEGER NOT NULL DEFAULT 0"),
+                                ("row_hash", "INTEGER")):
+            if col not in existing:
+                conn.execute(f"ALTER TABLE inventory ADD COLUMN {col} {definition}")
+        for index_name, columns in INVENTORY_INDEXES.items():
+            conn.execute(
+                f"CREATE INDEX IF NOT EXISTS {quote_identifier(index_name)} "
+                f"ON inventory ({', '.join(quote_identifier(col) for col in columns)})"
+            )
+        # Khoá cũ chỉ gồm row_key: các giao dịch cùng ngày/nguyên liệu/lô bị gộp làm một
+        conn.execute("DROP INDEX IF EXISTS idx_inventory_row_key")
+        conn.execute(
+            "CREATE UNIQUE INDEX IF NOT EXISTS idx_inventory_row_key_seq ON inventory (row_key, row_seq)"
+        )
+        _backfill_row_keys(conn)
+        
+        # Bảng tổng hợp; tạo mới thì tính lại từ dữ liệu đang có
+        missing = [name for name in AGGREGATES if not table_exists(name, conn)]
+        for name, keys in AGGREGATES.items():
+            key_defs = ", ".join(f"{key} TEXT NOT NULL" for key in keys)
+            conn.execute(f"""
+                CREATE TABLE IF NOT EXISTS {name} (
+                    {key_defs},
+                    so_dong INTEGER NOT NULL DEFAULT 0,
+                    so_bao REAL NOT NULL DEFAULT 0,
+                    khoiluong REAL NOT NULL DEFAULT 0,
+                    so_dong_nhap INTEGER NOT NULL DEFAULT 0,
+                    so_dong_xuat INTEGER NOT NULL DEFAULT 0,
+                    PRIMARY KEY ({", ".join(keys)})
+                )
+            """)
+        if missing:
+            rebuild_aggregates(conn)
+        drop_stale_staging(conn)
+
+def ensure_db():
+    """Chạy init_db một lần cho mỗi file DB trong process (gọi khi khởi động trang, không trên đường đọc)"""
+    with _init_lock:
+        if DB not in _initialized:
+            init_db()
+            _initialized.add(DB)
+
+def _sql_type(series):
+    if pd.api.types.is_bool_dtype(series) or pd.api.types.is_integer_dtype(series):
+        return "INTEGER"
+    if pd.api.types.is_numeric_dtype(series):
+        return "REAL"
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return "TIMESTAMP"
+    return "TEXT"
+
+def _sql_values(series):
+    """Giá trị Python của một cột, sẵn sàng cho executemany (NaN/NaT -> None)"""
+    if pd.api.types.is_datetime64_any_dtype(series):
+        series = series.dt.strftime("%Y-%m-%d %H:%M:%S")
+    elif pd.api.types.is_bool_dtype(series):
+        series = series.astype("Int64")
+    elif series.dtype == object and pd.api.types.infer_dtype(series, skipna=True) in ("date", "datetime", "mixed"):
+        series = series.map(lambda v: v.isoformat(sep=" ") if isinstance(v, datetime)
+                            else v.isoformat() if isinstance(v, date) else v)
+    return series.astype(object).where(series.notna(), None).tolist()
+
+def _ensure_table(conn, table, df):
+    """Tạo bảng theo DataFrame nếu chưa có, thêm các cột còn thiếu nếu đã có"""
+    if not table_exists(table, conn):
+        columns = ", ".join(
+            f"{quote_identifier(col)} {_sql_type(df[col])}" for col in df.columns
         )
+        conn.execute(f"CREATE TABLE {quote_identifier(table)} ({columns})")
+        return
+    existing = set(table_columns(table, conn))
+    for col in df.columns:
+        if str(col) not in existing:
+            conn.execute(
+                f"ALTER TABLE {quote_identifier(table)} "
+                f"ADD COLUMN {quote_identifier(col)} {_sql_type(df[col])}"
+            )
+
+# Tiền tố tên bảng staging của các lần ghi nhiều khối
+STAGING_PREFIX = "_staging_"
+
+# Bảng staging cũ hơn thời gian này (giây) bị coi là bỏ lại và được xoá khi init_db
+STAGING_MAX_AGE = 24 * 3600
+
+# Trạng thái của một dòng staging khi upsert
+MERGE_NEW, MERGE_CHANGED, MERGE_UNCHANGED = 1, 2, 0
+
+# Từ số dòng này trở lên, ghi đè bảng sẽ xoá index rồi tạo lại sau khi insert
+BULK_REINDEX_ROWS = 50000
+
+@contextmanager
+def _deferred_indexes(conn, table):
+    """Tạm bỏ các index của bảng trong lúc insert hàng loạt, tạo lại khi xong"""
+    indexes = conn.execute(
+        "SELECT name, sql FROM sqlite_master WHERE type = 'index' AND tbl_name = ? AND sql IS NOT NULL",
+        (table,)
+    ).fetchall()
+    for name, _ in indexes:
+        conn.execute(f"DROP INDEX {quote_identifier(name)}")
+    yield
+    for _, sql in indexes:
+        conn.execute(sql)
+
+@instrumented()
+def insert_dataframe(conn, df, table):
+    """executemany toàn bộ DataFrame vào bảng (bên gọi quản lý transaction)"""
+    if df.empty:
+        return 0
+    columns = ", ".join(quote_identifier(col) for col in df.columns)
+    placeholders = ", ".join("?" for _ in df.columns)
+    rows = zip(*(_sql_values(df[col]) for col in df.columns))
+    conn.executemany(
+        f"INSERT INTO {quote_identifier(table)} ({columns}) VALUES ({placeholders})", rows
+    )
+    return len(df)
+
+@instrumented()
+def save_dataframe(df, table, if_exists="replace"):
+    """Ghi DataFrame vào bảng trong một transaction (giữ nguyên schema và index của bảng)"""
+    with transaction() as conn:
+        _ensure_table(conn, table, df)
+        if if_exists != "replace":
+            saved = insert_dataframe(conn, df, table)
+        else:
+            conn.execute(f"DELETE FROM {quote_identifier(table)}")
+            if len(df) < BULK_REINDEX_ROWS:
+                saved = insert_dataframe(conn, df, table)
+            else:
+                with _deferred_indexes(conn, table):
+                    saved = insert_dataframe(conn, df, table)
+        _refresh_aggregates(conn, table, df, if_exists)
+    data_cache.bump(DB_NAMESPACE.format(table))
+    return saved
+
+def _refresh_aggregates(conn, table, df, if_exists):
+    """Cập nhật bảng tổng hợp sau khi ghi vào inventory"""
+    if table != "inventory" or not table_exists("agg_material", conn):
+        return
+    if if_exists == "replace":
+        rebuild_aggregates(conn)
+    else:
+        apply_aggregate_delta(conn, _aggregate_rows(df))
+
+def _staging_name(table):
+    """Tên bảng staging cho một lần ghi: tiền tố, thời điểm tạo và phần ngẫu nhiên"""
+    return f"{STAGING_PREFIX}{table}_{int(time.time())}_{uuid.uuid4().hex[:8]}"
+
+def drop_stale_staging(conn=None, max_age=STAGING_MAX_AGE):
+    """Xoá các bảng staging bị bỏ lại (process dừng giữa chừng) cũ hơn max_age giây"""
+    conn = conn or get_connection()
+    names = [row[0] for row in conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table' AND name LIKE ?", (STAGING_PREFIX + "%",)
+    )]
+    now = time.time()
+    for name in names:
+        try:
+            created = int(name.rsplit("_", 2)[-2])
+        except ValueError:
+            continue
+        if now - created > max_age:
+            conn.execute(f"DROP TABLE IF EXISTS {quote_identifier(name)}")
+
+def _stage_chunks(chunks, table, prepare=None):
+    """
+    Ghi các khối vào một bảng staging mới, mỗi khối một transaction ngắn
+
+    Khối được đọc/parse (và cập nhật giao diện) ngoài transaction, nên khoá ghi của inventory.db
+    chỉ bị giữ trong lúc insert từng khối. Trả về tên bảng staging (None nếu không có dòng nào).
+    """
+    staging = None
+    try:
+        for df in chunks:
+            if df.empty:
+                continue
+            if prepare is not None:
+                df = prepare(df)
+            if staging is None:
+                staging = _staging_name(table)
+            with transaction() as conn:
+                _ensure_table(conn, staging, df)
+                insert_dataframe(conn, df, staging)
+    except BaseException:
+        _drop_staging(staging)
+        raise
+    return staging
+
+def _drop_staging(staging):
+    if staging is not None:
+        with transaction() as conn:
+            conn.execute(f"DROP TABLE IF EXISTS {quote_identifier(staging)}")
+
+def _ensure_columns_like(conn, table, source, exclude=()):
+    """Tạo bảng theo bảng nguồn nếu chưa có, thêm các cột còn thiếu nếu đã có; trả về các cột nguồn"""
+    columns = [(row[1], row[2]) for row in conn.execute(f"PRAGMA table_info({quote_identifier(source)})")
+               if row[1] not in exclude]
+    if not table_exists(table, conn):
+        definitions = ", ".join(f"{quote_identifier(name)} {sql_type}" for name, sql_type in columns)
+        conn.execute(f"CREATE TABLE {quote_identifier(table)} ({definitions})")
+    else:
+        existing = set(table_columns(table, conn))
+        for name, sql_type in columns:
+            if name not in existing:
+                conn.execute(
+                    f"ALTER TABLE {quote_identifier(table)} ADD COLUMN {quote_identifier(name)} {sql_type}"
+                )
+    return [name for name, _ in columns]
+
+def _apply_aggregate_sql(conn, source_table, sign=1, where=None):
+    """Cộng (sign=1) hoặc trừ (sign=-1) các dòng của một bảng vào bảng tổng hợp bằng GROUP BY"""
+    source = _aggregate_source_sql(conn, source_table, where)
+    for name, keys in AGGREGATES.items():
+        key_list = ", ".join(keys)
+        updates = ", ".join(f"{m} = {m} + excluded.{m}" for m in AGGREGATE_MEASURES)
+        # WHERE true: tránh nhầm ON CONFLICT với JOIN ... ON khi upsert từ SELECT
+        conn.execute(f"""
+            INSERT INTO {name} ({key_list}, {", ".join(AGGREGATE_MEASURES)})
+            SELECT {key_list}, {sign} * COUNT(*), {sign} * SUM(so_bao), {sign} * SUM(khoiluong),
+                   {sign} * SUM(so_bao > 0), {sign} * SUM(so_bao < 0)
+            FROM ({source}) WHERE true GROUP BY {key_list}
+            ON CONFLICT ({key_list}) DO UPDATE SET {updates}
+        """)
+        conn.execute(f"DELETE FROM {name} WHERE so_dong <= 0")
+
+@instrumented()
+def save_dataframe_chunks(chunks, table, if_exists="replace"):
+    """
+    Ghi lần lượt các khối DataFrame vào bảng, tất cả hoặc không có gì
+
+    Các khối được đưa vào bảng staging (commit từng khối), sau đó một transaction ngắn chỉ gồm
+    SQL chuyển toàn bộ staging vào bảng đích.
+    """
+    staging = _stage_chunks(chunks, table)
+    if staging is None:
+        return 0
+    try:
+        with transaction() as conn:
+            columns = ", ".join(quote_identifier(col) for col in _ensure_columns_like(conn, table, staging))
+            total = conn.execute(f"SELECT COUNT(*) FROM {quote_identifier(staging)}").fetchone()[0]
+            move = (f"INSERT INTO {quote_identifier(table)} ({columns}) "
+                    f"SELECT {columns} FROM {quote_identifier(staging)} ORDER BY rowid")
+            track_aggregates = table == "inventory" and table_exists("agg_material", conn)
+            if if_exists == "replace":
+                conn.execute(f"DELETE FROM {quote_identifier(table)}")
+                if total < BULK_REINDEX_ROWS:
+                    conn.execute(move)
+                else:
+                    with _deferred_indexes(conn, table):
+                        conn.execute(move)
+                if track_aggregates:
+                    rebuild_aggregates(conn)
+            else:
+                conn.execute(move)
+                if track_aggregates:
+                    _apply_aggregate_sql(conn, staging)
+            conn.execute(f"DROP TABLE {quote_identifier(staging)}")
+    except BaseException:
+        _drop_staging(staging)
+        raise
+    data_cache.bump(DB_NAMESPACE.format(table))
+    return total
+
+def _hash_columns(df, columns):
+    """Hash int64 của các cột theo từng dòng, chuẩn hoá giá trị giống khi lưu vào SQLite"""
+    normalized = {}
+    for col in sorted(columns):
+        series = df[col]
+        if pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series):
+            # 1 và 1.0 (INTEGER/REAL trong SQLite) cho cùng một hash
+            normalized[col] = series.astype("float64").astype(str)
+        else:
+            normalized[col] = pd.Series(_sql_values(series), index=df.index, dtype=object).astype(str)
+    frame = pd.DataFrame(normalized, index=df.index)
+    return pd.util.hash_pandas_object(frame, index=False).to_numpy().view("int64")
+
+def row_keys(df, key_columns=KEY_COLUMNS):
+    """(row_key, row_hash) cho từng dòng: khoá từ các cột khoá, hash từ toàn bộ nội dung (trừ nguồn gốc)"""
+    keys = [col for col in key_columns if col in df.columns]
+    if not keys:
+        raise ValueError(f"Dữ liệu không có cột khoá nào trong {key_columns}")
+    excluded = DERIVED_COLUMNS + PROVENANCE_COLUMNS + INTERNAL_COLUMNS + [SOURCE_ORDER_COLUMN]
+    content = [col for col in df.columns if col not in excluded]
+    return _hash_columns(df, keys), _hash_columns(df, content)
+
+def _backfill_row_keys(conn, table="inventory"):
+    """Tạo khoá cho các dòng được lưu trước khi có upsert (cùng khoá thì đánh row_seq theo rowid)"""
+    legacy = pd.read_sql(
+        f"SELECT rowid AS _rowid, * FROM {quote_identifier(table)} WHERE row_key IS NULL ORDER BY rowid", conn
+    )
+    if legacy.empty:
+        return 0
+    data = legacy.drop(columns=["_rowid"] + INTERNAL_COLUMNS, errors="ignore").dropna(axis=1, how="all")
+    if not any(col in data.columns for col in KEY_COLUMNS):
+        return 0
+    keys, hashes = row_keys(data)
+    next_seq = dict(conn.execute(
+        f"SELECT row_key, MAX(row_seq) + 1 FROM {quote_identifier(table)} "
+        f"WHERE row_key IS NOT NULL GROUP BY row_key"
+    ).fetchall())
+    updates = []
+    for row_id, key, row_hash in zip(legacy["_rowid"].tolist(), keys.tolist(), hashes.tolist()):
+        seq = next_seq.get(key, 0)
+        next_seq[key] = seq + 1
+        updates.append((key, seq, row_hash, row_id))
+    conn.executemany(
+        f"UPDATE {quote_identifier(table)} SET row_key = ?, row_seq = ?, row_hash = ? WHERE rowid = ?", updates
+    )
+    return len(updates)
+
+def _with_row_keys(df, key_columns=KEY_COLUMNS):
+    keys, hashes = row_keys(df, key_columns)
+    return df.assign(row_key=keys, row_hash=hashes)
+
+def _merge_staging(conn, staging, table):
+    """
+    Upsert các dòng trong bảng staging (đã có row_key, row_hash) vào bảng đích (bên gọi quản lý transaction)
+
+    Chạy trên toàn bộ lần upload nên kết quả không phụ thuộc cách chia khối:
+    - thứ tự trong file là SOURCE_ORDER_COLUMN (nếu có) rồi thứ tự ghi vào staging
+    - dòng trùng cả khoá lẫn toàn bộ nội dung với một dòng trước đó là trùng lặp và bị bỏ
+    - các dòng còn lại cùng khoá được đánh row_seq 0, 1, 2... theo thứ tự trong file
+    - (row_key, row_seq) chưa có thì insert, có mà hash khác thì update, hash giống thì giữ nguyên
+    """
+    stage = quote_identifier(staging)
+    target = quote_identifier(table)
+    ordered = SOURCE_ORDER_COLUMN in table_columns(staging, conn)
+    order = f"{quote_identifier(SOURCE_ORDER_COLUMN)}, rowid" if ordered else "rowid"
+    duplicates = conn.execute(f"""
+        DELETE FROM {stage} WHERE rowid IN (
+            SELECT rid FROM (
+                SELECT rowid AS rid, ROW_NUMBER() OVER (PARTITION BY row_key, row_hash ORDER BY {order}) AS n
+                FROM {stage}
+            ) WHERE n > 1
+        )
+    """).rowcount
+    conn.execute(f"ALTER TABLE {stage} ADD COLUMN row_seq INTEGER NOT NULL DEFAULT 0")
+    columns = _ensure_columns_like(conn, table, staging, exclude=[SOURCE_ORDER_COLUMN])
+    conn.execute(f"ALTER TABLE {stage} ADD COLUMN _status INTEGER NOT NULL DEFAULT {MERGE_NEW}")
+    conn.execute(f"""
+        UPDATE {stage} SET row_seq = s.seq FROM (
+            SELECT rowid AS rid, ROW_NUMBER() OVER (PARTITION BY row_key ORDER BY {order}) - 1 AS seq FROM {stage}
+        ) AS s WHERE {stage}.rowid = s.rid
+    """)
+    conn.execute(f"CREATE INDEX {quote_identifier(staging + '_key')} ON {stage} (row_key, row_seq)")
+
+    if table != "inventory":
+        conn.execute(
+            f"CREATE UNIQUE INDEX IF NOT EXISTS {quote_identifier('idx_' + table + '_row_key_seq')} "
+            f"ON {target} (row_key, row_seq)"
+        )
+    conn.execute(f"""
+        UPDATE {stage} SET _status = CASE WHEN t.row_hash = {stage}.row_hash THEN {MERGE_UNCHANGED}
+                                          ELSE {MERGE_CHANGED} END
+        FROM {target} AS t WHERE t.row_key = {stage}.row_key AND t.row_seq = {stage}.row_seq
     """)
-    conn.close()
 
-def save_dataframe(df, table):
-    conn = sqlite3.connect(DB)
-    df.to_sql(table, conn, if_exists="replace", index=False)
-    conn.close()
+    if table == "inventory" and table_exists("agg_material", conn):
+        # Bảng tổng hợp: trừ giá trị cũ của các dòng sắp update, cộng các dòng mới/đã đổi
+        _apply_aggregate_sql(conn, table, sign=-1, where=(
+            f"(row_key, row_seq) IN (SELECT row_key, row_seq FROM {stage} WHERE _status = {MERGE_CHANGED})"
+        ))
+        _apply_aggregate_sql(conn, staging, where=f"_status != {MERGE_UNCHANGED}")
+
+    column_list = ", ".join(quote_identifier(col) for col in columns)
+    conn.execute(
+        f"INSERT INTO {target} ({column_list}) SELECT {column_list} FROM {stage} "
+        f"WHERE _status = {MERGE_NEW} ORDER BY {order}"
+    )
+    assignments = ", ".join(
+        f"{quote_identifier(col)} = s.{quote_identifier(col)}" for col in columns
+        if col not in ("row_key", "row_seq")
+    )
+    conn.execute(f"""
+        UPDATE {target} SET {assignments} FROM {stage} AS s
+        WHERE s._status = {MERGE_CHANGED} AND {target}.row_key = s.row_key AND {target}.row_seq = s.row_seq
+    """)
+
+    by_status = dict(conn.execute(f"SELECT _status, COUNT(*) FROM {stage} GROUP BY _status").fetchall())
+    return {
+        "inserted": by_status.get(MERGE_NEW, 0),
+        "updated": by_status.get(MERGE_CHANGED, 0),
+        "unchanged": by_status.get(MERGE_UNCHANGED, 0),
+        "duplicates": duplicates,
+    }
+
+@instrumented()
+def upsert_dataframe(conn, df, table="inventory", key_columns=KEY_COLUMNS):
+    """
+    Upsert DataFrame theo khoá dòng (bên gọi quản lý transaction)
+
+    Dòng mới được insert, dòng có nội dung thay đổi được update, dòng giống hệt được giữ nguyên,
+    dòng trùng toàn bộ nội dung trong cùng lô được bỏ qua. Trả về số dòng
+    inserted/updated/unchanged/duplicates.
+    """
+    if df.empty:
+        return {"inserted": 0, "updated": 0, "unchanged": 0, "duplicates": 0}
+    df = _with_row_keys(df, key_columns)
+    staging = _staging_name(table)
+    _ensure_table(conn, staging, df)
+    insert_dataframe(conn, df, staging)
+    counts = _merge_staging(conn, staging, table)
+    conn.execute(f"DROP TABLE {quote_identifier(staging)}")
+    return counts
+
+@instrumented()
+def upsert_dataframe_chunks(chunks, table="inventory", key_columns=KEY_COLUMNS, discard=None):
+    """
+    Upsert lần lượt các khối DataFrame như một lần upload, tất cả hoặc không có gì
+
+    Các khối (đã tính khoá) được đưa vào bảng staging, commit từng khối; phần so khớp và ghi vào
+    bảng đích là một transaction chỉ gồm SQL. discard() (gọi sau khi đã đọc hết các khối) trả về
+    các giá trị SOURCE_ORDER_COLUMN cần bỏ khỏi staging, vd. sheet lỗi giữa chừng. Trả về số dòng
+    theo loại.
+    """
+    staging = _stage_chunks(chunks, table, prepare=lambda df: _with_row_keys(df, key_columns))
+    if staging is None:
+        return {"inserted": 0, "updated": 0, "unchanged": 0, "duplicates": 0}
+    try:
+        with transaction() as conn:
+            if discard is not None:
+                _discard_sources(conn, staging, discard())
+            counts = _merge_staging(conn, staging, table)
+            conn.execute(f"DROP TABLE {quote_identifier(staging)}")
+    except BaseException:
+        _drop_staging(staging)
+        raise
+    data_cache.bump(DB_NAMESPACE.format(table))
+    return counts
+
+def _discard_sources(conn, staging, sources):
+    """Xoá khỏi staging các dòng có SOURCE_ORDER_COLUMN thuộc sources"""
+    sources = list(sources)
+    if not sources or SOURCE_ORDER_COLUMN not in table_columns(staging, conn):
+        return
+    placeholders = ", ".join("?" * len(sources))
+    conn.execute(
+        f"DELETE FROM {quote_identifier(staging)} WHERE {quote_identifier(SOURCE_ORDER_COLUMN)} IN ({placeholders})",
+        sources
+    )
+
+def _aggregate_source_sql(conn, table="inventory", where=None):
+    """Các cột nguồn cho bảng tổng hợp, tính từ bảng inventory (hoặc bảng cùng cột, vd. staging)"""
+    columns = set(table_columns(table, conn))
+    def col(name, default):
+        return quote_identifier(name) if name in columns else default
+    return (
+        f"SELECT COALESCE({col('ten_nguyen_lieu', 'NULL')}, '') AS ten_nguyen_lieu, "
+        f"COALESCE({col('lo', 'NULL')}, '') AS lo, "
+        f"COALESCE(substr({col('ngay_nhap', 'NULL')}, 1, 10), '') AS ngay, "
+        f"COALESCE({col('so_bao', 'NULL')}, 0) AS so_bao, "
+        f"COALESCE({col('khoiluong', 'NULL')}, 0) AS khoiluong "
+        f"FROM {quote_identifier(table)}" + (f" WHERE {where}" if where else "")
+    )
+
+@instrumented()
+def rebuild_aggregates(conn=None):
+    """Tính lại toàn bộ bảng tổng hợp bằng GROUP BY (dùng sau khi ghi đè cả bảng)"""
+    conn = conn or get_connection()
+    if not table_exists("inventory", conn):
+        return
+    source = _aggregate_source_sql(conn)
+    for name, keys in AGGREGATES.items():
+        key_list = ", ".join(keys)
+        conn.execute(f"DELETE FROM {name}")
+        conn.execute(f"""
+            INSERT INTO {name} ({key_list}, {", ".join(AGGREGATE_MEASURES)})
+            SELECT {key_list}, COUNT(*), SUM(so_bao), SUM(khoiluong),
+                   SUM(so_bao > 0), SUM(so_bao < 0)
+            FROM ({source}) GROUP BY {key_list}
+        """)
+
+def _aggregate_rows(df):
+    """Các cột nguồn cho bảng tổng hợp, tính từ DataFrame (cùng quy tắc với _aggregate_source_sql)"""
+    def text(name):
+        if name not in df.columns:
+            return pd.Series("", index=df.index, dtype=object)
+        return pd.Series(_sql_values(df[name]), index=df.index, dtype=object).fillna("").astype(str)
+    def number(name):
+        if name not in df.columns:
+            return pd.Series(0.0, index=df.index)
+        return pd.to_numeric(df[name], errors="coerce").fillna(0.0).astype("float64")
+    so_bao = number("so_bao")
+    return pd.DataFrame({
+        "ten_nguyen_lieu": text("ten_nguyen_lieu"),
+        "lo": text("lo"),
+        "ngay": text("ngay_nhap").str[:10],
+        "so_dong": 1,
+        "so_bao": so_bao,
+        "khoiluong": number("khoiluong"),
+        "so_dong_nhap": (so_bao > 0).astype(int),
+        "so_dong_xuat": (so_bao < 0).astype(int),
+    })
+
+@instrumented()
+def apply_aggregate_delta(conn, rows, sign=1):
+    """Cộng (sign=1) hoặc trừ (sign=-1) các dòng nguồn vào từng bảng tổng hợp"""
+    if rows.empty:
+        return
+    for name, keys in AGGREGATES.items():
+        grouped = rows.groupby(keys, sort=False)[AGGREGATE_MEASURES].sum().reset_index()
+        grouped[AGGREGATE_MEASURES] = grouped[AGGREGATE_MEASURES] * sign
+        columns = keys + AGGREGATE_MEASURES
+        updates = ", ".join(f"{m} = {m} + excluded.{m}" for m in AGGREGATE_MEASURES)
+        conn.executemany(
+            f"INSERT INTO {name} ({', '.join(columns)}) VALUES ({', '.join('?' for _ in columns)}) "
+            f"ON CONFLICT ({', '.join(keys)}) DO UPDATE SET {updates}",
+            grouped[columns].itertuples(index=False, name=None)
+        )
+        # Nhóm không còn dòng nào thì xoá khỏi bảng tổng hợp
+        conn.execute(f"DELETE FROM {name} WHERE so_dong <= 0")
+
+@instrumented()
+def load_aggregate(name, order_by="so_bao DESC"):
+    """Đọc một bảng tổng hợp (name phải nằm trong AGGREGATES)"""
+    if name not in AGGREGATES:
+        raise ValueError(f"Bảng tổng hợp không hợp lệ: {name}")
+    if order_by not in {f"{col} {direction}" for col in AGGREGATES[name] + AGGREGATE_MEASURES
+                        for direction in ("ASC", "DESC")}:
+        raise ValueError(f"Thứ tự sắp xếp không hợp lệ: {order_by}")
+    return query(f"SELECT * FROM {name} ORDER BY {order_by}")
+
+@instrumented()
+def load_totals():
+    """Tổng toàn kho đọc từ bảng tổng hợp (không quét bảng inventory)"""
+    totals = query(f"SELECT {', '.join(f'COALESCE(SUM({m}), 0) AS {m}' for m in AGGREGATE_MEASURES)} FROM agg_material")
+    return totals.iloc[0].to_dict()
+
+@instrumented()
+def load_day_summary(day=None):
+    """Số dòng tăng/giảm tồn (số bao dương/âm) của một ngày (mặc định hôm nay) từ agg_day"""
+    day = pd.Timestamp(day or date.today()).strftime("%Y-%m-%d")
+    row = get_connection().execute(
+        "SELECT COALESCE(SUM(so_dong), 0), COALESCE(SUM(so_dong_nhap), 0), COALESCE(SUM(so_dong_xuat), 0) "
+        "FROM agg_day WHERE ngay = ?", (day,)
+    ).fetchone()
+    return dict(zip(["so_dong", "so_dong_nhap", "so_dong_xuat"], row))
+
+@instrumented()
+def load_aging(as_of=None):
+    """Số bao và khối lượng theo nhóm tuổi (tính trên agg_day, không quét bảng inventory)"""
+    as_of = pd.Timestamp(as_of or date.today()).strftime("%Y-%m-%d")
+    cases = " ".join(
+        f"WHEN tuoi <= {high} THEN {i}" if high is not None else f"ELSE {i}"
+        for i, (_, high, _) in enumerate(AGING_BUCKETS)
+    )
+    grouped = query(f"""
+        SELECT CASE {cases} END AS nhom, SUM(so_bao) AS so_bao, SUM(khoiluong) AS khoiluong
+        FROM (SELECT CAST(julianday(?) - julianday(ngay) AS INTEGER) AS tuoi, so_bao, khoiluong
+              FROM agg_day WHERE ngay != '' AND ngay <= ?)
+        GROUP BY nhom
+    """, (as_of, as_of)).set_index("nhom")
+    aging = pd.DataFrame({"nhom_tuoi": [label for _, _, label in AGING_BUCKETS]})
+    for col in ("so_bao", "khoiluong"):
+        aging[col] = grouped[col].reindex(range(len(AGING_BUCKETS))).fillna(0).to_numpy()
+    return aging
+
+@instrumented()
+def load_daily_series(max_points=MAX_SERIES_POINTS):
+    """
+    Chuỗi thời gian nhập/xuất từ agg_day, gộp trong SQL theo ngày/tuần/tháng
+    
+    Độ chi tiết nhỏ nhất sao cho không quá max_points điểm (tháng là mức thô nhất).
+    """
+    first, last = get_connection().execute(
+        "SELECT MIN(ngay), MAX(ngay) FROM agg_day WHERE ngay != ''"
+    ).fetchone()
+    if first is None:
+        return pd.DataFrame(columns=["ky", "so_bao", "khoiluong", "so_dong_nhap", "so_dong_xuat"])
+    span = (pd.Timestamp(last) - pd.Timestamp(first)).days + 1
+    bucket = next((expr for expr, days in SERIES_GRAINS.values() if span / days <= max_points),
+                  SERIES_GRAINS["tháng"][0])
+    return query(f"""
+        SELECT {bucket} AS ky, SUM(so_bao) AS so_bao, SUM(khoiluong) AS khoiluong,
+               SUM(so_dong_nhap) AS so_dong_nhap, SUM(so_dong_xuat) AS so_dong_xuat
+        FROM agg_day WHERE ngay != ''
+        GROUP BY ky ORDER BY ky
+    """)
+
+def _page_filters(filters):
+    """
+    Điều kiện WHERE từ bộ lọc phân trang
+    
+    filters: ten_nguyen_lieu, lo (giá trị hoặc danh sách), ngay_tu, ngay_den (date, tính cả ngày cuối)
+    """
+    clauses, params = [], []
+    for col in ("ten_nguyen_lieu", "lo"):
+        value = (filters or {}).get(col)
+        if value is None or (isinstance(value, (list, tuple)) and not value):
+            continue
+        values = list(value) if isinstance(value, (list, tuple)) else [value]
+        clauses.append(f"{col} IN ({', '.join('?' for _ in values)})")
+        params.extend(values)
+    # ngay_nhap lưu dạng text 'YYYY-MM-DD HH:MM:SS' nên so sánh chuỗi đúng thứ tự thời gian
+    if (filters or {}).get("ngay_tu"):
+        clauses.append("ngay_nhap >= ?")
+        params.append(pd.Timestamp(filters["ngay_tu"]).strftime("%Y-%m-%d"))
+    if (filters or {}).get("ngay_den"):
+        clauses.append("ngay_nhap < ?")
+        params.append((pd.Timestamp(filters["ngay_den"]) + pd.Timedelta(days=1)).strftime("%Y-%m-%d"))
+    return clauses, params
+
+def _keyset_clause(sort_by, descending, after):
+    """Điều kiện lấy các dòng sau con trỏ (giá trị sort, rowid); NULL đứng đầu khi ASC, cuối khi DESC"""
+    value, rowid = after
+    op = "<" if descending else ">"
+    if sort_by == "id":
+        return f"rowid {op} ?", [rowid]
+    if value is None:
+        if descending:
+            return f"({sort_by} IS NULL AND rowid < ?)", [rowid]
+        return f"(({sort_by} IS NULL AND rowid > ?) OR {sort_by} IS NOT NULL)", [rowid]
+    clause = f"({sort_by} {op} ? OR ({sort_by} = ? AND rowid {op} ?)"
+    clause += f" OR {sort_by} IS NULL)" if descending else ")"
+    return clause, [value, value, rowid]
+
+@instrumented()
+def load_page(table="inventory", filters=None, sort_by="ngay_nhap", descending=True,
+              page_size=DEFAULT_PAGE_SIZE, after=None):
+    """
+    Một trang dữ liệu theo keyset (không dùng OFFSET)
+    
+    after là con trỏ (giá trị sort, rowid) của dòng cuối trang trước, None cho trang đầu.
+    Trả về (DataFrame của trang, con trỏ của trang sau hoặc None nếu hết dữ liệu).
+    """
+    if sort_by not in PAGE_SORT_COLUMNS:
+        raise ValueError(f"Cột sắp xếp không hợp lệ: {sort_by}")
+    if not table_exists(table):
+        raise ValueError(f"Bảng không tồn tại: {table}")
+    clauses, params = _page_filters(filters)
+    if after is not None:
+        clause, cursor_params = _keyset_clause(sort_by, descending, after)
+        clauses.append(clause)
+        params.extend(cursor_params)
+    
+    direction = "DESC" if descending else "ASC"
+    order = f"rowid {direction}" if sort_by == "id" else f"{sort_by} {direction}, rowid {direction}"
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    # Lấy thêm một dòng để biết còn trang sau hay không
+    page = query(
+        f"SELECT rowid AS _cursor_rowid, * FROM {quote_identifier(table)} {where} "
+        f"ORDER BY {order} LIMIT ?",
+        params + [page_size + 1]
+    )
+    next_cursor = None
+    if len(page) > page_size:
+        page = page.iloc[:page_size]
+        last = page.iloc[-1]
+        sort_value = None if sort_by == "id" or pd.isna(last[sort_by]) else last[sort_by]
+        next_cursor = (sort_value, int(last["_cursor_rowid"]))
+    hidden = ["_cursor_rowid"] + [col for col in INTERNAL_COLUMNS if col != "id"]
+    return page.drop(columns=[col for col in hidden if col in page.columns]), next_cursor
+
+@instrumented()
+def count_rows(table="inventory", filters=None):
+    """Số dòng khớp bộ lọc phân trang"""
+    if not table_exists(table):
+        raise ValueError(f"Bảng không tồn tại: {table}")
+    clauses, params = _page_filters(filters)
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    return int(get_connection().execute(
+        f"SELECT COUNT(*) FROM {quote_identifier(table)} {where}", params
+    ).fetchone()[0])
+
+@instrumented()
+def query(sql, params=()):
+    """Chạy câu SELECT có tham số và trả về DataFrame"""
+    return pd.read_sql(sql, get_connection(), params=params)
 
+@instrumented()
 def load_table(table):
-    conn = sqlite3.connect(DB)
-    df = pd.read_sql(f"SELECT * FROM {table}", conn)
-    conn.close()
-    return df
+    if not table_exists(table):
+        raise ValueError(f"Bảng không tồn tại: {table}")
+    return query(f"SELECT * FROM {quote_identifier(table)}")
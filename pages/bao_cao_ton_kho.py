@@ -1,18 +1,46 @@
 import streamlit as st
-import pandas as pd
-import plotly.express as px
-from database import get_connection
+from database import ensure_db, load_aggregate, load_totals
+from utils.data_cache import data_cache, DB_NAMESPACE
+from utils.instrumentation import metrics, render_metrics_panel
 
-st.title("📊 Báo cáo tồn kho")
+# Các bảng tổng hợp được cache theo phiên bản của bảng inventory
+REPORT_NAMESPACE = DB_NAMESPACE.format("inventory")
+
+def cached_aggregate(name):
+    return data_cache.get_or_load(REPORT_NAMESPACE, name, lambda: load_aggregate(name))
 
-conn = get_connection()
+# Bắt đầu đo lần rerun này (bảng thời gian ở sidebar)
+metrics.start_rerun()
+
+st.title("📊 Báo cáo tồn kho")
 
 try:
-    df = pd.read_sql("SELECT * FROM stock", conn)
+    # Đọc từ các bảng tổng hợp, không quét bảng inventory
+    ensure_db()
+    df = cached_aggregate("agg_material")
 
-    st.subheader("Biểu đồ tồn kho")
-    fig = px.bar(df, x="ten_hang", y="so_luong")
-    st.plotly_chart(fig, use_container_width=True)
+    if df.empty:
+        st.warning("Chưa có dữ liệu để tạo báo cáo.")
+    else:
+        totals = data_cache.get_or_load(REPORT_NAMESPACE, "totals", load_totals)
+        col1, col2, col3 = st.columns(3)
+        col1.metric("Tổng số dòng", f"{int(totals['so_dong']):,}")
+        col2.metric("Tổng số bao", f"{totals['so_bao']:,.0f}")
+        col3.metric("Tổng khối lượng", f"{totals['khoiluong']:,.1f}")
+
+        st.subheader("Biểu đồ tồn kho")
+        # plotly chỉ được tải khi có dữ liệu để vẽ
+        import plotly.express as px
+        fig = px.bar(df, x="ten_nguyen_lieu", y="so_bao")
+        st.plotly_chart(fig, use_container_width=True)
+
+        st.subheader("Tồn kho theo vị trí")
+        st.dataframe(cached_aggregate("agg_lock"), use_container_width=True)
+
+        st.subheader("Tồn kho theo nguyên liệu và vị trí")
+        st.dataframe(cached_aggregate("agg_material_lock"), use_container_width=True)
 
 except Exception:
     st.warning("Chưa có dữ liệu để tạo báo cáo.")
+
+render_metrics_panel()
@@ -1,5 +1,58 @@
 import streamlit as st
+from database import ensure_db
+from utils.kpis import load_kpis
+from utils.instrumentation import metrics, render_metrics_panel
+
+# Bắt đầu đo lần rerun này (bảng thời gian ở sidebar)
+metrics.start_rerun()
 
 st.title("🏠 Dashboard – Tổng quan tồn kho")
 
-st.info("Module đang phát triển. Chưa có dữ liệu hiển thị.")
+try:
+    ensure_db()
+    kpis = load_kpis()
+except Exception as e:
+    st.error(f"❌ Không đọc được dữ liệu tổng hợp: {e}")
+    st.stop()
+
+totals = kpis["totals"]
+if not totals["so_dong"]:
+    st.info("Chưa có dữ liệu. Hãy upload file tồn kho trước.")
+    st.stop()
+
+col1, col2, col3, col4 = st.columns(4)
+col1.metric("Tổng tồn kho (bao)", f"{totals['so_bao']:,.0f}", f"{totals['khoiluong']:,.1f} kg")
+col2.metric("Nguyên liệu còn tồn", f"{kpis['material_count']:,}")
+col3.metric("Vị trí kho đang dùng", f"{kpis['active_locks']}/{kpis['lock_count']}")
+col4.metric(
+    "Giao dịch hôm nay", f"{kpis['today']['so_dong']:,}",
+    f"{kpis['today']['so_dong_nhap']} nhập / {kpis['today']['so_dong_xuat']} xuất", delta_color="off"
+)
+
+# plotly chỉ được tải khi có dữ liệu để vẽ
+import plotly.express as px
+
+col_left, col_right = st.columns(2)
+with col_left:
+    st.subheader("Tồn kho theo nguyên liệu")
+    st.plotly_chart(px.bar(kpis["by_material"].head(30), x="ten_nguyen_lieu", y="so_bao"),
+                    use_container_width=True)
+with col_right:
+    st.subheader("Tồn kho theo vị trí")
+    st.plotly_chart(px.bar(kpis["by_lock"], x="lo", y="so_bao"), use_container_width=True)
+
+col_left, col_right = st.columns(2)
+with col_left:
+    st.subheader("Phân bố tuổi tồn kho")
+    st.plotly_chart(px.bar(kpis["aging"], x="nhom_tuoi", y="so_bao"), use_container_width=True)
+with col_right:
+    # Số dòng có số bao dương/âm trong dữ liệu đã upload
+    st.subheader("Số dòng tăng/giảm tồn theo thời gian")
+    series = kpis["series"].rename(columns={"so_dong_nhap": "Dòng tăng tồn", "so_dong_xuat": "Dòng giảm tồn"})
+    st.plotly_chart(px.line(series, x="ky", y=["Dòng tăng tồn", "Dòng giảm tồn"]),
+                    use_container_width=True)
+
+st.subheader("Tồn kho theo nguyên liệu và vị trí")
+st.dataframe(kpis["by_material_lock"], use_container_width=True, hide_index=True)
+
+render_metrics_panel()
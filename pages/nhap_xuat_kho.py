@@ -1,11 +1,16 @@
 import streamlit as st
-import pandas as pd
-from database import get_connection
+from database import ensure_db
+from utils.paginated_table import sqlite_table
+from utils.instrumentation import metrics, render_metrics_panel
+
+# Bắt đầu đo lần rerun này (bảng thời gian ở sidebar)
+metrics.start_rerun()
 
 st.title("📦 Nhập – Xuất kho")
 
-conn = get_connection()
-df = pd.read_sql("SELECT * FROM stock", conn)
+ensure_db()
 
 st.subheader("Dữ liệu trong kho")
-st.dataframe(df)
+sqlite_table("nhap_xuat_kho")
+
+render_metrics_panel()
@@ -3,39 +3,58 @@ import pandas as pd
 from datetime import datetime
 import sys
 import os
+import threading
 
 # Thêm path để import utils
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
 
-from data.materials import MATERIALS
-from data.locks import LOCKS
 from utils.calculations import calculate_inventory_fields, calculate_totals
-from utils.google_sheets import google_sheets_manager
+from utils.google_sheets import google_sheets_manager, INVENTORY_HEADERS, parse_date_columns, rows_to_dataframe
+from utils.outbox import transaction_outbox
+from utils.ledger import rebuild_balances, InventoryLedger
+from utils.material_index import MaterialIndex
+from utils.instrumentation import metrics, render_metrics_panel
+from utils.paginated_table import dataframe_table
+from utils.fifo import fifo_lots, aging_summary
+from utils.checkpoints import balance_checkpoints
+from utils.resolver import material_resolver, lock_resolver
+from utils.snapshot import snapshot_store
+from utils.data_cache import data_cache, SHEETS_NAMESPACE
+from utils.export import export_button, iter_dataframe_chunks
+
+# Dữ liệu tồn kho dùng chung cho mọi session, hết hạn khi worksheet Inventory được ghi
+INVENTORY_NAMESPACE = SHEETS_NAMESPACE.format("Inventory")
+
+# Tên snapshot local của dữ liệu tồn kho đã tính
+SNAPSHOT_NAME = "inventory"
 
 def main():
     st.set_page_config(page_title="Quản lý Kho - Checkstock", layout="wide")
     
     st.title("📦 QUẢN LÝ KHO NGUYÊN LIỆU")
+    metrics.start_rerun()
     
     # Khởi tạo Google Sheets connection
     if not google_sheets_manager.initialize_client():
         st.warning("⚠️ Chưa kết nối được với Google Sheets. Dữ liệu sẽ được lưu tạm.")
     
-    # Khởi tạo session state
-    if 'inventory_data' not in st.session_state:
-        # Thử load từ Google Sheets
-        df = google_sheets_manager.get_all_data()
-        if not df.empty:
-            st.session_state.inventory_data = calculate_inventory_fields(df)
+    # Luồng nền đẩy các transaction còn trong outbox lên Google Sheets
+    transaction_outbox.start()
+    # Luồng nền dựng checkpoint số dư cho "Tồn kho tại ngày"
+    balance_checkpoints.start()
+    
+    # Lần đầu của session: thông báo khi đã có dữ liệu từ Google Sheets
+    if 'inventory_loaded' not in st.session_state:
+        if not get_inventory()['data'].empty:
             st.success("✅ Đã tải dữ liệu từ Google Sheets")
-        else:
-            st.session_state.inventory_data = pd.DataFrame()
+        st.session_state.inventory_loaded = True
     
     # Sidebar cho các chức năng
     st.sidebar.header("🎯 Chức năng")
     function_option = st.sidebar.radio(
         "Chọn chức năng:",
-        ["Thêm giao dịch mới", "Xem tồn kho", "Báo cáo theo nguyên liệu", "Cài đặt Google Sheets"]
+        ["Thêm giao dịch mới", "Xem tồn kho", "Báo cáo theo nguyên liệu", "Tuổi tồn kho (FIFO)",
+         "Tồn kho tại ngày", "Cài đặt Google Sheets"]
     )
     
     if function_option == "Thêm giao dịch mới":
@@ -44,9 +63,126 @@ def main():
         show_inventory_table()
     elif function_option == "Báo cáo theo nguyên liệu":
         show_material_report()
+    elif function_option == "Tuổi tồn kho (FIFO)":
+        show_fifo_aging()
+    elif function_option == "Tồn kho tại ngày":
+        show_stock_as_of()
     else:
         show_google_sheets_settings()
 
+    render_metrics_panel()
+
+def build_inventory(df, balanced=False):
+    """Gộp giao dịch còn chờ trong outbox, tính số dư và các trường tự động, dựng sổ cái và chỉ mục"""
+    pending = transaction_outbox.pending_rows()
+    if pending:
+        pending_df = parse_date_columns(rows_to_dataframe(INVENTORY_HEADERS, pending))
+        if not df.empty and 'ID' in df.columns:
+            pending_df = pending_df[~pending_df['ID'].isin(df['ID'])]
+        if not pending_df.empty:
+            df = pending_df if df.empty else pd.concat([df, pending_df], ignore_index=True)
+            balanced = False
+    
+    if df.empty:
+        return {'data': pd.DataFrame(), 'ledger': InventoryLedger(), 'materials': MaterialIndex(), 'revision': 0}
+    
+    # Dữ liệu từ snapshot đã có số dư, chỉ tính lại các trường phụ thuộc ngày hiện tại
+    calculated = calculate_inventory_fields(df if balanced else rebuild_balances(df))
+    return {
+        'data': calculated,
+        'ledger': InventoryLedger.from_dataframe(calculated),
+        'materials': MaterialIndex.from_dataframe(calculated),
+        'revision': 0,
+    }
+
+def reconcile_inventory(snapshot):
+    """Đối chiếu dữ liệu khôi phục từ snapshot với Google Sheets; watermark đổi thì tải lại cache"""
+    _, header, ids, updated = snapshot
+    google_sheets_manager.sync_data()
+    watermark = google_sheets_manager.sync_watermark()
+    if watermark is not None and (list(watermark[1]), list(watermark[2]), list(watermark[3])) != (
+        list(header), list(ids), list(updated)
+    ):
+        data_cache.bump(INVENTORY_NAMESPACE)
+
+def load_inventory():
+    """Tải dữ liệu tồn kho: từ snapshot local khi process mới khởi động, ngược lại từ Google Sheets"""
+    if google_sheets_manager.sync_watermark() is None:
+        snapshot = snapshot_store.read(SNAPSHOT_NAME)
+        if snapshot is not None:
+            # Hiển thị ngay từ snapshot, đồng bộ tăng dần với Google Sheets ở nền
+            google_sheets_manager.restore_sync_state(*snapshot)
+            threading.Thread(
+                target=reconcile_inventory, args=(snapshot,), name="snapshot-reconcile", daemon=True
+            ).start()
+            return build_inventory(snapshot[0], balanced=True)
+    
+    # Tăng dần nếu process đã có bản sao local
+    df = google_sheets_manager.sync_data()
+    inventory = build_inventory(df)
+    
+    # Ghi lại snapshot phần đã đồng bộ (không gồm giao dịch còn chờ trong outbox)
+    watermark = google_sheets_manager.sync_watermark()
+    if watermark is not None and watermark[0] is df and not df.empty:
+        _, header, ids, updated = watermark
+        snapshot_store.write_async(SNAPSHOT_NAME, inventory['data'].iloc[:len(ids)], header, ids, updated)
+    return inventory
+
+def append_to_inventory(inventory, new_record, transaction):
+    """Bản tồn kho mới sau khi thêm một giao dịch (revision tăng: các kết quả tính từ bản cũ hết hạn)"""
+    # Sổ cái được sao chép: bên đang đọc bản cũ không thấy số dư của bản mới
+    ledger = inventory['ledger'].copy()
+    ledger.apply(transaction)
+    if inventory['data'].empty:
+        data = new_record
+    else:
+        data = pd.concat([inventory['data'], new_record], ignore_index=True)
+    return {
+        'data': data,
+        'ledger': ledger,
+        'materials': inventory['materials'].append(new_record),
+        'revision': inventory.get('revision', 0) + 1,
+    }
+
+def record_transaction(transaction):
+    """
+    Lưu một giao dịch mới, trả về dòng đã ghi vào log (theo INVENTORY_HEADERS, đã có ID)
+
+    Tồn đầu được lấy từ sổ cái, ghi log và cập nhật cache trong cùng đoạn khoá của entry tồn kho:
+    hai lần lưu cùng (Name, Lock) chạy lần lượt nên nhận Tồn đầu nối tiếp nhau.
+    """
+    saved = []
+    
+    def apply(inventory):
+        opening_bags, opening_weight = inventory['ledger'].opening_balance(transaction['Name'], transaction['Lock'])
+        opened = dict(transaction, **{"Tồn đầu (Bag)": opening_bags, "Tồn đầu (Weight)": opening_weight})
+        calculated_transaction = calculate_inventory_fields(pd.DataFrame([opened])).iloc[0].to_dict()
+        
+        # Ghi vào log giao dịch (cấp ID tăng dần), luồng nền sẽ đẩy lên Google Sheets
+        row_data = transaction_outbox.enqueue(calculated_transaction)
+        saved.append(row_data)
+        
+        # Cập nhật cache dùng chung từ bản ghi local, không tải lại toàn bộ sheet
+        new_record = calculate_inventory_fields(parse_date_columns(rows_to_dataframe(INVENTORY_HEADERS, [row_data])))
+        return append_to_inventory(inventory, new_record, calculated_transaction)
+    
+    data_cache.update(INVENTORY_NAMESPACE, "inventory", apply, loader=load_inventory)
+    if not saved:
+        # Không giữ được bản tồn kho trong cache (vượt trần bộ nhớ hoặc bị bump khi đang tải)
+        apply(get_inventory())
+    return saved[0]
+
+def get_fifo_lots(inventory, as_of):
+    """Các lô FIFO còn tồn tại ngày as_of, cache theo phiên bản dữ liệu và revision của bản tồn kho"""
+    return data_cache.get_or_load(
+        INVENTORY_NAMESPACE, ("fifo", as_of.isoformat(), inventory.get('revision', 0)),
+        lambda: fifo_lots(inventory['data'], as_of)
+    )
+
+def get_inventory():
+    """Dữ liệu tồn kho và sổ cái dùng chung cho mọi session (không copy, không được sửa trực tiếp)"""
+    return data_cache.get_or_load(INVENTORY_NAMESPACE, "inventory", load_inventory)
+
 def show_transaction_form():
     """Hiển thị form thêm giao dịch mới"""
     st.header("➕ Thêm giao dịch mới")
@@ -56,8 +192,8 @@ def show_transaction_form():
         
         with col1:
             input_date = st.date_input("Ngày nhập *", value=datetime.now())
-            material_name = st.selectbox("Tên nguyên liệu *", [""] + MATERIALS)
-            lock_location = st.selectbox("Vị trí kho *", [""] + LOCKS)
+            material_name = st.selectbox("Tên nguyên liệu *", [""] + material_resolver.names)
+            lock_location = st.selectbox("Vị trí kho *", [""] + lock_resolver.names)
             import_bags = st.number_input("Nhập (Bag)", min_value=0, value=0)
             import_weight = st.number_input("Nhập (Weight)", min_value=0.0, value=0.0, step=0.1)
         
@@ -74,13 +210,11 @@ def show_transaction_form():
             if not material_name or not lock_location:
                 st.error("Vui lòng nhập Tên nguyên liệu và Vị trí kho!")
             else:
-                # Tạo transaction mới
+                # Tạo transaction mới (Tồn đầu lấy từ sổ cái khi lưu)
                 new_transaction = {
                     "Ngày nhập": input_date,
                     "Name": material_name,
                     "Lock": lock_location,
-                    "Tồn đầu (Bag)": 0,
-                    "Tồn đầu (Weight)": 0,
                     "Nhập (Bag)": import_bags,
                     "Nhập (Weight)": import_weight,
                     "Sử dụng (Bag)": usage_bags,
@@ -90,24 +224,14 @@ def show_transaction_form():
                     "Ngày sản xuất": production_date
                 }
                 
-                # Tính toán các trường tự động
-                from utils.calculations import calculate_inventory_fields
-                temp_df = pd.DataFrame([new_transaction])
-                calculated_df = calculate_inventory_fields(temp_df)
-                calculated_transaction = calculated_df.iloc[0].to_dict()
-                
-                # Lưu vào Google Sheets
-                success = google_sheets_manager.append_transaction(calculated_transaction)
+                try:
+                    with st.spinner("Đang lưu giao dịch..."):
+                        record_transaction(new_transaction)
+                except Exception as e:
+                    st.error(f"❌ Lỗi khi lưu giao dịch: {e}")
+                    return
                 
-                if success:
-                    # Cập nhật session state
-                    updated_df = google_sheets_manager.get_all_data()
-                    if not updated_df.empty:
-                        st.session_state.inventory_data = calculate_inventory_fields(updated_df)
-                    
-                    st.success("✅ Giao dịch đã được lưu thành công vào Google Sheets!")
-                else:
-                    st.error("❌ Lỗi khi lưu vào Google Sheets!")
+                st.success("✅ Giao dịch đã được lưu! Đang đồng bộ lên Google Sheets ở nền.")
 
 def show_inventory_table():
     """Hiển thị bảng tồn kho"""
@@ -117,26 +241,22 @@ def show_inventory_table():
     col1, col2 = st.columns([3, 1])
     with col2:
         if st.button("🔄 Refresh từ Google Sheets"):
-            df = google_sheets_manager.get_all_data()
-            if not df.empty:
-                st.session_state.inventory_data = calculate_inventory_fields(df)
+            data_cache.bump(INVENTORY_NAMESPACE)
+            if not get_inventory()['data'].empty:
                 st.success("✅ Đã cập nhật dữ liệu từ Google Sheets")
             else:
                 st.error("❌ Không thể tải dữ liệu từ Google Sheets")
     
-    if st.session_state.inventory_data.empty:
+    inventory_data = get_inventory()['data']
+    if inventory_data.empty:
         st.info("📝 Chưa có dữ liệu tồn kho. Hãy thêm giao dịch mới.")
         return
     
-    # Hiển thị bảng dữ liệu
-    st.dataframe(
-        st.session_state.inventory_data,
-        use_container_width=True,
-        height=400
-    )
+    # Hiển thị bảng dữ liệu (chỉ gửi trang đang xem)
+    dataframe_table("inventory_table", inventory_data)
     
     # Tính tổng
-    totals = calculate_totals(st.session_state.inventory_data)
+    totals = calculate_totals(inventory_data)
     
     # Hiển thị tổng
     st.subheader("📈 Tổng hợp")
@@ -150,26 +270,33 @@ def show_inventory_table():
         st.metric("Tổng sử dụng (Bag)", totals.get('Sử dụng (Bag)', 0))
     with col4:
         st.metric("Tổng tồn cuối (Bag)", totals.get('Tồn cuối (Bag)', 0))
+    
+    # Xuất toàn bộ bảng (kể cả cột tính toán và dòng tổng) theo từng khối
+    st.subheader("📥 Xuất báo cáo")
+    export_button(
+        "inventory_table", lambda: iter_dataframe_chunks(inventory_data), "ton_kho",
+        signature=(data_cache.version(INVENTORY_NAMESPACE), len(inventory_data))
+    )
 
 def show_material_report():
     """Hiển thị báo cáo theo nguyên liệu"""
     st.header("📋 Báo cáo theo nguyên liệu")
     
-    if st.session_state.inventory_data.empty:
+    inventory = get_inventory()
+    inventory_data = inventory['data']
+    if inventory_data.empty:
         st.info("📝 Chưa có dữ liệu để tạo báo cáo.")
         return
     
-    # Chọn nguyên liệu
+    # Chọn nguyên liệu (danh sách và tổng lấy từ chỉ mục, không quét bảng)
+    materials = inventory['materials']
     selected_material = st.selectbox(
         "Chọn nguyên liệu:",
-        [""] + list(st.session_state.inventory_data['Name'].unique())
+        [""] + materials.names()
     )
     
     if selected_material:
-        # Lọc dữ liệu theo nguyên liệu
-        material_data = st.session_state.inventory_data[
-            st.session_state.inventory_data['Name'] == selected_material
-        ]
+        material_data = materials.rows(inventory_data, selected_material)
         
         if not material_data.empty:
             st.subheader(f"📦 Báo cáo cho: {selected_material}")
@@ -178,7 +305,7 @@ def show_material_report():
             st.dataframe(material_data, use_container_width=True)
             
             # Tính tổng cho nguyên liệu này
-            material_totals = calculate_totals(material_data)
+            material_totals = materials.material_totals(selected_material)
             
             # Hiển thị tổng
             st.subheader(f"📊 Tổng hợp - {selected_material}")
@@ -195,9 +322,85 @@ def show_material_report():
             with col3:
                 st.metric("Tổng tồn cuối (Bag)", material_totals.get('Tồn cuối (Bag)', 0))
                 st.metric("Tổng tồn cuối (Weight)", f"{material_totals.get('Tồn cuối (Weight)', 0):.1f}")
+            
+            st.subheader("📥 Xuất báo cáo")
+            export_button(
+                "material_report", lambda: iter_dataframe_chunks(material_data), "bao_cao_nguyen_lieu",
+                signature=(data_cache.version(INVENTORY_NAMESPACE), selected_material, len(material_data))
+            )
         else:
             st.warning(f"Không có dữ liệu cho nguyên liệu: {selected_material}")
 
+def show_fifo_aging():
+    """Hiển thị các lô còn tồn và phân bố tuổi theo FIFO"""
+    st.header("⏳ Tuổi tồn kho theo FIFO")
+    
+    inventory = get_inventory()
+    if inventory['data'].empty:
+        st.info("📝 Chưa có dữ liệu tồn kho.")
+        return
+    
+    as_of = st.date_input("Tính đến ngày", value=datetime.now())
+    lots = get_fifo_lots(inventory, as_of)
+    if lots.empty:
+        st.info("Không còn lô nào tồn tại ngày đã chọn.")
+        return
+    
+    summary = aging_summary(lots)
+    cols = st.columns(len(summary))
+    for col, row in zip(cols, summary.itertuples(index=False)):
+        col.metric(row[0], f"{row[1]:,.0f} bao", f"{row[2]:,.1f} kg", delta_color="off")
+    
+    st.subheader("Các lô còn tồn")
+    dataframe_table("fifo_lots", lots.sort_values('Tuổi lưu kho', ascending=False))
+
+def show_stock_as_of():
+    """Tồn kho theo nguyên liệu và lô tại một ngày trong quá khứ, tính từ checkpoint của log giao dịch"""
+    st.header("📅 Tồn kho tại ngày (giao dịch nhập qua ứng dụng)")
+    try:
+        coverage = balance_checkpoints.coverage()
+    except Exception as e:
+        st.error(f"❌ Lỗi khi đọc log giao dịch: {e}")
+        return
+    if coverage is None:
+        st.info("Log giao dịch chưa có giao dịch nào được nhập qua ứng dụng.")
+        return
+    first, last, count = coverage
+    st.warning(
+        f"⚠️ Tính từ {count:,} giao dịch nhập qua ứng dụng (ngày {first} – {last}). Tồn có từ trước lấy theo "
+        "Tồn đầu của giao dịch đầu tiên mỗi nguyên liệu/lô và chỉ tính từ ngày đó; nguyên liệu/lô chưa có "
+        "giao dịch nào qua ứng dụng không có trong bảng. Xem tồn kho đầy đủ ở mục \"Xem tồn kho\"."
+    )
+    
+    col1, col2, col3 = st.columns(3)
+    as_of = col1.date_input("Tính đến hết ngày", value=datetime.now(), key="as_of_date")
+    material = col2.selectbox("Nguyên liệu", ["Tất cả"] + material_resolver.names, key="as_of_material")
+    lock = col3.selectbox("Lô", ["Tất cả"] + lock_resolver.names, key="as_of_lock")
+    
+    try:
+        balances = balance_checkpoints.balances_as_of(
+            as_of,
+            material=None if material == "Tất cả" else material,
+            lock=None if lock == "Tất cả" else lock,
+        )
+    except Exception as e:
+        st.error(f"❌ Lỗi khi tính tồn kho: {e}")
+        return
+    
+    if balances.empty:
+        st.info("Không có giao dịch nào tới ngày đã chọn.")
+        return
+    
+    col1, col2 = st.columns(2)
+    col1.metric("Tổng số bao", f"{balances['so_bao'].sum():,.0f}")
+    col2.metric("Tổng khối lượng (kg)", f"{balances['khoiluong'].sum():,.1f}")
+    checkpoint = balances.attrs.get("checkpoint")
+    if checkpoint:
+        st.caption(f"Bắt đầu từ checkpoint cuối kỳ {checkpoint}, cộng các giao dịch sau đó.")
+    dataframe_table("stock_as_of", balances.rename(columns={
+        "ten_nguyen_lieu": "Nguyên liệu", "lo": "Lô", "so_bao": "Số bao", "khoiluong": "Khối lượng (kg)"
+    }))
+
 def show_google_sheets_settings():
     """Hiển thị cài đặt Google Sheets"""
     st.header("⚙️ Cài đặt Google Sheets")
@@ -223,6 +426,33 @@ def show_google_sheets_settings():
                 st.warning("⚠️ Kết nối thành công nhưng chưa có dữ liệu.")
     else:
         st.error("❌ Chưa kết nối được với Google Sheets")
+    
+    # Trạng thái outbox
+    pending = transaction_outbox.pending_count()
+    if pending:
+        st.warning(f"⏳ Còn {pending} giao dịch đang chờ đồng bộ lên Google Sheets.")
+        if transaction_outbox.last_error:
+            st.caption(f"Lỗi gần nhất: {transaction_outbox.last_error}")
+    else:
+        st.success("✅ Tất cả giao dịch đã được đồng bộ.")
+    log_stats = transaction_outbox.log.stats
+    st.caption(
+        f"Log giao dịch: {log_stats['writes']} lệnh ghi trong {log_stats['commits']} lần commit"
+    )
+    
+    # Quota Google Sheets
+    scheduler_stats = google_sheets_manager.scheduler.stats
+    st.caption(
+        f"Sheets API: {scheduler_stats['requests']} request, {scheduler_stats['retries']} retry, "
+        f"{scheduler_stats['coalesced']} lần đọc được gộp, chờ quota {scheduler_stats['throttled_seconds']:.1f}s"
+    )
+    
+    # Trạng thái cache dùng chung
+    stats = data_cache.stats()
+    st.caption(
+        f"Cache: {stats['entries']} mục, {stats['bytes'] / 1024 / 1024:.1f}/"
+        f"{stats['max_bytes'] / 1024 / 1024:.0f} MB, {stats['hits']} hit / {stats['misses']} miss"
+    )
 
 if __name__ == "__main__":
     main()
@@ -1,7 +1,34 @@
 import streamlit as st
 import pandas as pd
-from utils import clean_inventory_dataframe
-from database import init_db, save_dataframe
+from utils.excel_ingest import ExcelChunkReader, clean_chunk, failed_sources, ingest_workbook, list_sheet_names
+from utils.resolver import unmatched_names
+from utils.schema import inventory_schema
+from utils.instrumentation import metrics, render_metrics_panel, timed_iter
+from database import init_db, upsert_dataframe_chunks
+
+# Bắt đầu đo lần rerun này (bảng thời gian ở sidebar)
+metrics.start_rerun()
+
+def show_counts(counts):
+    st.success("🎉 Đã chuẩn hoá & lưu vào database thành công!")
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("Dòng mới", f"{counts['inserted']:,}")
+    col2.metric("Dòng cập nhật", f"{counts['updated']:,}")
+    col3.metric("Không đổi", f"{counts['unchanged']:,}")
+    col4.metric("Trùng lặp bỏ qua", f"{counts['duplicates']:,}")
+
+def show_unmatched(entries):
+    """Tên không khớp tên chuẩn được giữ nguyên; gợi ý tên gần giống để người dùng tự sửa"""
+    unique = {(e["column"], e["value"]): e for e in entries}
+    if not unique:
+        return
+    st.warning(f"⚠️ {len(unique)} tên không khớp danh mục chuẩn, đã giữ nguyên cách viết trong file.")
+    st.dataframe(
+        pd.DataFrame(list(unique.values())).rename(columns={
+            "column": "Cột", "value": "Giá trị trong file", "suggestion": "Gợi ý tên chuẩn",
+        }),
+        use_container_width=True, hide_index=True
+    )
 
 st.title("📤 Upload & Chuẩn hoá dữ liệu")
 
@@ -11,26 +38,85 @@ uploaded = st.file_uploader("Chọn file Excel", type=["xlsx", "xls"])
 
 if uploaded:
     try:
-        # Load workbook
-        xls = pd.ExcelFile(uploaded)
-        sheet_name = st.selectbox("Chọn sheet", xls.sheet_names)
+        # Chỉ đọc danh sách sheet, chưa parse dữ liệu
+        sheet_names = list_sheet_names(uploaded)
+        mode = st.radio("Chế độ", ["Một sheet", "Tất cả sheet"], horizontal=True)
+
+        if mode == "Một sheet":
+            sheet_name = st.selectbox("Chọn sheet", sheet_names)
+
+            if st.button("Đọc và chuẩn hoá"):
+                reader = ExcelChunkReader(uploaded, sheet_name)
+                # Dấu phân cách/định dạng ngày nhận diện riêng cho file này
+                schema = inventory_schema.for_file()
+                progress = st.progress(0.0, text="Đang đọc dữ liệu...")
+                unmatched = []
+
+                def cleaned_chunks():
+                    """Đọc từng khối, chuẩn hoá và đưa thẳng vào database"""
+                    first_chunk = True
+                    for df_raw in timed_iter("excel.read_chunk", reader):
+                        # Tên nguyên liệu/vị trí đưa về tên chuẩn, gắn tên sheet nguồn
+                        df_clean = clean_chunk(df_raw, sheet_name, schema)
+                        unmatched.extend(unmatched_names(df_clean))
 
-        if st.button("Đọc và chuẩn hoá"):
-            df_raw = pd.read_excel(uploaded, sheet_name=sheet_name)
+                        # Preview lấy từ khối đầu tiên
+                        if first_chunk:
+                            st.subheader("Dữ liệu thô – Raw (20 dòng)")
+                            st.dataframe(df_raw.head(20))
 
-            st.subheader("Dữ liệu thô – Raw (20 dòng)")
-            st.dataframe(df_raw.head(20))
+                            st.subheader("Dữ liệu đã chuẩn hoá – Clean (20 dòng)")
+                            st.dataframe(df_clean.head(20))
+                            first_chunk = False
 
-            df_clean = clean_inventory_dataframe(df_raw)
+                        ratio = reader.progress()
+                        progress.progress(ratio or 0.0, text=f"Đã đọc {reader.rows_read:,} dòng")
+                        yield df_clean
 
-            st.subheader("Dữ liệu đã chuẩn hoá – Clean (20 dòng)")
-            st.dataframe(df_clean.head(20))
+                # Lưu database: chỉ thêm dòng mới, cập nhật dòng thay đổi
+                init_db()
+                counts = upsert_dataframe_chunks(cleaned_chunks(), "inventory")
+                progress.progress(1.0, text=f"Đã đọc {reader.rows_read:,} dòng")
+                show_counts(counts)
+                show_unmatched(unmatched)
 
-            # Lưu database
-            init_db()
-            save_dataframe(df_clean, "inventory")
+        else:
+            selected = st.multiselect("Các sheet", sheet_names, default=sheet_names)
 
-            st.success("🎉 Đã chuẩn hoá & lưu vào database thành công!")
+            if selected and st.button("Đọc tất cả và chuẩn hoá"):
+                # Mỗi process đọc và chuẩn hoá một sheet, từng khối được lưu ngay khi đọc xong
+                chunks, report = ingest_workbook(uploaded, selected)
+                unmatched = []
+
+                def checked_chunks():
+                    for df_clean in chunks:
+                        unmatched.extend(unmatched_names(df_clean))
+                        yield df_clean
+
+                with st.spinner(f"Đang đọc song song {len(selected)} sheet..."):
+                    init_db()
+                    # Khối của sheet lỗi giữa chừng bị bỏ khỏi staging trước khi ghi
+                    counts = upsert_dataframe_chunks(checked_chunks(), "inventory",
+                                                     discard=lambda: failed_sources(report))
+
+                st.subheader("Kết quả từng sheet")
+                st.dataframe(
+                    pd.DataFrame(report).rename(columns={
+                        "sheet": "Sheet", "rows_read": "Dòng đọc", "rows": "Dòng hợp lệ",
+                        "seconds": "Thời gian (s)", "error": "Lỗi",
+                    }),
+                    use_container_width=True, hide_index=True
+                )
+                failed = [entry["sheet"] for entry in report if entry["error"]]
+                if failed:
+                    st.warning(f"⚠️ Bỏ qua {len(failed)} sheet lỗi: {', '.join(failed)}")
+
+                # Các sheet hợp lệ được lưu trong một lần upsert
+                if any(entry["rows"] for entry in report):
+                    show_counts(counts)
+                    show_unmatched(unmatched)
 
     except Exception as e:
         st.error(f"Lỗi khi đọc file: {e}")
+
+render_metrics_panel()
@@ -99,16 +99,27 @@ def show_home_page():
     st.markdown("---")
     st.subheader("📈 Thống kê nhanh")
     
+    try:
+        # pandas/SQLite chỉ được tải khi trang chủ cần số liệu
+        from database import ensure_db
+        from utils.kpis import load_kpis
+        ensure_db()
+        kpis = load_kpis()
+    except Exception:
+        st.info("Chưa có dữ liệu tồn kho.")
+        return
+    
     col1, col2, col3, col4 = st.columns(4)
     
     with col1:
-        st.metric("Tổng nguyên liệu", "50+", "3 mới")
+        st.metric("Tổng nguyên liệu", f"{kpis['material_count']:,}")
     with col2:
-        st.metric("Vị trí kho", "60+", "2 mới")
+        st.metric("Vị trí kho", f"{kpis['active_locks']}/{kpis['lock_count']}")
     with col3:
-        st.metric("Giao dịch hôm nay", "12", "5 nhập")
+        st.metric("Giao dịch hôm nay", f"{kpis['today']['so_dong']:,}",
+                  f"{kpis['today']['so_dong_nhap']} nhập", delta_color="off")
     with col4:
-        st.metric("Tổng tồn kho", "1,250", "45 bags")
+        st.metric("Tổng tồn kho", f"{kpis['totals']['so_bao']:,.0f}", "bags", delta_color="off")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,38 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database
+from utils.fake_sheets import attach_fake_backend
+from utils.google_sheets import GoogleSheetsManager
+from utils.sheets_scheduler import SheetsScheduler
+from utils.transaction_log import TransactionLog
+
+
+@pytest.fixture
+def sheets_manager():
+    """GoogleSheetsManager chạy trên worksheet giả lập, không giới hạn quota và không retry"""
+    manager = GoogleSheetsManager()
+    attach_fake_backend(manager, "test")
+    manager.scheduler = SheetsScheduler(read_quota=10 ** 9, write_quota=10 ** 9, max_retries=0)
+    return manager
+
+
+@pytest.fixture
+def transaction_log(tmp_path):
+    log = TransactionLog(db_path=str(tmp_path / "transactions.db"))
+    yield log
+    log.close()
+
+
+@pytest.fixture
+def inventory_db(tmp_path, monkeypatch):
+    """inventory.db tạm cho mỗi test"""
+    monkeypatch.setattr(database, "DB", str(tmp_path / "inventory.db"))
+    database.close_connection()
+    database.init_db()
+    yield database
+    database.close_connection()
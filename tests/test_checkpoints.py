@@ -0,0 +1,100 @@
+import json
+import sqlite3
+
+from utils.checkpoints import BalanceCheckpoints
+from utils.google_sheets import build_transaction_row
+from utils.transaction_log import TransactionLog
+
+
+def _append(log, day, bags, name="Bột mì", opening=0):
+    log.append_rows([build_transaction_row({
+        "Ngày nhập": day, "Name": name, "Lock": "B07", "Tồn đầu (Bag)": opening,
+        "Nhập (Bag)": max(bags, 0), "Sử dụng (Bag)": max(-bags, 0),
+    })])
+
+
+def _bags(balances):
+    return dict(zip(balances["ten_nguyen_lieu"], balances["so_bao"]))
+
+
+def _checkpoint_rows(log):
+    with log.snapshot() as conn:
+        return conn.execute("SELECT COUNT(*) FROM balance_checkpoints").fetchone()[0]
+
+
+def test_query_does_not_build(transaction_log):
+    checkpoints = BalanceCheckpoints(log=transaction_log)
+    _append(transaction_log, "2024-01-05", 10)
+    _append(transaction_log, "2024-02-05", -4)
+
+    assert _bags(checkpoints.balances_as_of("2024-03-01")) == {"Bột mì": 6}
+    assert _checkpoint_rows(transaction_log) == 0
+
+
+def test_backdated_entry_after_build(transaction_log):
+    checkpoints = BalanceCheckpoints(log=transaction_log)
+    _append(transaction_log, "2024-01-05", 10)
+    _append(transaction_log, "2024-02-05", 5)
+    assert checkpoints.build(until="2024-03-15") == 2
+    assert checkpoints.balances_as_of("2024-03-01").attrs["checkpoint"] == "2024-02-29"
+
+    # Giao dịch nhập lùi ngày: checkpoint tháng 1, 2 bị bỏ qua cho tới lần dựng sau
+    _append(transaction_log, "2024-01-20", -3)
+    balances = checkpoints.balances_as_of("2024-03-01")
+    assert _bags(balances) == {"Bột mì": 12}
+    assert balances.attrs["checkpoint"] is None
+    assert _bags(checkpoints.balances_as_of("2024-01-10")) == {"Bột mì": 10}
+
+    checkpoints.build(until="2024-03-15")
+    assert _bags(checkpoints.balances_as_of("2024-03-01")) == {"Bột mì": 12}
+    assert checkpoints.balances_as_of("2024-03-01").attrs["checkpoint"] == "2024-02-29"
+
+
+def test_coverage(transaction_log):
+    checkpoints = BalanceCheckpoints(log=transaction_log)
+    assert checkpoints.coverage() is None
+    _append(transaction_log, "2024-02-05", 1)
+    _append(transaction_log, "2024-01-05", 1)
+    assert checkpoints.coverage() == ("2024-01-05", "2024-02-05", 2)
+
+
+def test_opening_stock_before_the_log(transaction_log):
+    checkpoints = BalanceCheckpoints(log=transaction_log)
+    # Đã có 100 bao từ trước khi có log; giao dịch sau mang Tồn đầu là số dư lúc nhập
+    _append(transaction_log, "2024-01-05", -10, opening=100)
+    _append(transaction_log, "2024-02-05", 5, opening=90)
+    _append(transaction_log, "2024-02-06", 3, name="Đường", opening=7)
+
+    assert _bags(checkpoints.balances_as_of("2024-01-31")) == {"Bột mì": 90}
+    assert checkpoints.build(until="2024-03-15") == 2
+    balances = checkpoints.balances_as_of("2024-03-01")
+    assert balances.attrs["checkpoint"] == "2024-02-29"
+    assert _bags(balances) == {"Bột mì": 95, "Đường": 10}
+
+
+def test_old_log_gets_opening_stock_from_payload(tmp_path):
+    path = str(tmp_path / "transactions.db")
+    conn = sqlite3.connect(path)
+    conn.execute("""
+        CREATE TABLE transactions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, worksheet TEXT NOT NULL, ngay_nhap TEXT, ten_nguyen_lieu TEXT,
+            lo TEXT, nhap_bao REAL NOT NULL DEFAULT 0, nhap_kg REAL NOT NULL DEFAULT 0,
+            su_dung_bao REAL NOT NULL DEFAULT 0, su_dung_kg REAL NOT NULL DEFAULT 0,
+            payload TEXT NOT NULL, created_at TEXT NOT NULL
+        )
+    """)
+    for opening, used in ((40, 4), (36, 6)):
+        row = build_transaction_row({"Ngày nhập": "2024-01-05", "Name": "Bột mì", "Lock": "B07",
+                                     "Tồn đầu (Bag)": opening, "Sử dụng (Bag)": used})
+        conn.execute(
+            "INSERT INTO transactions (worksheet, ngay_nhap, ten_nguyen_lieu, lo, su_dung_bao, payload, created_at) "
+            "VALUES ('Inventory', '2024-01-05', 'Bột mì', 'B07', ?, ?, '')", (used, json.dumps(row[1:]))
+        )
+    conn.commit()
+    conn.close()
+
+    log = TransactionLog(db_path=path)
+    try:
+        assert _bags(BalanceCheckpoints(log=log).balances_as_of("2024-01-31")) == {"Bột mì": 30}
+    finally:
+        log.close()
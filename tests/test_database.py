@@ -0,0 +1,171 @@
+import sqlite3
+import threading
+
+import pandas as pd
+import pytest
+
+import database
+
+
+def _rows(n, start=0, material="Bột mì"):
+    return pd.DataFrame({
+        "ngay_nhap": pd.date_range("2024-01-01", periods=n, freq="D") + pd.Timedelta(days=start),
+        "ten_nguyen_lieu": material,
+        "lo": "B07",
+        "so_bao": [float(i + 1) for i in range(n)],
+        "khoiluong": [25.0 * (i + 1) for i in range(n)],
+    })
+
+
+def _staging_tables():
+    return database.query(
+        "SELECT name FROM sqlite_master WHERE type = 'table' AND name LIKE '_staging_%'"
+    )["name"].tolist()
+
+
+def test_save_dataframe_chunks_replace_and_append(inventory_db):
+    assert database.save_dataframe_chunks([_rows(3), _rows(2, start=10)], "inventory") == 5
+    assert database.save_dataframe_chunks(iter([_rows(4, start=20)]), "inventory", if_exists="append") == 4
+
+    assert database.count_rows() == 9
+    totals = database.load_totals()
+    assert totals["so_bao"] == pytest.approx(6 + 3 + 10)
+    assert database.load_aggregate("agg_material")["so_dong"].tolist() == [9]
+    assert _staging_tables() == []
+
+
+def test_chunks_are_parsed_outside_the_write_lock(inventory_db):
+    """Trong lúc bên gọi chuẩn bị khối tiếp theo, kết nối khác vẫn ghi được"""
+    other_done = []
+
+    def other_writer():
+        conn = sqlite3.connect(database.DB, timeout=0.5)
+        conn.execute("CREATE TABLE IF NOT EXISTS other (x)")
+        conn.execute("INSERT INTO other VALUES (1)")
+        conn.commit()
+        conn.close()
+        other_done.append(True)
+
+    def chunks():
+        yield _rows(2)
+        thread = threading.Thread(target=other_writer)
+        thread.start()
+        thread.join()
+        yield _rows(2, start=5)
+
+    database.save_dataframe_chunks(chunks(), "inventory")
+
+    assert other_done == [True]
+    assert database.count_rows() == 4
+
+
+def test_failed_upload_leaves_table_unchanged(inventory_db):
+    database.save_dataframe_chunks([_rows(3)], "inventory")
+
+    def chunks():
+        yield _rows(2, start=10)
+        raise ValueError("file hỏng")
+
+    with pytest.raises(ValueError):
+        database.upsert_dataframe_chunks(chunks())
+
+    assert database.count_rows() == 3
+    assert _staging_tables() == []
+
+
+def test_stale_staging_tables_are_dropped(inventory_db):
+    conn = database.get_connection()
+    conn.execute('CREATE TABLE "_staging_inventory_1_deadbeef" (x)')
+    database.init_db()
+    assert _staging_tables() == []
+
+
+def _same_day_movements():
+    """Hai giao dịch thật cùng ngày, cùng nguyên liệu, cùng lô"""
+    return pd.DataFrame({
+        "ngay_nhap": pd.to_datetime(["2024-01-05", "2024-01-05"]),
+        "ten_nguyen_lieu": ["Bột mì", "Bột mì"],
+        "lo": ["B07", "B07"],
+        "so_bao": [10.0, -4.0],
+        "khoiluong": [250.0, -100.0],
+    })
+
+
+def _aggregates_match_table():
+    expected = database.query(
+        "SELECT ten_nguyen_lieu, COUNT(*) AS so_dong, SUM(so_bao) AS so_bao FROM inventory GROUP BY ten_nguyen_lieu"
+    ).set_index("ten_nguyen_lieu")
+    actual = database.load_aggregate("agg_material").set_index("ten_nguyen_lieu")[["so_dong", "so_bao"]]
+    pd.testing.assert_frame_equal(actual.sort_index(), expected.sort_index(), check_dtype=False)
+
+
+@pytest.mark.parametrize("split", [False, True])
+def test_upsert_keeps_same_day_movements(inventory_db, split):
+    df = _same_day_movements()
+    chunks = [df.iloc[:1], df.iloc[1:]] if split else [df]
+
+    counts = database.upsert_dataframe_chunks(chunks)
+
+    assert counts == {"inserted": 2, "updated": 0, "unchanged": 0, "duplicates": 0}
+    assert database.load_totals()["so_bao"] == 6
+    _aggregates_match_table()
+
+
+def test_upsert_reupload_is_unchanged_regardless_of_chunking(inventory_db):
+    df = _same_day_movements()
+    database.upsert_dataframe_chunks([df])
+
+    assert database.upsert_dataframe_chunks([df.iloc[:1], df.iloc[1:]]) == {
+        "inserted": 0, "updated": 0, "unchanged": 2, "duplicates": 0
+    }
+    assert database.count_rows() == 2
+
+
+def test_upsert_drops_only_full_content_duplicates(inventory_db):
+    df = _same_day_movements()
+    df = pd.concat([df, df.iloc[:1]], ignore_index=True)
+
+    counts = database.upsert_dataframe_chunks([df.iloc[:2], df.iloc[2:]])
+
+    assert counts["duplicates"] == 1
+    assert counts["inserted"] == 2
+
+
+def test_upsert_updates_changed_rows_and_aggregates(inventory_db):
+    df = _same_day_movements()
+    database.upsert_dataframe_chunks([df])
+    changed = df.assign(so_bao=[12.0, -4.0])
+    extra = _rows(1, start=30, material="Đường")
+
+    counts = database.upsert_dataframe_chunks([changed, extra])
+
+    assert counts == {"inserted": 1, "updated": 1, "unchanged": 1, "duplicates": 0}
+    assert database.load_totals()["so_bao"] == 12 - 4 + 1
+    _aggregates_match_table()
+
+
+def test_init_db_migrates_single_column_row_key(tmp_path, monkeypatch):
+    """DB cũ: row_key UNIQUE một cột, chưa có row_seq; hai dòng cùng khoá đều được giữ"""
+    path = str(tmp_path / "legacy.db")
+    conn = sqlite3.connect(path)
+    conn.execute("""
+        CREATE TABLE inventory (id INTEGER PRIMARY KEY AUTOINCREMENT, ngay_nhap TEXT, ten_nguyen_lieu TEXT,
+                                lo TEXT, so_bao REAL, khoiluong REAL, age INTEGER, row_key INTEGER, row_hash INTEGER)
+    """)
+    conn.execute("CREATE UNIQUE INDEX idx_inventory_row_key ON inventory (row_key)")
+    conn.executemany(
+        "INSERT INTO inventory (ngay_nhap, ten_nguyen_lieu, lo, so_bao, khoiluong) VALUES (?, ?, ?, ?, ?)",
+        [("2024-01-05 00:00:00", "Bột mì", "B07", 10, 250), ("2024-01-05 00:00:00", "Bột mì", "B07", -4, -100)]
+    )
+    conn.commit()
+    conn.close()
+    monkeypatch.setattr(database, "DB", path)
+    database.close_connection()
+    try:
+        database.init_db()
+        assert database.query("SELECT row_seq FROM inventory ORDER BY id")["row_seq"].tolist() == [0, 1]
+
+        counts = database.upsert_dataframe_chunks([_same_day_movements()])
+        assert counts["unchanged"] == 2
+    finally:
+        database.close_connection()
@@ -0,0 +1,91 @@
+import io
+from datetime import datetime
+
+import openpyxl
+import pytest
+
+from database import SOURCE_ORDER_COLUMN
+from utils import excel_ingest
+from utils.excel_ingest import PROBE_ROWS, failed_sources, ingest_workbook
+
+HEADER = ["Ngày nhập", "Tên nguyên liệu", "Lô", "Số bao", "Khối lượng"]
+
+
+def _workbook(sheets):
+    workbook = openpyxl.Workbook()
+    workbook.remove(workbook.active)
+    for name, rows in sheets.items():
+        worksheet = workbook.create_sheet(name)
+        worksheet.append(HEADER)
+        for row in rows:
+            worksheet.append(row)
+    buffer = io.BytesIO()
+    workbook.save(buffer)
+    buffer.seek(0)
+    buffer.name = "upload.xlsx"
+    return buffer
+
+
+def _rows(n, material="BDG"):
+    return [[datetime(2024, 1, 1 + i % 28), material, "B07", i + 1, 25.0 * (i + 1)] for i in range(n)]
+
+
+@pytest.mark.parametrize("max_workers", [1, 2])
+def test_sheets_are_streamed_in_chunks(max_workers):
+    file = _workbook({"A": _rows(PROBE_ROWS + 500), "B": _rows(10, "LS")})
+    chunks, report = ingest_workbook(file, max_workers=max_workers)
+    sizes = {}
+    for df in chunks:
+        order = int(df[SOURCE_ORDER_COLUMN].iloc[0])
+        sizes.setdefault(order, []).append(len(df))
+    assert sizes == {0: [PROBE_ROWS, 500], 1: [10]}
+    assert [(entry["sheet"], entry["rows"], entry["error"]) for entry in report] == [
+        ("A", PROBE_ROWS + 500, None), ("B", 10, None),
+    ]
+
+
+def test_missing_sheet_is_reported_and_skipped():
+    file = _workbook({"A": _rows(3)})
+    chunks, report = ingest_workbook(file, ["A", "Khong co"], max_workers=1)
+    assert sum(len(df) for df in chunks) == 3
+    assert report[0]["error"] is None
+    assert "KeyError" in report[1]["error"]
+
+
+def test_same_row_in_two_sheets_is_a_duplicate(inventory_db):
+    rows = _rows(5)
+    chunks, _ = ingest_workbook(_workbook({"A": rows, "B": rows[:2]}), max_workers=1)
+    counts = inventory_db.upsert_dataframe_chunks(chunks, "inventory")
+    assert counts["inserted"] == 5
+    assert counts["duplicates"] == 2
+
+    # Upload lại với thứ tự sheet đảo ngược: nguon_sheet khác nhưng nội dung không đổi
+    chunks, _ = ingest_workbook(_workbook({"B": rows[:2], "A": rows}), max_workers=1)
+    counts = inventory_db.upsert_dataframe_chunks(chunks, "inventory")
+    assert counts["unchanged"] == 5
+    assert counts["inserted"] == counts["updated"] == 0
+    conn = inventory_db.get_connection()
+    assert SOURCE_ORDER_COLUMN not in inventory_db.table_columns("inventory", conn)
+
+
+def test_sheet_failing_midway_is_dropped_and_others_saved(inventory_db, monkeypatch):
+    clean_chunk = excel_ingest.clean_chunk
+    calls = []
+
+    def flaky(df_raw, sheet_name, schema=None):
+        calls.append(sheet_name)
+        # Khối thứ hai của sheet A lỗi sau khi khối đầu đã được gửi đi
+        if sheet_name == "A" and calls.count("A") == 2:
+            raise ValueError("ô hỏng")
+        return clean_chunk(df_raw, sheet_name, schema)
+
+    monkeypatch.setattr(excel_ingest, "clean_chunk", flaky)
+    file = _workbook({"A": _rows(PROBE_ROWS + 500), "B": _rows(10, "LS")})
+    chunks, report = ingest_workbook(file, max_workers=1)
+    counts = inventory_db.upsert_dataframe_chunks(chunks, "inventory", discard=lambda: failed_sources(report))
+
+    assert [(entry["sheet"], entry["rows"]) for entry in report] == [("A", 0), ("B", 10)]
+    assert "ô hỏng" in report[0]["error"]
+    assert counts["inserted"] == 10
+    conn = inventory_db.get_connection()
+    assert conn.execute("SELECT DISTINCT nguon_sheet FROM inventory").fetchall() == [("B",)]
@@ -0,0 +1,41 @@
+import gc
+import os
+import time
+
+import pandas as pd
+
+from utils import export
+from utils.export import ExportFile, cleanup_exports, export_file
+
+
+def _chunks():
+    yield pd.DataFrame({"Name": ["Bột mì", "Đường"], "so_bao": [10, 5]})
+
+
+def test_export_file_is_removed_with_its_owner(tmp_path):
+    path, rows = export_file(_chunks(), "CSV", directory=str(tmp_path))
+    assert rows == 2
+    exported = ExportFile(path, rows, "CSV")
+    assert exported.exists()
+
+    # Session kết thúc: state (và ExportFile) bị thu hồi
+    del exported
+    gc.collect()
+    assert not os.path.exists(path)
+
+
+def test_cleanup_removes_only_old_exports(tmp_path, monkeypatch):
+    monkeypatch.setattr(export, "EXPORT_DIR", str(tmp_path / "exports"))
+    monkeypatch.setattr(export.tempfile, "gettempdir", lambda: str(tmp_path / "tmp"))
+    os.makedirs(tmp_path / "tmp")
+    old_dir = tmp_path / "exports" / "a"
+    os.makedirs(old_dir)
+
+    old, _ = export_file(_chunks(), "CSV", directory=str(old_dir))
+    fresh, _ = export_file(_chunks(), "Excel", directory=str(tmp_path / "tmp"))
+    past = time.time() - 2 * export.EXPORT_MAX_AGE
+    os.utime(old, (past, past))
+
+    assert cleanup_exports() == 1
+    assert not old_dir.exists()
+    assert os.path.exists(fresh)
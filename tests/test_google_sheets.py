@@ -0,0 +1,90 @@
+import pandas as pd
+
+from utils.google_sheets import INVENTORY_HEADERS
+
+
+def _frame(n_rows):
+    return pd.DataFrame({
+        "ID": [str(i) for i in range(n_rows)],
+        "Ngày nhập": pd.date_range("2024-01-01", periods=n_rows, freq="h"),
+        "Name": ["Bột mì"] * n_rows,
+        "Nhập (Bag)": range(n_rows),
+        "Updated_At": ["2024-01-01T00:00:00"] * n_rows,
+    })
+
+
+def test_new_worksheet_gets_headers(sheets_manager):
+    worksheet = sheets_manager.get_worksheet("Inventory")
+    assert worksheet.get_all_values() == [INVENTORY_HEADERS]
+    # Handle được giữ lại: lần sau không tra metadata
+    assert sheets_manager.get_worksheet("Inventory") is worksheet
+
+
+def test_update_inventory_data_writes_chunks(sheets_manager):
+    worksheet = sheets_manager.get_worksheet("Inventory")
+    worksheet.calls.clear()
+    df = _frame(2500)
+
+    assert sheets_manager.update_inventory_data(df, chunk_size=1000)
+
+    # Header + 2500 dòng = 2501 dòng -> 3 request update, không append từng dòng; không clear
+    assert worksheet.calls == {"resize": 2, "update": 3}
+    assert (worksheet.row_count, worksheet.col_count) == (2501, 5)
+    values = worksheet.get_all_values()
+    assert values[0] == list(df.columns)
+    assert values[1] == ["0", "2024-01-01", "Bột mì", 0, "2024-01-01T00:00:00"]
+    assert values[-1][0] == "2499"
+
+
+def test_update_inventory_data_shrinks_grid(sheets_manager):
+    worksheet = sheets_manager.get_worksheet("Inventory")
+    sheets_manager.update_inventory_data(_frame(10))
+    sheets_manager.update_inventory_data(_frame(3))
+
+    # Lưới thu lại đúng bằng dữ liệu mới, không còn dòng cũ phía dưới
+    assert worksheet.row_count == 4
+    assert len(worksheet.get_all_values()) == 4
+
+
+def test_update_inventory_data_failure_keeps_old_rows(sheets_manager, monkeypatch):
+    worksheet = sheets_manager.get_worksheet("Inventory")
+    sheets_manager.update_inventory_data(_frame(10))
+    sheets_manager.get_all_data("Inventory")
+    update = worksheet.update
+
+    def failing_update(*args, **kwargs):
+        if worksheet.calls["update"] >= 1:
+            raise RuntimeError("quota")
+        update(*args, **kwargs)
+
+    worksheet.calls.clear()
+    monkeypatch.setattr(worksheet, "update", failing_update)
+    assert not sheets_manager.update_inventory_data(_frame(3), chunk_size=2)
+
+    # Khối đầu đã ghi, các dòng cũ phía sau vẫn còn; watermark giữ nguyên cho lần sync sau
+    assert len(worksheet.get_all_values()) == 11
+    assert sheets_manager.sync_watermark() is not None
+
+
+def test_get_all_data_round_trip(sheets_manager):
+    sheets_manager.update_inventory_data(_frame(5))
+
+    df = sheets_manager.get_all_data("Inventory")
+
+    assert len(df) == 5
+    assert pd.api.types.is_datetime64_any_dtype(df["Ngày nhập"])
+    assert df["ID"].astype(str).tolist() == ["0", "1", "2", "3", "4"]
+
+
+def test_sync_data_fetches_only_new_rows(sheets_manager):
+    sheets_manager.update_inventory_data(_frame(5))
+    sheets_manager.get_all_data("Inventory")
+    worksheet = sheets_manager.get_worksheet("Inventory")
+    worksheet.append_rows([["99", "2024-02-01", "Đường", 7, "2024-02-01T00:00:00"]])
+    worksheet.calls.clear()
+
+    df = sheets_manager.sync_data("Inventory")
+
+    assert len(df) == 6
+    assert str(df["ID"].iloc[-1]) == "99"
+    assert "get_all_values" not in worksheet.calls
@@ -0,0 +1,180 @@
+import threading
+import time
+from datetime import date
+
+import pandas as pd
+import pytest
+
+from pages import quan_ly_kho
+from utils import google_sheets
+from utils.calculations import calculate_inventory_fields
+from utils.data_cache import VersionedDataCache
+from utils.google_sheets import INVENTORY_HEADERS, parse_date_columns, rows_to_dataframe
+from utils.ledger import InventoryLedger, rebuild_balances
+from utils.material_index import MaterialIndex
+from utils.outbox import TransactionOutbox
+from utils.snapshot import SnapshotStore
+
+
+def _transactions(rows):
+    return pd.DataFrame([
+        {"ID": str(i), "Ngày nhập": pd.Timestamp(day), "Name": "Bột mì", "Lock": "B07",
+         "Nhập (Bag)": bags, "Nhập (Weight)": bags * 25.0, "Sử dụng (Bag)": 0, "Sử dụng (Weight)": 0.0,
+         "Created_At": f"{day}T00:00:0{i}"}
+        for i, (day, bags) in enumerate(rows)
+    ])
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    cache = VersionedDataCache()
+    monkeypatch.setattr(quan_ly_kho, "data_cache", cache)
+    monkeypatch.setattr(google_sheets, "data_cache", cache)
+    data = calculate_inventory_fields(rebuild_balances(_transactions([("2024-01-01", 10)])))
+    cache.put(quan_ly_kho.INVENTORY_NAMESPACE, "inventory", {
+        "data": data, "ledger": InventoryLedger.from_dataframe(data),
+        "materials": MaterialIndex.from_dataframe(data), "revision": 0,
+    })
+    return cache
+
+
+def test_fifo_lots_follow_appended_transactions(cache):
+    as_of = date(2024, 3, 1)
+    inventory = cache.get(quan_ly_kho.INVENTORY_NAMESPACE, "inventory")
+    assert quan_ly_kho.get_fifo_lots(inventory, as_of)["Còn lại (Bag)"].sum() == 10
+
+    record = calculate_inventory_fields(_transactions([("2024-02-01", 5)]))
+    cache.update(quan_ly_kho.INVENTORY_NAMESPACE, "inventory",
+                 lambda inv: quan_ly_kho.append_to_inventory(inv, record, record.iloc[0].to_dict()))
+    inventory = cache.get(quan_ly_kho.INVENTORY_NAMESPACE, "inventory")
+
+    # Không bump namespace (Sheets chưa nhận dòng mới) nhưng FIFO đã tính lại
+    assert inventory["revision"] == 1
+    assert quan_ly_kho.get_fifo_lots(inventory, as_of)["Còn lại (Bag)"].sum() == 15
+
+
+def test_outbox_flush_keeps_cached_inventory(cache, transaction_log, sheets_manager, tmp_path):
+    outbox = TransactionOutbox(log=transaction_log, manager=sheets_manager,
+                               legacy_db_path=str(tmp_path / "outbox.db"))
+    transaction = {"Ngày nhập": "2024-02-01", "Name": "Bột mì", "Lock": "B07",
+                   "Nhập (Bag)": 5, "Nhập (Weight)": 125.0}
+    row = transaction_log.append(transaction)
+    record = calculate_inventory_fields(parse_date_columns(rows_to_dataframe(INVENTORY_HEADERS, [row])))
+    updated = cache.update(quan_ly_kho.INVENTORY_NAMESPACE, "inventory",
+                           lambda inv: quan_ly_kho.append_to_inventory(inv, record, transaction))
+
+    assert outbox.flush_once() == 1
+    # Dòng vừa đẩy lên đã có trong cache: không tải lại toàn bộ
+    assert cache.get(quan_ly_kho.INVENTORY_NAMESPACE, "inventory") is updated
+
+
+def test_update_does_not_block_other_readers(cache):
+    cache.put("other", "key", "value")
+    seen = []
+
+    def slow_append(inventory):
+        reader = threading.Thread(target=lambda: seen.append(cache.get("other", "key")))
+        reader.start()
+        reader.join(timeout=5)
+        return dict(inventory, revision=inventory["revision"] + 1)
+
+    cache.update(quan_ly_kho.INVENTORY_NAMESPACE, "inventory", slow_append)
+    assert seen == ["value"]
+    assert cache.get(quan_ly_kho.INVENTORY_NAMESPACE, "inventory")["revision"] == 1
+
+
+def test_update_discarded_when_bumped_meanwhile(cache):
+    def bumped(inventory):
+        cache.bump(quan_ly_kho.INVENTORY_NAMESPACE)
+        return dict(inventory, revision=inventory["revision"] + 1)
+
+    cache.update(quan_ly_kho.INVENTORY_NAMESPACE, "inventory", bumped)
+    assert cache.get(quan_ly_kho.INVENTORY_NAMESPACE, "inventory") is None
+
+
+def test_concurrent_submits_get_consecutive_opening_balances(cache, transaction_log, sheets_manager,
+                                                             tmp_path, monkeypatch):
+    outbox = TransactionOutbox(log=transaction_log, manager=sheets_manager,
+                               legacy_db_path=str(tmp_path / "outbox.db"))
+    monkeypatch.setattr(outbox, "start", lambda: None)
+    monkeypatch.setattr(quan_ly_kho, "transaction_outbox", outbox)
+    append = transaction_log.append
+
+    def slow_append(*args, **kwargs):
+        # Nới rộng khoảng giữa lúc đọc Tồn đầu và lúc cập nhật sổ cái
+        time.sleep(0.05)
+        return append(*args, **kwargs)
+
+    monkeypatch.setattr(transaction_log, "append", slow_append)
+    before = cache.get(quan_ly_kho.INVENTORY_NAMESPACE, "inventory")
+    threads = [
+        threading.Thread(target=quan_ly_kho.record_transaction, args=({
+            "Ngày nhập": "2024-02-01", "Name": "Bột mì", "Lock": "B07", "Nhập (Bag)": bags,
+            "Nhập (Weight)": bags * 25.0, "Sử dụng (Bag)": 0, "Sử dụng (Weight)": 0.0,
+        },))
+        for bags in (5, 7)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    rows = outbox.pending_rows()
+    opening = [float(row[INVENTORY_HEADERS.index("Tồn đầu (Bag)")]) for row in rows]
+    imported = [float(row[INVENTORY_HEADERS.index("Nhập (Bag)")]) for row in rows]
+    assert opening == [10, 10 + imported[0]]
+
+    inventory = cache.get(quan_ly_kho.INVENTORY_NAMESPACE, "inventory")
+    assert inventory["revision"] == 2
+    assert inventory["ledger"].opening_balance("Bột mì", "B07")[0] == 22
+    # Bản cũ giữ nguyên sổ cái của nó
+    assert before["ledger"].opening_balance("Bột mì", "B07")[0] == 10
+
+
+def test_reconcile_bumps_only_when_watermark_changes(cache, sheets_manager, monkeypatch):
+    monkeypatch.setattr(quan_ly_kho, "google_sheets_manager", sheets_manager)
+    worksheet = sheets_manager.get_worksheet("Inventory")
+    worksheet.append_rows([["1", "2024-01-01", "Bột mì", "B07"] + [0] * (len(INVENTORY_HEADERS) - 5)
+                           + ["2024-01-01T00:00:00"]])
+    sheets_manager.get_all_data("Inventory")
+    snapshot = sheets_manager.sync_watermark()
+    version = cache.version(quan_ly_kho.INVENTORY_NAMESPACE)
+
+    # Sheet không đổi: dữ liệu khôi phục vẫn dùng được
+    quan_ly_kho.reconcile_inventory(snapshot)
+    assert cache.version(quan_ly_kho.INVENTORY_NAMESPACE) == version
+
+    worksheet.append_rows([["2", "2024-01-02", "Bột mì", "B07"] + [0] * (len(INVENTORY_HEADERS) - 5)
+                           + ["2024-01-02T00:00:00"]])
+    quan_ly_kho.reconcile_inventory(snapshot)
+    assert cache.version(quan_ly_kho.INVENTORY_NAMESPACE) == version + 1
+
+
+def test_submit_is_visible_before_and_after_flush_without_duplicates(transaction_log, sheets_manager,
+                                                                     tmp_path, monkeypatch):
+    cache = VersionedDataCache()
+    outbox = TransactionOutbox(log=transaction_log, manager=sheets_manager,
+                               legacy_db_path=str(tmp_path / "outbox.db"))
+    monkeypatch.setattr(outbox, "start", lambda: None)
+    for module in (quan_ly_kho, google_sheets):
+        monkeypatch.setattr(module, "data_cache", cache)
+    monkeypatch.setattr(quan_ly_kho, "transaction_outbox", outbox)
+    monkeypatch.setattr(quan_ly_kho, "google_sheets_manager", sheets_manager)
+    monkeypatch.setattr(quan_ly_kho, "snapshot_store", SnapshotStore(str(tmp_path / "snapshots")))
+    sheets_manager.get_worksheet("Inventory")
+
+    row = quan_ly_kho.record_transaction({"Ngày nhập": "2024-02-01", "Name": "Bột mì", "Lock": "B07",
+                                          "Nhập (Bag)": 5, "Nhập (Weight)": 125.0})
+    # Cập nhật lạc quan từ bản ghi local, chưa gửi gì lên sheet
+    inventory = quan_ly_kho.get_inventory()
+    assert inventory["data"]["ID"].astype(str).tolist() == [row[0]]
+    assert len(sheets_manager.get_worksheet("Inventory").get_all_values()) == 1
+
+    # Tải lại khi dòng còn chờ: dòng lấy từ log
+    cache.bump(quan_ly_kho.INVENTORY_NAMESPACE)
+    assert quan_ly_kho.get_inventory()["data"]["ID"].astype(str).tolist() == [row[0]]
+
+    assert outbox.flush_once() == 1
+    # Tải lại sau khi đã lên sheet: dòng lấy từ sheet, không lặp với log
+    cache.bump(quan_ly_kho.INVENTORY_NAMESPACE)
+    assert quan_ly_kho.get_inventory()["data"]["ID"].astype(str).tolist() == [row[0]]
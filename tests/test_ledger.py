@@ -0,0 +1,61 @@
+import numpy as np
+import pandas as pd
+
+from utils.ledger import InventoryLedger, chronological_order, rebuild_balances
+
+
+def _movements():
+    return pd.DataFrame({
+        "Ngày nhập": pd.to_datetime(["2024-01-03", "2024-01-01", "2024-01-02", "2024-01-01", "2024-01-02"]),
+        "Created_At": ["3", "1", "2", "1", "2"],
+        "Name": ["Bột mì", "Bột mì", "Bột mì", "Đường", "Đường"],
+        "Lock": ["B07", "B07", "B07", "A01", "A01"],
+        "Tồn đầu (Bag)": [0, 100, 0, 5, 0],
+        "Tồn đầu (Weight)": [0.0, 2500.0, 0.0, 50.0, 0.0],
+        "Nhập (Bag)": [0, 10, 20, 0, 3],
+        "Nhập (Weight)": [0.0, 250.0, 500.0, 0.0, 30.0],
+        "Sử dụng (Bag)": [4, 0, 0, 1, 0],
+        "Sử dụng (Weight)": [100.0, 0.0, 0.0, 10.0, 0.0],
+    })
+
+
+def _reference(df):
+    """Tính lại bằng vòng lặp theo thứ tự thời gian trong từng (Name, Lock)"""
+    ending = {}
+    expected = np.zeros(len(df))
+    for pos in df.sort_values(["Ngày nhập", "Created_At"], kind="stable").index:
+        row = df.loc[pos]
+        key = (row["Name"], row["Lock"])
+        opening = ending.get(key, row["Tồn đầu (Bag)"])
+        ending[key] = opening + row["Nhập (Bag)"] - row["Sử dụng (Bag)"]
+        expected[pos] = ending[key]
+    return expected
+
+
+def test_rebuild_balances_matches_sequential_ledger():
+    df = _movements()
+    result = rebuild_balances(df)
+
+    np.testing.assert_allclose(result["Tồn cuối (Bag)"], _reference(df))
+    # Tồn đầu của giao dịch sau bằng tồn cuối của giao dịch trước cùng nhóm
+    np.testing.assert_allclose(result["Tồn đầu (Bag)"], [130, 100, 110, 5, 4])
+    np.testing.assert_allclose(result["Tồn cuối (Weight)"], [3150, 2750, 3250, 40, 70])
+    # Mặc định không sửa DataFrame đầu vào
+    assert "Tồn cuối (Bag)" not in df.columns
+
+
+def test_ledger_continues_from_latest_balance():
+    ledger = InventoryLedger.from_dataframe(rebuild_balances(_movements()))
+
+    assert ledger.opening_balance("Bột mì", "B07") == (126.0, 3150.0)
+    assert ledger.opening_balance("Muối", "C01") == (0, 0.0)
+    assert ledger.apply({"Name": "Bột mì", "Lock": "B07", "Sử dụng (Bag)": 6, "Sử dụng (Weight)": 150}) == (120.0, 3000.0)
+
+
+def test_chronological_order_puts_missing_dates_last():
+    df = pd.DataFrame({
+        "Ngày nhập": ["2024-01-03", None, "2024-01-01", "không rõ"],
+        "Created_At": ["2024-01-03T00:00:00", "2024-01-01T00:00:00", "2024-01-02T00:00:00", "2024-01-04T00:00:00"],
+    })
+    assert chronological_order(df).tolist() == [2, 0, 1, 3]
+    assert chronological_order(df.drop(columns="Created_At")).tolist() == [2, 0, 1, 3]
@@ -0,0 +1,141 @@
+import json
+import sqlite3
+import threading
+
+import pytest
+
+from utils.google_sheets import INVENTORY_HEADERS, build_transaction_row
+from utils.outbox import TransactionOutbox
+
+
+def _transaction(name="Bột mì", bags=10):
+    return {"Ngày nhập": "2024-01-05", "Name": name, "Lock": "B07", "Nhập (Bag)": bags, "Nhập (Weight)": bags * 25}
+
+
+@pytest.fixture
+def outbox(transaction_log, sheets_manager, tmp_path):
+    return TransactionOutbox(log=transaction_log, manager=sheets_manager,
+                             legacy_db_path=str(tmp_path / "outbox.db"))
+
+
+def test_log_assigns_increasing_ids(transaction_log):
+    rows = transaction_log.append_rows([[""] + [0] * (len(INVENTORY_HEADERS) - 1)] * 3)
+    assert [row[0] for row in rows] == ["1", "2", "3"]
+    assert transaction_log.last_id() == 3
+
+
+def test_log_ids_unique_under_concurrent_writers(transaction_log):
+    ids = []
+    lock = threading.Lock()
+
+    def worker():
+        for _ in range(50):
+            row = transaction_log.append(_transaction())
+            with lock:
+                ids.append(int(row[0]))
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(ids) == list(range(1, 401))
+
+
+def test_flush_pushes_pending_rows_once(outbox, transaction_log, sheets_manager):
+    for bags in (10, 20, 30):
+        transaction_log.append(_transaction(bags=bags))
+    assert outbox.pending_count() == 3
+
+    assert outbox.flush_once() == 3
+    assert outbox.flush_once() == 0
+    assert outbox.pending_count() == 0
+
+    values = sheets_manager.get_worksheet("Inventory").get_all_values()
+    assert values[0] == INVENTORY_HEADERS
+    assert [row[0] for row in values[1:]] == ["1", "2", "3"]
+    assert [row[INVENTORY_HEADERS.index("Nhập (Bag)")] for row in values[1:]] == [10, 20, 30]
+
+
+def test_failed_flush_keeps_rows_pending(outbox, transaction_log, monkeypatch):
+    transaction_log.append(_transaction())
+
+    def fail(rows, worksheet_name):
+        raise RuntimeError("quota")
+
+    monkeypatch.setattr(outbox.manager, "append_rows", fail)
+    with pytest.raises(RuntimeError):
+        outbox.flush_once()
+
+    assert outbox.pending_count() == 1
+    assert outbox.last_error == "quota"
+    with transaction_log.snapshot() as conn:
+        assert conn.execute("SELECT attempts, last_error FROM sheets_cursor").fetchone() == (1, "quota")
+
+
+def test_flush_after_crash_skips_rows_already_on_sheet(outbox, transaction_log, sheets_manager):
+    for bags in (10, 20):
+        transaction_log.append(_transaction(bags=bags))
+    # Lô trước đã lên sheet nhưng process dừng trước khi lưu ID cuối
+    sheets_manager.append_rows(transaction_log.rows(), "Inventory")
+    transaction_log.append(_transaction(bags=30))
+
+    assert outbox.flush_once() == 3
+    assert outbox.pending_count() == 0
+    values = sheets_manager.get_worksheet("Inventory").get_all_values()
+    assert [row[0] for row in values[1:]] == ["1", "2", "3"]
+
+    # Đã đối chiếu: các lần sau không đọc lại cột ID
+    worksheet = sheets_manager.get_worksheet("Inventory")
+    worksheet.calls.clear()
+    transaction_log.append(_transaction(bags=40))
+    assert outbox.flush_once() == 1
+    assert "col_values" not in worksheet.calls
+
+
+def _legacy_journal(path, rows):
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE IF NOT EXISTS outbox (id INTEGER PRIMARY KEY, worksheet TEXT, payload TEXT)")
+    conn.executemany("INSERT INTO outbox (id, worksheet, payload) VALUES (?, ?, ?)",
+                     [(row_id, "Inventory", json.dumps(row)) for row_id, row in rows])
+    conn.commit()
+    conn.close()
+
+
+def test_legacy_migration_is_idempotent(outbox, transaction_log):
+    rows = [(1704412800001 + i, build_transaction_row(_transaction(bags=bags))) for i, bags in enumerate((5, 6))]
+    _legacy_journal(outbox.legacy_db_path, rows)
+    assert outbox.migrate_legacy_journal() == 2
+
+    # Process dừng sau khi ghi vào log nhưng trước khi xoá khỏi journal cũ
+    _legacy_journal(outbox.legacy_db_path, rows)
+    assert outbox.migrate_legacy_journal() == 0
+    assert transaction_log.last_id() == 2
+    conn = sqlite3.connect(outbox.legacy_db_path)
+    assert conn.execute("SELECT COUNT(*) FROM outbox").fetchone()[0] == 0
+    conn.close()
+
+
+def test_write_waits_for_queued_commit(transaction_log):
+    release = threading.Event()
+    # Lệnh ghi chậm chiếm luồng ghi, lệnh sau phải chờ trong hàng đợi
+    blocker = transaction_log.submit(lambda conn: release.wait(5))
+    threading.Timer(0.3, release.set).start()
+
+    row = transaction_log.write(
+        lambda conn: transaction_log.insert_rows(conn, [build_transaction_row(_transaction())]), poll=0.05
+    )
+    assert blocker.result() is True
+    assert row[0][0] == "1"
+
+
+def test_day_summary_counts_imports_and_usage(transaction_log):
+    transaction_log.append(_transaction(bags=10))
+    transaction_log.append({"Ngày nhập": "2024-01-05", "Name": "Bột mì", "Lock": "B07",
+                            "Tồn đầu (Bag)": 50, "Sử dụng (Bag)": 3, "Sử dụng (Weight)": 75})
+    transaction_log.append({"Ngày nhập": "2024-01-06", "Name": "Đường", "Lock": "B07", "Nhập (Weight)": 12.5})
+
+    # Tồn đầu dương của dòng sử dụng không được tính là nhập
+    assert transaction_log.day_summary("2024-01-05") == {"so_dong": 2, "so_dong_nhap": 1, "so_dong_xuat": 1}
+    assert transaction_log.day_summary("2024-01-06") == {"so_dong": 1, "so_dong_nhap": 1, "so_dong_xuat": 0}
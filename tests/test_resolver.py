@@ -0,0 +1,36 @@
+import pandas as pd
+import pytest
+
+from utils.resolver import CanonicalResolver, canonicalize_columns, material_resolver, unmatched_names
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("biofil yellow 2%", "BIOFIL YELLOW 2%"),
+    ("  BIOFIL   YELLOW 2 % ", "BIOFIL YELLOW 2%"),
+    ("pke (IND)", "PKE (ind)"),
+])
+def test_spelling_variants_resolve(value, expected):
+    assert material_resolver.resolve(value) == expected
+
+
+@pytest.mark.parametrize("value", ["BIOFIL YELLOW 3%", "PKE (ind) #4", "PKE (ind) 2"])
+def test_digits_and_symbols_are_never_merged(value):
+    assert material_resolver.resolve(value) is None
+    assert material_resolver.resolve_id(value) == -1
+
+
+def test_diacritics_are_ignored():
+    resolver = CanonicalResolver(["Kho Đông", "Kho Tây"])
+    assert resolver.resolve("kho dong") == "Kho Đông"
+    assert resolver.resolve("KHO TÂY") == "Kho Tây"
+
+
+def test_close_names_are_only_suggested():
+    assert material_resolver.suggest("BIOFIL YELLOW 3%") == "BIOFIL YELLOW 2%"
+    assert material_resolver.suggest("BIOFIL YELLOW 2%") is None
+
+    df = canonicalize_columns(pd.DataFrame({"ten_nguyen_lieu": ["BIOFIL YELLOW 3%", "BIOFIL YELLOW 2%"]}))
+    assert list(df["ten_nguyen_lieu"]) == ["BIOFIL YELLOW 3%", "BIOFIL YELLOW 2%"]
+    assert unmatched_names(df) == [
+        {"column": "ten_nguyen_lieu", "value": "BIOFIL YELLOW 3%", "suggestion": "BIOFIL YELLOW 2%"},
+    ]
@@ -0,0 +1,52 @@
+import pandas as pd
+import pytest
+
+from utils.schema import SchemaNormalizer, detect_separators
+
+
+def _upload(bags, weights):
+    return pd.DataFrame({
+        "Ngày nhập": ["05/01/2024"] * len(bags),
+        "Tên nguyên liệu": ["BDG"] * len(bags),
+        "Lô": ["B07"] * len(bags),
+        "Số bao": bags,
+        "Khối lượng": weights,
+    })
+
+
+@pytest.mark.parametrize("values, expected", [
+    (["1.234,5", "2,5"], (".", ",")),
+    (["1,234.5", "2.5"], (",", ".")),
+    (["1,5", "2.000"], (".", ",")),
+    (["1.234.567"], (".", ",")),
+    (["1.000"], None),
+    (["1,234"], None),
+    (["12"], None),
+])
+def test_detect_separators(values, expected):
+    assert detect_separators(pd.Series(values)) == expected
+
+
+def test_ambiguous_column_follows_other_columns():
+    # Số bao chỉ có "1.000"; khối lượng cho thấy file ghi số kiểu Việt Nam
+    out = SchemaNormalizer().normalize(_upload(["1.000", "2.000"], ["25.000,5", "1.234,25"]))
+    assert out["so_bao"].tolist() == [1000, 2000]
+    assert out["khoiluong"].tolist() == [25000.5, 1234.25]
+
+
+def test_layout_is_not_reused_across_files():
+    normalizer = SchemaNormalizer()
+    first = normalizer.normalize(_upload(["1.000"], ["1.234,5"]))
+    second = normalizer.normalize(_upload(["1,000"], ["1,234.5"]))
+    assert first["khoiluong"].tolist() == [1234.5]
+    assert second["khoiluong"].tolist() == [1234.5]
+    assert first["so_bao"].tolist() == second["so_bao"].tolist() == [1000]
+
+
+def test_later_chunks_of_a_file_keep_decided_separators():
+    schema = SchemaNormalizer().for_file()
+    schema.normalize(_upload(["1.000,5"], ["2,5"]))
+    # Khối sau chỉ có giá trị không tự phân biệt được
+    out = schema.normalize(_upload(["3.000"], ["1.000"]))
+    assert out["so_bao"].tolist() == [3000]
+    assert out["khoiluong"].tolist() == [1000]
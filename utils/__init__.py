@@ -0,0 +1,12 @@
+# Các hàm dùng chung được tải khi truy cập lần đầu, import package không kéo theo pandas
+_LAZY_EXPORTS = {
+    "clean_inventory_dataframe": "utils.cleaning",
+}
+
+def __getattr__(name):
+    if name in _LAZY_EXPORTS:
+        import importlib
+        value = getattr(importlib.import_module(_LAZY_EXPORTS[name]), name)
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module 'utils' has no attribute {name!r}")
@@ -1,50 +1,91 @@
+import numpy as np
 import pandas as pd
 from datetime import datetime
 
-def calculate_inventory_fields(df):
+from utils.instrumentation import instrumented
+from utils.resolver import lock_resolver, material_resolver
+
+# Các cột số nhập liệu
+NUMERIC_COLS = ['Tồn đầu (Bag)', 'Tồn đầu (Weight)', 'Nhập (Bag)', 'Nhập (Weight)',
+                'Sử dụng (Bag)', 'Sử dụng (Weight)']
+
+# Các cột số lượng bao (số nguyên) được downcast sau khi tính
+BAG_COLS = ['Tồn đầu (Bag)', 'Nhập (Bag)', 'Sử dụng (Bag)', 'Tồn cuối (Bag)']
+
+# Các cột được cộng tổng trong báo cáo
+TOTAL_COLS = ['Tồn đầu (Bag)', 'Tồn đầu (Weight)', 'Nhập (Bag)', 'Nhập (Weight)',
+              'Sử dụng (Bag)', 'Sử dụng (Weight)', 'Tồn cuối (Bag)', 'Tồn cuối (Weight)']
+
+# Các cột lặp giá trị nhiều, lưu dạng categorical theo tên chuẩn
+CATEGORICAL_COLS = {'Name': material_resolver, 'Lock': lock_resolver}
+
+def _as_float(series):
+    """Chuyển cột về float64 để tính toán (không tràn số khi cột đã bị downcast)"""
+    if not pd.api.types.is_numeric_dtype(series):
+        series = pd.to_numeric(series, errors='coerce')
+    values = series.to_numpy(dtype='float64', na_value=np.nan)
+    if np.isnan(values).any():
+        values = np.nan_to_num(values, nan=0.0)
+    return values
+
+@instrumented()
+def calculate_inventory_fields(df, inplace=False, downcast=True, categorize=True):
     """
-    Tính toán các trường tự động cho dữ liệu tồn kho
+    Tính toán các trường tự động cho dữ liệu tồn kho (vectorized)
+    
+    - inplace=True: ghi trực tiếp vào df, không tạo bản sao
+    - downcast=True: cột số bao và tuổi lưu kho dùng kiểu số nguyên nhỏ nhất
+    - categorize=True: cột Name/Lock đưa về tên chuẩn, lưu kiểu categorical
     """
-    df_calc = df.copy()
+    # Bản sao nông: chỉ các cột được gán lại mới được cấp phát bộ nhớ mới
+    df_calc = df if inplace else df.copy(deep=False)
     
     # Đảm bảo các cột số là kiểu số
-    numeric_cols = ['Tồn đầu (Bag)', 'Tồn đầu (Weight)', 'Nhập (Bag)', 'Nhập (Weight)', 
-                   'Sử dụng (Bag)', 'Sử dụng (Weight)']
-    
-    for col in numeric_cols:
+    values = {}
+    for col in NUMERIC_COLS:
         if col in df_calc.columns:
-            df_calc[col] = pd.to_numeric(df_calc[col], errors='coerce').fillna(0)
+            values[col] = _as_float(df_calc[col])
+            df_calc[col] = values[col]
     
     # Tính tồn cuối
-    if all(col in df_calc.columns for col in ['Tồn đầu (Bag)', 'Nhập (Bag)', 'Sử dụng (Bag)']):
-        df_calc['Tồn cuối (Bag)'] = df_calc['Tồn đầu (Bag)'] + df_calc['Nhập (Bag)'] - df_calc['Sử dụng (Bag)']
+    if all(col in values for col in ['Tồn đầu (Bag)', 'Nhập (Bag)', 'Sử dụng (Bag)']):
+        values['Tồn cuối (Bag)'] = values['Tồn đầu (Bag)'] + values['Nhập (Bag)'] - values['Sử dụng (Bag)']
+        df_calc['Tồn cuối (Bag)'] = values['Tồn cuối (Bag)']
     
-    if all(col in df_calc.columns for col in ['Tồn đầu (Weight)', 'Nhập (Weight)', 'Sử dụng (Weight)']):
-        df_calc['Tồn cuối (Weight)'] = df_calc['Tồn đầu (Weight)'] + df_calc['Nhập (Weight)'] - df_calc['Sử dụng (Weight)']
+    if all(col in values for col in ['Tồn đầu (Weight)', 'Nhập (Weight)', 'Sử dụng (Weight)']):
+        values['Tồn cuối (Weight)'] = values['Tồn đầu (Weight)'] + values['Nhập (Weight)'] - values['Sử dụng (Weight)']
+        df_calc['Tồn cuối (Weight)'] = values['Tồn cuối (Weight)']
     
-    # Tính trung bình
-    if all(col in df_calc.columns for col in ['Tồn cuối (Bag)', 'Tồn cuối (Weight)']):
-        df_calc['Trung bình'] = df_calc.apply(
-            lambda x: x['Tồn cuối (Weight)'] / x['Tồn cuối (Bag)'] if x['Tồn cuối (Bag)'] > 0 else 0, 
-            axis=1
-        ).round(2)
+    # Tính trung bình (bằng 0 khi tồn cuối không dương)
+    if 'Tồn cuối (Bag)' in values and 'Tồn cuối (Weight)' in values:
+        bags = values['Tồn cuối (Bag)']
+        average = np.divide(values['Tồn cuối (Weight)'], bags, out=np.zeros(len(bags)), where=bags > 0)
+        df_calc['Trung bình'] = np.round(average, 2)
     
     # Tính tuổi lưu kho
     if 'Ngày nhập' in df_calc.columns:
-        df_calc['Ngày nhập'] = pd.to_datetime(df_calc['Ngày nhập'], errors='coerce')
+        if not pd.api.types.is_datetime64_any_dtype(df_calc['Ngày nhập']):
+            df_calc['Ngày nhập'] = pd.to_datetime(df_calc['Ngày nhập'], errors='coerce')
         df_calc['Tuổi lưu kho'] = (datetime.now() - df_calc['Ngày nhập']).dt.days
     
+    if downcast:
+        for col in BAG_COLS + ['Tuổi lưu kho']:
+            if col in df_calc.columns and not df_calc[col].hasnans:
+                df_calc[col] = pd.to_numeric(df_calc[col], downcast='integer')
+    
+    if categorize:
+        for col, resolver in CATEGORICAL_COLS.items():
+            if col in df_calc.columns and not isinstance(df_calc[col].dtype, pd.CategoricalDtype):
+                df_calc[col] = resolver.categorical(df_calc[col])
+    
     return df_calc
 
 def calculate_totals(df):
     """
     Tính tổng cho các cột số
     """
-    numeric_cols = ['Tồn đầu (Bag)', 'Tồn đầu (Weight)', 'Nhập (Bag)', 'Nhập (Weight)',
-                   'Sử dụng (Bag)', 'Sử dụng (Weight)', 'Tồn cuối (Bag)', 'Tồn cuối (Weight)']
-    
     totals = {}
-    for col in numeric_cols:
+    for col in TOTAL_COLS:
         if col in df.columns:
             totals[col] = df[col].sum()
     
@@ -0,0 +1,215 @@
+import threading
+import time
+from datetime import date, datetime
+
+import pandas as pd
+
+from utils.transaction_log import transaction_log
+
+# Độ chi tiết mặc định của checkpoint: "day" hoặc "month"
+CHECKPOINT_GRAIN = "month"
+
+# Chu kỳ dựng checkpoint ở luồng nền (giây); truy vấn không tự dựng
+BUILD_INTERVAL = 3600.0
+
+# Ngày cuối kỳ chứa một ngày giao dịch (biểu thức SQLite trên cột ngay_nhap)
+PERIOD_END_SQL = {
+    "day": "ngay_nhap",
+    "month": "date(ngay_nhap, 'start of month', '+1 month', '-1 day')",
+}
+
+# Ngày đầu kỳ hiện tại (chưa kết thúc, chưa tạo checkpoint)
+PERIOD_START_SQL = {
+    "day": "date(?)",
+    "month": "date(?, 'start of month')",
+}
+
+# Biến động của một giao dịch: nhập - sử dụng, cộng tồn trước log nếu là dòng đầu của cặp
+# (nguyên liệu, lô) trong log (xem utils.transaction_log)
+MOVEMENT_SQL = (
+    "COALESCE(ten_nguyen_lieu, '') AS ten_nguyen_lieu, COALESCE(lo, '') AS lo, "
+    "ton_dau_bao + nhap_bao - su_dung_bao AS so_bao, ton_dau_kg + nhap_kg - su_dung_kg AS khoiluong"
+)
+
+def _iso(day):
+    if day is None:
+        return date.today().isoformat()
+    if isinstance(day, datetime):
+        day = day.date()
+    return day.isoformat() if isinstance(day, date) else str(day)[:10]
+
+class BalanceCheckpoints:
+    """
+    Số dư cuối kỳ (ngày hoặc tháng) theo (nguyên liệu, lô) lưu cạnh log giao dịch
+
+    Checkpoint của kỳ P là tổng biến động của mọi giao dịch có ngày <= P, đúng tới ID through_id
+    của lần dựng gần nhất. Giao dịch ghi sau đó mà có ngày <= P (nhập lùi ngày) làm P và mọi kỳ
+    sau nó mất hiệu lực: chúng bị bỏ qua khi truy vấn và được dựng lại ở lần dựng tiếp theo.
+    Truy vấn tồn tại một ngày bắt đầu từ checkpoint hợp lệ gần nhất và chỉ cộng các giao dịch sau đó.
+
+    Chỉ gồm các (nguyên liệu, lô) có giao dịch trong log (nhập qua ứng dụng, xem coverage()). Tồn
+    có từ trước được lấy từ Tồn đầu của giao dịch đầu tiên mỗi cặp và tính từ ngày của giao dịch
+    đó; dữ liệu upload trong inventory.db không được tính.
+    """
+
+    def __init__(self, log=None, grain=CHECKPOINT_GRAIN):
+        if grain not in PERIOD_END_SQL:
+            raise ValueError(f"grain phải là một trong {list(PERIOD_END_SQL)}")
+        self.log = log or transaction_log
+        self.grain = grain
+        self.last_error = None
+        self._schema_ready = False
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def _ensure_schema(self):
+        if self._schema_ready:
+            return
+
+        def create(conn):
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS balance_checkpoints (
+                    grain TEXT NOT NULL,
+                    period TEXT NOT NULL,
+                    ten_nguyen_lieu TEXT NOT NULL,
+                    lo TEXT NOT NULL,
+                    so_bao REAL NOT NULL,
+                    khoiluong REAL NOT NULL,
+                    PRIMARY KEY (grain, period, ten_nguyen_lieu, lo)
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS checkpoint_state (
+                    grain TEXT PRIMARY KEY,
+                    through_id INTEGER NOT NULL DEFAULT 0
+                )
+            """)
+
+        self.log.write(create)
+        self._schema_ready = True
+
+    def _valid_before(self, conn):
+        """(through_id, ngày sớm nhất bị nhập lùi hoặc None): checkpoint có kỳ < ngày đó còn hợp lệ"""
+        row = conn.execute(
+            "SELECT through_id FROM checkpoint_state WHERE grain = ?", (self.grain,)
+        ).fetchone()
+        through_id = row[0] if row else 0
+        stale_from = conn.execute(
+            "SELECT MIN(ngay_nhap) FROM transactions WHERE id > ?", (through_id,)
+        ).fetchone()[0]
+        return through_id, stale_from
+
+    def _latest_period(self, conn, before=None, stale_from=None):
+        sql = "SELECT MAX(period) FROM balance_checkpoints WHERE grain = ?"
+        params = [self.grain]
+        if before is not None:
+            sql += " AND period <= ?"
+            params.append(before)
+        if stale_from is not None:
+            sql += " AND period < ?"
+            params.append(stale_from)
+        return conn.execute(sql, params).fetchone()[0]
+
+    def build(self, until=None):
+        """
+        Bỏ các checkpoint mất hiệu lực và dựng thêm các kỳ đã kết thúc trước ngày until (mặc định
+        hôm nay); chỉ đọc các giao dịch sau checkpoint hợp lệ gần nhất. Trả về số kỳ mới dựng.
+        """
+        self._ensure_schema()
+        current_start = _iso(until)
+        period_end = PERIOD_END_SQL[self.grain]
+
+        def extend(conn):
+            _, stale_from = self._valid_before(conn)
+            if stale_from is not None:
+                conn.execute(
+                    "DELETE FROM balance_checkpoints WHERE grain = ? AND period >= ?", (self.grain, stale_from)
+                )
+            previous = self._latest_period(conn) or ""
+            periods = [period for (period,) in conn.execute(f"""
+                SELECT DISTINCT {period_end} AS period FROM transactions
+                WHERE ngay_nhap > ? AND {period_end} < {PERIOD_START_SQL[self.grain]}
+                ORDER BY period
+            """, (previous, current_start))]
+            for period in periods:
+                conn.execute(f"""
+                    INSERT INTO balance_checkpoints (grain, period, ten_nguyen_lieu, lo, so_bao, khoiluong)
+                    SELECT ?, ?, ten_nguyen_lieu, lo, SUM(so_bao), SUM(khoiluong) FROM (
+                        SELECT ten_nguyen_lieu, lo, so_bao, khoiluong FROM balance_checkpoints
+                        WHERE grain = ? AND period = ?
+                        UNION ALL
+                        SELECT {MOVEMENT_SQL} FROM transactions WHERE ngay_nhap > ? AND ngay_nhap <= ?
+                    ) GROUP BY ten_nguyen_lieu, lo
+                """, (self.grain, period, self.grain, previous, previous, period))
+                previous = period
+            conn.execute("""
+                INSERT INTO checkpoint_state (grain, through_id)
+                VALUES (?, (SELECT COALESCE(MAX(id), 0) FROM transactions))
+                ON CONFLICT (grain) DO UPDATE SET through_id = excluded.through_id
+            """, (self.grain,))
+            return len(periods)
+
+        return self.log.write(extend)
+
+    def _run(self, interval):
+        while True:
+            try:
+                self.build()
+                self.last_error = None
+            except Exception as e:
+                self.last_error = str(e)
+            time.sleep(interval)
+
+    def start(self, interval=BUILD_INTERVAL):
+        """Khởi động luồng nền dựng checkpoint mỗi interval giây (chỉ một lần cho mỗi process)"""
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run, args=(interval,), name="balance-checkpoints", daemon=True
+                )
+                self._thread.start()
+
+    def coverage(self):
+        """(ngày giao dịch sớm nhất, ngày muộn nhất, số giao dịch) của log, None nếu log trống"""
+        with self.log.snapshot() as conn:
+            first, last, count = conn.execute(
+                "SELECT MIN(ngay_nhap), MAX(ngay_nhap), COUNT(*) FROM transactions"
+            ).fetchone()
+        return (first, last, count) if count else None
+
+    def balances_as_of(self, as_of=None, material=None, lock=None, build=False):
+        """
+        Tồn kho (số bao, khối lượng) theo (nguyên liệu, lô) tính đến hết ngày as_of
+
+        Chỉ đọc: checkpoint được dựng ở luồng nền (start()); checkpoint mất hiệu lực hoặc chưa dựng
+        chỉ làm truy vấn cộng nhiều giao dịch hơn, kết quả vẫn đúng. build=True dựng bù trước khi
+        truy vấn (dùng cho script/bảo trì, không gọi trên mỗi lần rerun).
+        """
+        if build:
+            self.build()
+        else:
+            self._ensure_schema()
+        as_of = _iso(as_of)
+        filters, params = "", []
+        for column, value in (("ten_nguyen_lieu", material), ("lo", lock)):
+            if value is not None:
+                filters += f" AND {column} = ?"
+                params.append(value)
+
+        with self.log.snapshot() as conn:
+            _, stale_from = self._valid_before(conn)
+            base = self._latest_period(conn, before=as_of, stale_from=stale_from) or ""
+            df = pd.read_sql(f"""
+                SELECT ten_nguyen_lieu, lo, SUM(so_bao) AS so_bao, SUM(khoiluong) AS khoiluong FROM (
+                    SELECT ten_nguyen_lieu, lo, so_bao, khoiluong FROM balance_checkpoints
+                    WHERE grain = ? AND period = ?{filters}
+                    UNION ALL
+                    SELECT * FROM (SELECT {MOVEMENT_SQL} FROM transactions WHERE ngay_nhap > ? AND ngay_nhap <= ?)
+                    WHERE 1 = 1{filters}
+                ) GROUP BY ten_nguyen_lieu, lo ORDER BY ten_nguyen_lieu, lo
+            """, conn, params=[self.grain, base, *params, base, as_of, *params])
+        df.attrs["checkpoint"] = base or None
+        return df
+
+# Singleton instance
+balance_checkpoints = BalanceCheckpoints()
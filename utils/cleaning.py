@@ -0,0 +1,9 @@
+from utils.schema import inventory_schema
+
+def clean_inventory_dataframe(df, schema=None):
+    """
+    Chuẩn hoá DataFrame upload về đúng schema của bảng inventory (xem utils.schema)
+
+    schema: inventory_schema.for_file() dùng chung cho các khối của cùng một file.
+    """
+    return (schema or inventory_schema).normalize(df)
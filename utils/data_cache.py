@@ -0,0 +1,159 @@
+import sys
+import threading
+from collections import OrderedDict, defaultdict
+
+import pandas as pd
+
+# Trần bộ nhớ của cache dùng chung (byte)
+DATA_CACHE_MAX_BYTES = 512 * 1024 * 1024
+
+# Namespace theo nguồn dữ liệu
+SHEETS_NAMESPACE = "sheets:{}"
+DB_NAMESPACE = "db:{}"
+
+def sizeof(value):
+    """Ước lượng bộ nhớ của một giá trị trong cache (byte)"""
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        usage = value.memory_usage(deep=True)
+        return int(usage.sum() if isinstance(value, pd.DataFrame) else usage)
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(sizeof(v) for v in value.values())
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(sizeof(v) for v in value)
+    if hasattr(value, "nbytes"):
+        return int(value.nbytes)
+    return sys.getsizeof(value)
+
+class VersionedDataCache:
+    """
+    Cache dùng chung cho cả process, mỗi namespace có một bộ đếm phiên bản
+
+    Mọi đường ghi gọi bump(namespace) để các entry của namespace đó hết hạn. Entry được
+    trả về nguyên bản (không copy) nên bên đọc không được sửa trực tiếp.
+    """
+
+    def __init__(self, max_bytes=DATA_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._versions = defaultdict(int)
+        # (namespace, key) -> (version, value, size), thứ tự LRU
+        self._entries = OrderedDict()
+        self._lock = threading.RLock()
+        self._loading = defaultdict(threading.Lock)
+
+    def version(self, namespace):
+        with self._lock:
+            return self._versions[namespace]
+
+    def bump(self, namespace):
+        """Tăng phiên bản dữ liệu của namespace và bỏ các entry cũ của nó"""
+        with self._lock:
+            self._versions[namespace] += 1
+            for entry_key in [k for k in self._entries if k[0] == namespace]:
+                self._drop(entry_key)
+            return self._versions[namespace]
+
+    def get(self, namespace, key, default=None):
+        """Giá trị còn hiệu lực của (namespace, key), hoặc default"""
+        with self._lock:
+            entry = self._entries.get((namespace, key))
+            if entry is None or entry[0] != self._versions[namespace]:
+                self.misses += 1
+                return default
+            self._entries.move_to_end((namespace, key))
+            self.hits += 1
+            return entry[1]
+
+    def put(self, namespace, key, value, version=None):
+        """Lưu giá trị cho phiên bản hiện tại (bỏ qua nếu version đã cũ)"""
+        size = sizeof(value)
+        with self._lock:
+            current = self._versions[namespace]
+            if version is not None and version != current:
+                return value
+            if (namespace, key) in self._entries:
+                self._drop((namespace, key))
+            if size > self.max_bytes:
+                return value
+            self._entries[(namespace, key)] = (current, value, size)
+            self.current_bytes += size
+            self._evict()
+        return value
+
+    def _key_lock(self, namespace, key):
+        """Khoá riêng của một key: tải và cập nhật cùng key chạy lần lượt, không chặn key khác"""
+        with self._lock:
+            return self._loading[(namespace, key)]
+
+    def _current(self, namespace, key):
+        """Entry còn hiệu lực (version, value, size) của (namespace, key), hoặc None"""
+        with self._lock:
+            entry = self._entries.get((namespace, key))
+            if entry is None or entry[0] != self._versions[namespace]:
+                return None
+            return entry
+
+    def get_or_load(self, namespace, key, loader):
+        """Trả về giá trị trong cache, nếu không có thì gọi loader (mỗi key chỉ một luồng tải)"""
+        marker = object()
+        value = self.get(namespace, key, marker)
+        if value is not marker:
+            return value
+        with self._key_lock(namespace, key):
+            # Luồng khác có thể vừa tải xong trong lúc chờ
+            value = self.get(namespace, key, marker)
+            if value is not marker:
+                return value
+            version = self.version(namespace)
+            value = loader()
+            return self.put(namespace, key, value, version=version)
+
+    def update(self, namespace, key, func, loader=None):
+        """
+        Thay entry còn hiệu lực bằng func(giá trị cũ); None nếu không có entry (và không có loader)
+
+        func chạy dưới khoá riêng của key chứ không dưới khoá chung: các lần cập nhật cùng key
+        chạy lần lượt, bên đọc không phải chờ. Kết quả chỉ được lưu nếu entry không bị bump hay
+        thay thế trong lúc func chạy. Có loader thì entry thiếu được tải trong cùng đoạn khoá.
+        """
+        with self._key_lock(namespace, key):
+            entry = self._current(namespace, key)
+            if entry is None and loader is not None:
+                version = self.version(namespace)
+                self.put(namespace, key, loader(), version=version)
+                entry = self._current(namespace, key)
+            if entry is None:
+                return None
+            value = func(entry[1])
+            size = sizeof(value)
+            with self._lock:
+                if self._entries.get((namespace, key)) is entry and entry[0] == self._versions[namespace]:
+                    self._drop((namespace, key))
+                    if size <= self.max_bytes:
+                        self._entries[(namespace, key)] = (entry[0], value, size)
+                        self.current_bytes += size
+                        self._evict()
+            return value
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self.current_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+    def _drop(self, entry_key):
+        _, _, size = self._entries.pop(entry_key)
+        self.current_bytes -= size
+
+    def _evict(self):
+        while self.current_bytes > self.max_bytes and self._entries:
+            self._drop(next(iter(self._entries)))
+
+# Singleton instance
+data_cache = VersionedDataCache()
@@ -0,0 +1,253 @@
+import io
+import multiprocessing
+import os
+import queue
+import time
+
+import pandas as pd
+
+# Số dòng tối đa của một khối khi đọc Excel
+EXCEL_CHUNK_ROWS = 20000
+
+# Trần bộ nhớ cho một khối DataFrame (byte); số dòng mỗi khối được giảm để không vượt quá
+MAX_CHUNK_BYTES = 64 * 1024 * 1024
+
+# Khối đầu tiên nhỏ để đo kích thước mỗi dòng (và hiển thị preview sớm)
+PROBE_ROWS = 1000
+
+# Cột ghi tên sheet nguồn của từng dòng
+SOURCE_SHEET_COLUMN = "nguon_sheet"
+
+# Số process tối đa khi đọc song song nhiều sheet (mặc định theo số CPU được phép dùng)
+MAX_INGEST_WORKERS = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count() or 1
+
+# Số khối tối đa chờ trong hàng đợi kết quả cho mỗi process con (bộ nhớ ~ khối × MAX_CHUNK_BYTES)
+RESULT_QUEUE_CHUNKS = 2
+
+# Chu kỳ kiểm tra process con còn chạy khi chờ khối tiếp theo (giây)
+WORKER_POLL_SECONDS = 1.0
+
+def _is_legacy_xls(file):
+    return str(getattr(file, "name", file)).lower().endswith(".xls")
+
+def _rewind(file):
+    if hasattr(file, "seek"):
+        file.seek(0)
+    return file
+
+def list_sheet_names(file):
+    """Danh sách sheet của workbook mà không parse nội dung các sheet"""
+    if _is_legacy_xls(file):
+        return pd.ExcelFile(_rewind(file)).sheet_names
+    import openpyxl
+    workbook = openpyxl.load_workbook(_rewind(file), read_only=True, data_only=True)
+    try:
+        return list(workbook.sheetnames)
+    finally:
+        workbook.close()
+
+def _header_names(header):
+    """Tên cột từ dòng header, ô trống đặt tên giống pandas (Unnamed: i)"""
+    names = []
+    for i, value in enumerate(header):
+        names.append(f"Unnamed: {i}" if value is None or str(value).strip() == "" else str(value))
+    return names
+
+class ExcelChunkReader:
+    """Đọc một sheet Excel theo từng khối DataFrame ở chế độ read-only (bộ nhớ bị chặn trên)"""
+
+    def __init__(self, file, sheet_name, chunk_rows=EXCEL_CHUNK_ROWS, max_chunk_bytes=MAX_CHUNK_BYTES):
+        self.file = file
+        self.sheet_name = sheet_name
+        self.chunk_rows = chunk_rows
+        self.max_chunk_bytes = max_chunk_bytes
+        self.rows_read = 0
+        self.total_rows = None
+
+    def progress(self):
+        """Tỷ lệ dòng đã đọc (0..1), None nếu không biết tổng số dòng"""
+        if not self.total_rows:
+            return None
+        return min(self.rows_read / self.total_rows, 1.0)
+
+    def _limit_chunk_rows(self, df):
+        """Giảm số dòng mỗi khối theo kích thước thực tế của khối đầu tiên"""
+        bytes_per_row = df.memory_usage(deep=True).sum() / max(len(df), 1)
+        if bytes_per_row > 0:
+            self.chunk_rows = max(1, min(self.chunk_rows, int(self.max_chunk_bytes // bytes_per_row)))
+
+    def __iter__(self):
+        if _is_legacy_xls(self.file):
+            yield from self._iter_legacy()
+            return
+
+        import openpyxl
+        workbook = openpyxl.load_workbook(_rewind(self.file), read_only=True, data_only=True)
+        try:
+            worksheet = workbook[self.sheet_name]
+            # max_row lấy từ metadata của sheet, có thể thiếu với file do công cụ khác tạo
+            self.total_rows = max((worksheet.max_row or 1) - 1, 0)
+            rows = worksheet.iter_rows(values_only=True)
+            header = next(rows, None)
+            if header is None:
+                return
+            columns = _header_names(header)
+            width = len(columns)
+
+            buffer = []
+            first_chunk = True
+            limit = min(self.chunk_rows, PROBE_ROWS)
+            for row in rows:
+                self.rows_read += 1
+                # Bỏ dòng trống giống pd.read_excel
+                if all(value is None for value in row):
+                    continue
+                buffer.append(row[:width] if len(row) >= width else row + (None,) * (width - len(row)))
+                if len(buffer) >= limit:
+                    df = pd.DataFrame(buffer, columns=columns)
+                    buffer = []
+                    if first_chunk:
+                        self._limit_chunk_rows(df)
+                        limit = self.chunk_rows
+                        first_chunk = False
+                    yield df
+            if buffer:
+                yield pd.DataFrame(buffer, columns=columns)
+        finally:
+            workbook.close()
+
+    def _iter_legacy(self):
+        """File .xls (không hỗ trợ read-only) được đọc một lần rồi chia khối"""
+        df = pd.read_excel(_rewind(self.file), sheet_name=self.sheet_name)
+        self.total_rows = len(df)
+        for start in range(0, len(df), self.chunk_rows):
+            self.rows_read = min(start + self.chunk_rows, len(df))
+            yield df.iloc[start:start + self.chunk_rows]
+
+def clean_chunk(df_raw, sheet_name, schema=None):
+    """
+    Chuẩn hoá một khối dữ liệu thô và gắn tên sheet nguồn
+
+    schema: inventory_schema.for_file() dùng chung cho các khối của cùng sheet.
+    """
+    from utils.cleaning import clean_inventory_dataframe
+    from utils.resolver import canonicalize_columns
+
+    df_clean = canonicalize_columns(clean_inventory_dataframe(df_raw, schema))
+    df_clean[SOURCE_SHEET_COLUMN] = sheet_name
+    return df_clean
+
+def _iter_sheet(data, file_name, order, sheet_name):
+    """
+    Đọc và chuẩn hoá một sheet, trả về các thông điệp (loại, vị trí sheet, nội dung, số dòng thô)
+
+    Loại "chunk" mang một khối đã chuẩn hoá; sheet kết thúc bằng "done" (số giây) hoặc "error".
+    """
+    start = time.perf_counter()
+    file = io.BytesIO(data)
+    file.name = file_name
+    from utils.schema import inventory_schema
+
+    reader = ExcelChunkReader(file, sheet_name)
+    schema = inventory_schema.for_file()
+    try:
+        for df_raw in reader:
+            yield "chunk", order, clean_chunk(df_raw, sheet_name, schema), reader.rows_read
+    except Exception as e:
+        yield "error", order, f"{type(e).__name__}: {e}", reader.rows_read
+        return
+    yield "done", order, time.perf_counter() - start, reader.rows_read
+
+def _ingest_worker(data, file_name, tasks, results):
+    """Process con: lấy (vị trí, tên sheet) từ tasks cho tới khi gặp None, gửi từng thông điệp vào results"""
+    for order, sheet_name in iter(tasks.get, None):
+        for message in _iter_sheet(data, file_name, order, sheet_name):
+            results.put(message)
+
+def _iter_sheets_parallel(data, file_name, sheet_names, workers):
+    """Thông điệp từ các process con; hàng đợi kết quả có giới hạn nên số khối đang nằm trong bộ nhớ bị chặn"""
+    # spawn: không fork process đang chạy nhiều thread (server Streamlit)
+    context = multiprocessing.get_context("spawn")
+    tasks = context.Queue()
+    results = context.Queue(maxsize=workers * RESULT_QUEUE_CHUNKS)
+    for task in enumerate(sheet_names):
+        tasks.put(task)
+    for _ in range(workers):
+        tasks.put(None)
+    processes = [context.Process(target=_ingest_worker, args=(data, file_name, tasks, results), daemon=True)
+                 for _ in range(workers)]
+    for process in processes:
+        process.start()
+    pending = set(range(len(sheet_names)))
+    try:
+        while pending:
+            try:
+                message = results.get(timeout=WORKER_POLL_SECONDS)
+            except queue.Empty:
+                if not any(process.is_alive() for process in processes):
+                    # Process con chết mà không báo (vd. hết bộ nhớ)
+                    for order in sorted(pending):
+                        yield "error", order, "Process đọc sheet dừng bất thường", 0
+                    return
+                continue
+            if message[0] != "chunk":
+                pending.discard(message[1])
+            yield message
+    finally:
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+            process.join()
+
+def ingest_workbook(file, sheet_names=None, max_workers=MAX_INGEST_WORKERS):
+    """
+    Đọc và chuẩn hoá song song nhiều sheet của workbook, mỗi process đọc lần lượt từng sheet
+
+    Trả về (iterator các khối đã chuẩn hoá, báo cáo từng sheet). Các khối được đưa về ngay khi đọc
+    xong (không gom cả sheet), mỗi khối có cột SOURCE_ORDER_COLUMN là vị trí sheet để thứ tự dòng
+    không phụ thuộc process nào đọc nhanh hơn. Báo cáo được điền dần khi duyệt iterator.
+
+    Sheet lỗi được ghi lỗi vào báo cáo với 0 dòng, các sheet khác vẫn được đọc tiếp. Khối của
+    sheet lỗi giữa chừng đã được đưa đi: bên ghi phải bỏ chúng theo failed_sources(report)
+    (vd. upsert_dataframe_chunks(..., discard=lambda: failed_sources(report))).
+    """
+    from database import SOURCE_ORDER_COLUMN
+
+    data = _rewind(file).read()
+    file_name = str(getattr(file, "name", "upload.xlsx"))
+    if sheet_names is None:
+        source = io.BytesIO(data)
+        source.name = file_name
+        sheet_names = list_sheet_names(source)
+    sheet_names = list(sheet_names)
+
+    report = [{"sheet": name, "rows_read": 0, "rows": 0, "seconds": 0.0, "error": None}
+              for name in sheet_names]
+
+    def chunks():
+        workers = max(1, min(max_workers, len(sheet_names)))
+        if workers == 1:
+            # Một sheet (hoặc một CPU): đọc ngay trong process hiện tại
+            messages = (message for order, name in enumerate(sheet_names)
+                        for message in _iter_sheet(data, file_name, order, name))
+        else:
+            messages = _iter_sheets_parallel(data, file_name, sheet_names, workers)
+        for kind, order, payload, rows_read in messages:
+            entry = report[order]
+            entry["rows_read"] = rows_read
+            if kind == "chunk":
+                entry["rows"] += len(payload)
+                payload[SOURCE_ORDER_COLUMN] = order
+                yield payload
+            elif kind == "done":
+                entry["seconds"] = round(payload, 3)
+            else:
+                # Các khối đã gửi của sheet này bị bỏ khi ghi, không lưu nửa sheet
+                entry["error"] = payload
+                entry["rows"] = 0
+
+    return chunks(), report
+
+def failed_sources(report):
+    """Giá trị SOURCE_ORDER_COLUMN (vị trí sheet) của các sheet lỗi trong báo cáo của ingest_workbook"""
+    return [order for order, entry in enumerate(report) if entry["error"]]
@@ -0,0 +1,419 @@
+import csv
+import glob
+import html
+import os
+import re
+import shutil
+import tempfile
+import time
+import uuid
+import weakref
+import zipfile
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from database import load_page
+from utils.calculations import calculate_totals
+from utils.schema import EXCEL_EPOCH
+
+# Số dòng mỗi khối khi xuất file
+EXPORT_CHUNK_ROWS = 50_000
+
+# Tiền tố tên file xuất (dùng khi dọn file cũ)
+EXPORT_PREFIX = "checkstock-"
+
+# Thư mục static của app (server.enableStaticServing): file xuất được tải thẳng từ đĩa qua
+# /app/static/exports/<thư mục ngẫu nhiên>/..., không đọc vào bộ nhớ của server
+EXPORT_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "static", "exports")
+EXPORT_URL = "app/static/exports"
+
+# Kích thước tối đa Streamlit phục vụ qua route static (byte)
+STATIC_MAX_BYTES = 200 * 1024 * 1024
+
+# Khi không bật static serving: st.download_button đọc cả file vào bộ nhớ, chỉ dùng tới mức này (byte)
+DOWNLOAD_MAX_BYTES = 50 * 1024 * 1024
+
+# File xuất cũ hơn mức này bị xoá khi dọn (giây), phòng khi session không kết thúc bình thường
+EXPORT_MAX_AGE = 3600
+
+# Số dòng tối đa của một sheet Excel (tính cả dòng tiêu đề)
+EXCEL_MAX_ROWS = 1_048_576
+
+# Nhãn của dòng tổng cuối file
+TOTAL_LABEL = "TỔNG CỘNG"
+
+# Số dòng dựng XML mỗi lần (chuỗi XML trung gian lớn hơn dữ liệu nhiều lần)
+XLSX_BATCH_ROWS = 10_000
+
+# Mức nén zip của file xlsx (thấp: ghi nhanh, file lớn hơn một chút)
+XLSX_COMPRESS_LEVEL = 1
+
+# Ký tự điều khiển không hợp lệ trong XML
+INVALID_XML_CHARS = r"[\x00-\x08\x0b\x0c\x0e-\x1f]"
+
+# Namespace dùng trong các phần của file xlsx
+XLSX_REL = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+XLSX_CT = "application/vnd.openxmlformats-officedocument.spreadsheetml"
+
+XML_DECLARATION = '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+
+# Đầu và cuối XML của một sheet, các dòng ghi vào giữa
+XLSX_SHEET_START = (
+    XML_DECLARATION + '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>\n'
+).encode("utf-8")
+XLSX_SHEET_END = b"</sheetData></worksheet>"
+
+# Style của ô: 0 mặc định, 1 ngày, 2 ngày giờ
+XLSX_DATE_STYLE = 1
+XLSX_DATETIME_STYLE = 2
+XLSX_STYLES = (
+    '<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+    '<numFmts count="2"><numFmt numFmtId="164" formatCode="yyyy-mm-dd"/>'
+    '<numFmt numFmtId="165" formatCode="yyyy-mm-dd hh:mm:ss"/></numFmts>'
+    '<fonts count="1"><font><sz val="11"/><name val="Calibri"/></font></fonts>'
+    '<fills count="2"><fill><patternFill patternType="none"/></fill>'
+    '<fill><patternFill patternType="gray125"/></fill></fills>'
+    '<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>'
+    '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+    '<cellXfs count="3"><xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>'
+    '<xf numFmtId="164" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/>'
+    '<xf numFmtId="165" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/></cellXfs>'
+    '<cellStyles count="1"><cellStyle name="Normal" xfId="0" builtinId="0"/></cellStyles>'
+    "</styleSheet>"
+)
+
+# Định dạng file hỗ trợ: (đuôi file, MIME type)
+EXPORT_FORMATS = {
+    "Excel": ("xlsx", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"),
+    "CSV": ("csv", "text/csv"),
+}
+
+def iter_dataframe_chunks(df, chunk_rows=EXPORT_CHUNK_ROWS):
+    """Chia DataFrame đã có trong bộ nhớ thành các khối liên tiếp (slice, không copy)"""
+    for start in range(0, len(df), chunk_rows):
+        yield df.iloc[start:start + chunk_rows]
+
+def iter_table_chunks(table="inventory", filters=None, sort_by="ngay_nhap", descending=True,
+                      chunk_rows=EXPORT_CHUNK_ROWS):
+    """Đọc một bảng SQLite theo từng khối bằng keyset (cùng bộ lọc/thứ tự với bảng phân trang)"""
+    after = None
+    while True:
+        chunk, after = load_page(table, filters, sort_by, descending, chunk_rows, after)
+        if not chunk.empty:
+            yield chunk
+        if after is None:
+            return
+
+def _add_totals(totals, chunk_totals):
+    for col, value in chunk_totals.items():
+        totals[col] = totals.get(col, 0) + value
+    return totals
+
+def _total_row(columns, totals):
+    """Dòng tổng: nhãn ở cột đầu tiên không được cộng, tổng ở đúng cột"""
+    label_col = next((col for col in columns if col not in totals), None)
+    return [TOTAL_LABEL if col == label_col else totals.get(col) for col in columns]
+
+def write_csv(chunks, path, totals=calculate_totals):
+    """
+    Ghi các khối vào file CSV (UTF-8 có BOM để Excel đọc đúng tiếng Việt)
+
+    Mỗi khối được ghi xong rồi bỏ, bộ nhớ chỉ giữ một khối. Trả về (số dòng, tổng).
+    """
+    rows, summed, columns = 0, {}, None
+    with open(path, "w", encoding="utf-8-sig", newline="") as f:
+        for chunk in chunks:
+            if columns is None:
+                columns = list(chunk.columns)
+            chunk.to_csv(f, header=rows == 0, index=False)
+            rows += len(chunk)
+            _add_totals(summed, totals(chunk))
+        if columns is not None and summed:
+            csv.writer(f).writerow(_total_row(columns, summed))
+    return rows, summed
+
+def _xml_escape(text):
+    """Escape một chuỗi cho XML"""
+    text = re.sub(INVALID_XML_CHARS, "", str(text))
+    return text.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+
+def _xml_text(series):
+    """Escape chuỗi cho XML và bỏ các ký tự điều khiển XML không cho phép"""
+    return (series.str.replace(INVALID_XML_CHARS, "", regex=True)
+            .str.replace("&", "&amp;", regex=False)
+            .str.replace("<", "&lt;", regex=False)
+            .str.replace(">", "&gt;", regex=False))
+
+def _xlsx_cells(series):
+    """XML các ô của một cột (mỗi dòng một chuỗi); ô trống là <c/>"""
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        series = series.astype(object)
+    if pd.api.types.is_bool_dtype(series):
+        cells = '<c t="b"><v>' + series.astype("Int8").astype(str) + "</v></c>"
+    elif pd.api.types.is_datetime64_any_dtype(series):
+        if series.dt.tz is not None:
+            # Excel không lưu múi giờ
+            series = series.dt.tz_localize(None)
+        # Ngày lưu dạng số serial; cột chỉ có ngày (không có giờ) dùng định dạng ngày
+        dates = series.dropna()
+        style = XLSX_DATE_STYLE if (dates == dates.dt.normalize()).all() else XLSX_DATETIME_STYLE
+        serial = (series - pd.Timestamp(EXCEL_EPOCH)) / pd.Timedelta(days=1)
+        cells = f'<c s="{style}"><v>' + serial.astype(str) + "</v></c>"
+    elif pd.api.types.is_numeric_dtype(series):
+        values = series.astype("float64")
+        cells = "<c><v>" + series.astype(str) + "</v></c>"
+        # NaN và vô cực đều thành ô trống
+        cells = cells.where(np.isfinite(values.to_numpy(na_value=np.nan)))
+    else:
+        text = series.astype(object).where(series.notna(), "").astype(str)
+        cells = '<c t="inlineStr"><is><t xml:space="preserve">' + _xml_text(text) + "</t></is></c>"
+    # Ô thiếu phải là <c/>: một giá trị NaN làm cả dòng bị bỏ khi ghép chuỗi
+    return cells.where(series.notna(), "<c/>").fillna("<c/>").astype(str)
+
+def _xlsx_row(values):
+    """XML một dòng từ danh sách giá trị Python (tiêu đề, dòng tổng)"""
+    cells = []
+    for value in values:
+        if value is None or (isinstance(value, float) and not np.isfinite(value)):
+            cells.append("<c/>")
+        elif isinstance(value, (int, float, np.number)) and not isinstance(value, (bool, np.bool_)):
+            cells.append(f"<c><v>{value}</v></c>")
+        else:
+            cells.append(f'<c t="inlineStr"><is><t xml:space="preserve">{_xml_escape(value)}</t></is></c>')
+    return "<row>" + "".join(cells) + "</row>\n"
+
+def _xlsx_rows(chunk):
+    """XML các dòng của một khối, ghép theo cột bằng phép toán chuỗi vector hoá"""
+    rows = pd.Series("<row>", index=chunk.index, dtype="str")
+    for col in chunk.columns:
+        rows = rows + _xlsx_cells(chunk[col])
+    return (rows + "</row>\n").str.cat()
+
+def _xlsx_parts(sheet_names):
+    """Các phần cố định của file xlsx (workbook, quan hệ, style) cho các sheet đã ghi"""
+    sheets = "".join(
+        f'<sheet name="{_xml_escape(name)}" sheetId="{i}" r:id="rId{i}"/>'
+        for i, name in enumerate(sheet_names, 1)
+    )
+    sheet_rels = "".join(
+        f'<Relationship Id="rId{i}" Type="{XLSX_REL}/worksheet" Target="worksheets/sheet{i}.xml"/>'
+        for i in range(1, len(sheet_names) + 1)
+    )
+    sheet_types = "".join(
+        f'<Override PartName="/xl/worksheets/sheet{i}.xml" ContentType="{XLSX_CT}.worksheet+xml"/>'
+        for i in range(1, len(sheet_names) + 1)
+    )
+    return {
+        "[Content_Types].xml": (
+            '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+            '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+            '<Default Extension="xml" ContentType="application/xml"/>'
+            f'<Override PartName="/xl/workbook.xml" ContentType="{XLSX_CT}.sheet.main+xml"/>'
+            f'<Override PartName="/xl/styles.xml" ContentType="{XLSX_CT}.styles+xml"/>'
+            f"{sheet_types}</Types>"
+        ),
+        "_rels/.rels": (
+            '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+            f'<Relationship Id="rId1" Type="{XLSX_REL}/officeDocument" Target="xl/workbook.xml"/>'
+            "</Relationships>"
+        ),
+        "xl/workbook.xml": (
+            '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+            'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+            f"<sheets>{sheets}</sheets></workbook>"
+        ),
+        "xl/_rels/workbook.xml.rels": (
+            '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+            f"{sheet_rels}"
+            f'<Relationship Id="rId{len(sheet_names) + 1}" Type="{XLSX_REL}/styles" Target="styles.xml"/>'
+            "</Relationships>"
+        ),
+        "xl/styles.xml": XLSX_STYLES,
+    }
+
+def write_xlsx(chunks, path, totals=calculate_totals, sheet_title="Data"):
+    """
+    Ghi các khối vào file Excel (.xlsx) theo kiểu streaming
+
+    XML của mỗi sheet được ghi thẳng vào file zip khi đọc từng khối, bộ nhớ chỉ giữ một khối.
+    Quá giới hạn dòng của Excel thì sang sheet mới (lặp lại tiêu đề). Trả về (số dòng, tổng).
+    """
+    rows, summed, columns = 0, {}, None
+    sheet_names = []
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED, compresslevel=XLSX_COMPRESS_LEVEL) as zf:
+        sheet, sheet_rows = None, 0
+
+        def new_sheet():
+            nonlocal sheet, sheet_rows
+            if sheet is not None:
+                sheet.write(XLSX_SHEET_END)
+                sheet.close()
+            sheet_names.append(sheet_title if not sheet_names else f"{sheet_title} {len(sheet_names) + 1}")
+            sheet = zf.open(f"xl/worksheets/sheet{len(sheet_names)}.xml", "w", force_zip64=True)
+            sheet.write(XLSX_SHEET_START)
+            sheet_rows = 0
+            if columns is not None:
+                sheet.write(_xlsx_row(columns).encode("utf-8"))
+                sheet_rows = 1
+
+        for chunk in chunks:
+            if columns is None:
+                columns = [str(col) for col in chunk.columns]
+            _add_totals(summed, totals(chunk))
+            rows += len(chunk)
+            start = 0
+            while start < len(chunk):
+                if sheet is None or sheet_rows >= EXCEL_MAX_ROWS:
+                    new_sheet()
+                part = chunk.iloc[start:start + min(XLSX_BATCH_ROWS, EXCEL_MAX_ROWS - sheet_rows)]
+                sheet.write(_xlsx_rows(part).encode("utf-8"))
+                sheet_rows += len(part)
+                start += len(part)
+
+        if sheet is None or (summed and sheet_rows >= EXCEL_MAX_ROWS):
+            new_sheet()
+        if columns is not None and summed:
+            sheet.write(_xlsx_row(_total_row(columns, summed)).encode("utf-8"))
+        sheet.write(XLSX_SHEET_END)
+        sheet.close()
+
+        for name, xml in _xlsx_parts(sheet_names).items():
+            zf.writestr(name, XML_DECLARATION + xml)
+    return rows, summed
+
+def export_file(chunks, fmt="Excel", totals=calculate_totals, directory=None):
+    """Ghi các khối ra một file tạm theo định dạng fmt; trả về (đường dẫn, số dòng)"""
+    extension, _ = EXPORT_FORMATS[fmt]
+    fd, path = tempfile.mkstemp(prefix=EXPORT_PREFIX, suffix=f".{extension}", dir=directory)
+    os.close(fd)
+    try:
+        writer = write_xlsx if extension == "xlsx" else write_csv
+        rows, _ = writer(chunks, path, totals)
+    except Exception:
+        os.remove(path)
+        raise
+    return path, rows
+
+def _remove_export(path):
+    """Xoá file xuất và thư mục ngẫu nhiên chứa nó trong EXPORT_DIR (nếu có)"""
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+    parent = os.path.dirname(path)
+    if os.path.dirname(parent) == EXPORT_DIR:
+        shutil.rmtree(parent, ignore_errors=True)
+
+def cleanup_exports(max_age=EXPORT_MAX_AGE, now=None):
+    """Xoá các file xuất cũ hơn max_age giây (trong EXPORT_DIR và thư mục tạm); trả về số file đã xoá"""
+    now = time.time() if now is None else now
+    removed = 0
+    for path in (glob.glob(os.path.join(EXPORT_DIR, "*", EXPORT_PREFIX + "*"))
+                 + glob.glob(os.path.join(tempfile.gettempdir(), EXPORT_PREFIX + "*"))):
+        try:
+            expired = now - os.path.getmtime(path) > max_age
+        except OSError:
+            continue
+        if expired:
+            _remove_export(path)
+            removed += 1
+    return removed
+
+class ExportFile:
+    """
+    File xuất của một session
+
+    Giữ trong st.session_state: file bị xoá khi discard(), hoặc khi session kết thúc và state bị
+    thu hồi (weakref.finalize); cleanup_exports() dọn nốt file còn sót theo tuổi.
+    """
+
+    def __init__(self, path, rows, fmt):
+        self.path = path
+        self.rows = rows
+        self.format = fmt
+        self._finalizer = weakref.finalize(self, _remove_export, path)
+
+    @property
+    def size(self):
+        return os.path.getsize(self.path)
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def discard(self):
+        self._finalizer()
+
+def _discard(state):
+    export = state.pop("file", None)
+    if export is not None:
+        export.discard()
+
+def _static_serving():
+    return bool(st.get_option("server.enableStaticServing"))
+
+def _static_directory():
+    """Thư mục con ngẫu nhiên (không đoán được) trong EXPORT_DIR cho một file xuất"""
+    directory = os.path.join(EXPORT_DIR, uuid.uuid4().hex)
+    os.makedirs(directory)
+    return directory
+
+def _download_link(export, file_name):
+    url = "/".join([EXPORT_URL] + os.path.relpath(export.path, EXPORT_DIR).split(os.sep))
+    name = html.escape(file_name)
+    return f'<a href="{html.escape(url)}" download="{name}">⬇️ Tải {name} ({export.rows:,} dòng)</a>'
+
+def export_button(key, chunks_factory, file_stem, signature=None, totals=calculate_totals):
+    """
+    Xuất báo cáo ra Excel/CSV và cho tải về
+
+    chunks_factory() trả về iterator các khối DataFrame; file chỉ được tạo khi bấm nút, ghi ra
+    đĩa theo từng khối và bị xoá khi dữ liệu (signature) đổi, khi tạo file mới hoặc khi session
+    kết thúc. Khi bật static serving, file được tải thẳng từ đĩa; nếu không, st.download_button
+    chỉ dùng cho file tới DOWNLOAD_MAX_BYTES.
+    """
+    state = st.session_state.setdefault(f"{key}_export", {})
+    if state.get("signature") != signature:
+        _discard(state)
+        state["signature"] = signature
+
+    col_format, col_prepare, col_download = st.columns([1, 1, 2])
+    with col_format:
+        fmt = st.selectbox("Định dạng", list(EXPORT_FORMATS), key=f"{key}_export_format",
+                           label_visibility="collapsed")
+    with col_prepare:
+        if st.button("📄 Tạo file xuất", key=f"{key}_export_prepare"):
+            _discard(state)
+            cleanup_exports()
+            directory = None
+            try:
+                directory = _static_directory() if _static_serving() else None
+                with st.spinner("Đang ghi file..."):
+                    path, rows = export_file(chunks_factory(), fmt, totals, directory)
+                state["file"] = ExportFile(path, rows, fmt)
+            except Exception as e:
+                if directory:
+                    shutil.rmtree(directory, ignore_errors=True)
+                st.error(f"Lỗi khi xuất file: {e}")
+
+    export = state.get("file")
+    if export is None or not export.exists():
+        return
+    extension, mime = EXPORT_FORMATS[export.format]
+    file_name = f"{file_stem}_{datetime.now():%Y%m%d}.{extension}"
+    size = export.size
+    # File trong EXPORT_DIR được tải qua route static, còn lại qua st.download_button
+    served = export.path.startswith(EXPORT_DIR + os.sep)
+    limit = STATIC_MAX_BYTES if served else DOWNLOAD_MAX_BYTES
+    with col_download:
+        if size > limit:
+            st.warning(f"⚠️ File {size / 2 ** 20:,.0f} MB vượt mức tải về {limit / 2 ** 20:,.0f} MB, "
+                       "hãy lọc bớt dữ liệu.")
+        elif served:
+            st.markdown(_download_link(export, file_name), unsafe_allow_html=True)
+        else:
+            with open(export.path, "rb") as f:
+                st.download_button(f"⬇️ Tải {file_name} ({export.rows:,} dòng)", f, file_name=file_name,
+                                   mime=mime, key=f"{key}_export_download")
@@ -0,0 +1,220 @@
+import re
+from collections import Counter
+
+import gspread
+
+# Kích thước lưới mặc định của Google Sheets khi tạo spreadsheet mới
+DEFAULT_ROWS = 1000
+DEFAULT_COLS = 26
+
+_A1_PATTERN = re.compile(r"^([A-Z]*)(\d*)$")
+
+
+def _column_index(letters):
+    """Đổi chữ cột (A, B, ..., AA) thành chỉ số bắt đầu từ 1"""
+    index = 0
+    for char in letters:
+        index = index * 26 + (ord(char) - ord("A") + 1)
+    return index
+
+
+def _parse_cell(cell):
+    """Tách một ô A1 thành (row, col); phần thiếu trả về None"""
+    match = _A1_PATTERN.match(cell.upper())
+    if not match:
+        raise ValueError(f"Range không hợp lệ: {cell}")
+    letters, digits = match.groups()
+    row = int(digits) if digits else None
+    col = _column_index(letters) if letters else None
+    return row, col
+
+
+class FakeWorksheet:
+    """Worksheet giả lập trong bộ nhớ, đếm số request như một worksheet gspread thật"""
+
+    def __init__(self, title="Inventory", rows=DEFAULT_ROWS, cols=DEFAULT_COLS):
+        self.title = title
+        self.row_count = int(rows)
+        self.col_count = int(cols)
+        self.cells = []
+        self.calls = Counter()
+
+    # ----- Tiện ích nội bộ -----
+    def _data_height(self):
+        return len(self.cells)
+
+    def _data_width(self):
+        return max((len(row) for row in self.cells), default=0)
+
+    def _resolve_range(self, range_name):
+        """Trả về (row_start, col_start, row_end, col_end), các đầu mở dùng hết dữ liệu"""
+        if "!" in range_name:
+            range_name = range_name.split("!", 1)[1]
+        start, _, end = range_name.partition(":")
+        row_start, col_start = _parse_cell(start)
+        row_end, col_end = _parse_cell(end) if end else (row_start, col_start)
+        row_start = row_start or 1
+        col_start = col_start or 1
+        row_end = row_end or max(self._data_height(), row_start)
+        col_end = col_end or max(self._data_width(), col_start)
+        return row_start, col_start, row_end, col_end
+
+    def _write(self, row_start, col_start, values):
+        for offset, row_values in enumerate(values):
+            row_index = row_start - 1 + offset
+            while len(self.cells) <= row_index:
+                self.cells.append([])
+            row = self.cells[row_index]
+            needed = col_start - 1 + len(row_values)
+            if len(row) < needed:
+                row.extend([""] * (needed - len(row)))
+            row[col_start - 1:needed] = list(row_values)
+
+    def _trim(self):
+        while self.cells and not any(v != "" for v in self.cells[-1]):
+            self.cells.pop()
+
+    # ----- API tương thích gspread -----
+    def clear(self):
+        self.calls["clear"] += 1
+        self.cells = []
+
+    def resize(self, rows=None, cols=None):
+        self.calls["resize"] += 1
+        if rows is not None:
+            self.row_count = int(rows)
+            del self.cells[self.row_count:]
+        if cols is not None:
+            self.col_count = int(cols)
+            self.cells = [row[:self.col_count] for row in self.cells]
+
+    def update(self, values=None, range_name=None, **kwargs):
+        self.calls["update"] += 1
+        # Hỗ trợ cả thứ tự tham số cũ update(range_name, values)
+        if isinstance(values, str):
+            values, range_name = range_name, values
+        self._apply_update(range_name or "A1", values)
+
+    def _apply_update(self, range_name, values):
+        row_start, col_start, _, _ = self._resolve_range(range_name)
+        row_end = row_start + len(values) - 1
+        col_end = col_start + max((len(row) for row in values), default=1) - 1
+        if row_end > self.row_count or col_end > self.col_count:
+            raise gspread.exceptions.GSpreadException(
+                f"Range {range_name} vượt quá kích thước lưới {self.row_count}x{self.col_count}"
+            )
+        self._write(row_start, col_start, values)
+
+    def batch_update(self, data, **kwargs):
+        self.calls["batch_update"] += 1
+        for item in data:
+            self._apply_update(item["range"], item["values"])
+
+    def append_rows(self, values, **kwargs):
+        self.calls["append_rows"] += 1
+        self._append(values)
+
+    def append_row(self, values, **kwargs):
+        self.calls["append_row"] += 1
+        self._append([values])
+
+    def _append(self, values):
+        self._trim()
+        start = self._data_height() + 1
+        # Append trên Sheets tự mở rộng lưới khi cần
+        self.row_count = max(self.row_count, start + len(values) - 1)
+        self.col_count = max(self.col_count, max((len(row) for row in values), default=0))
+        self._write(start, 1, values)
+
+    def get_all_values(self, **kwargs):
+        self.calls["get_all_values"] += 1
+        return self._all_values()
+
+    def _all_values(self):
+        width = self._data_width()
+        return [list(row) + [""] * (width - len(row)) for row in self.cells]
+
+    def get_all_records(self, **kwargs):
+        self.calls["get_all_records"] += 1
+        values = self._all_values()
+        if not values:
+            return []
+        headers = values[0]
+        return [dict(zip(headers, row)) for row in values[1:]]
+
+    def get(self, range_name=None, **kwargs):
+        self.calls["get"] += 1
+        return self._read(range_name or "A1:")
+
+    def batch_get(self, ranges, **kwargs):
+        self.calls["batch_get"] += 1
+        return [self._read(range_name) for range_name in ranges]
+
+    def _read(self, range_name):
+        row_start, col_start, row_end, col_end = self._resolve_range(range_name)
+        result = [
+            list(row[col_start - 1:col_end])
+            for row in self.cells[row_start - 1:row_end]
+        ]
+        # Sheets bỏ các ô trống ở cuối mỗi dòng và các dòng trống ở cuối
+        result = [row[:max((i + 1 for i, v in enumerate(row) if v != ""), default=0)] for row in result]
+        while result and not result[-1]:
+            result.pop()
+        return result
+
+    def row_values(self, row, **kwargs):
+        self.calls["row_values"] += 1
+        if row > self._data_height():
+            return []
+        values = list(self.cells[row - 1])
+        while values and values[-1] == "":
+            values.pop()
+        return values
+
+    def col_values(self, col, **kwargs):
+        self.calls["col_values"] += 1
+        values = [row[col - 1] if len(row) >= col else "" for row in self.cells]
+        while values and values[-1] == "":
+            values.pop()
+        return values
+
+    @property
+    def request_count(self):
+        """Tổng số request đã gửi tới worksheet"""
+        return sum(self.calls.values())
+
+
+class FakeSpreadsheet:
+    """Spreadsheet giả lập chứa các FakeWorksheet"""
+
+    def __init__(self):
+        self.worksheets = {}
+
+    def worksheet(self, title):
+        if title not in self.worksheets:
+            raise gspread.WorksheetNotFound(title)
+        return self.worksheets[title]
+
+    def add_worksheet(self, title, rows=DEFAULT_ROWS, cols=DEFAULT_COLS, **kwargs):
+        worksheet = FakeWorksheet(title, rows=rows, cols=cols)
+        self.worksheets[title] = worksheet
+        return worksheet
+
+
+class FakeClient:
+    """Client gspread giả lập, mỗi sheet_id ứng với một FakeSpreadsheet"""
+
+    def __init__(self):
+        self.spreadsheets = {}
+
+    def open_by_key(self, key):
+        return self.spreadsheets.setdefault(key, FakeSpreadsheet())
+
+
+def attach_fake_backend(manager, sheet_id="fake-sheet"):
+    """Gắn backend giả lập vào GoogleSheetsManager để chạy không cần mạng"""
+    manager.client = FakeClient()
+    manager.sheet_id = sheet_id
+    manager.sheet = manager.client.open_by_key(sheet_id)
+    manager._worksheets = {}
+    return manager.sheet
@@ -0,0 +1,81 @@
+import numpy as np
+import pandas as pd
+
+from data.aging import AGING_BUCKETS
+from utils.ledger import BALANCE_UNITS, LEDGER_KEYS, chronological_order, group_codes, numeric_column
+
+# Cột kết quả của fifo_lots
+LOT_COLUMNS = ['Name', 'Lock', 'Ngày nhập', 'Nhập (Bag)', 'Còn lại (Bag)', 'Nhập (Weight)',
+               'Còn lại (Weight)', 'Tuổi lưu kho', 'Nhóm tuổi']
+
+# Kiểu categorical có thứ tự của cột Nhóm tuổi
+AGE_BUCKET_DTYPE = pd.CategoricalDtype([label for _, _, label in AGING_BUCKETS], ordered=True)
+
+def age_buckets(ages):
+    """Nhóm tuổi theo AGING_BUCKETS cho mảng số ngày"""
+    edges = [low for low, _, _ in AGING_BUCKETS[1:]]
+    codes = np.searchsorted(edges, np.asarray(ages), side='right')
+    return pd.Categorical.from_codes(codes, dtype=AGE_BUCKET_DTYPE)
+
+def fifo_lots(df, as_of=None):
+    """
+    Các lô còn tồn theo FIFO tại ngày as_of (mặc định hôm nay), theo (Name, Lock)
+
+    Mỗi dòng có Nhập là một lô; Tồn đầu của giao dịch sớm nhất mỗi nhóm là lô mở đầu. Tổng
+    Sử dụng U đến as_of tiêu hao các lô từ cũ đến mới, nên lô i còn lại
+    clip(cumR_i - U, 0, qty_i) với cumR là tổng nhập cộng dồn của nhóm (một lượt cumsum,
+    không lặp qua từng dòng). Giả định tồn kho không âm tại mọi thời điểm.
+    """
+    if df.empty or not all(col in df.columns for col in LEDGER_KEYS + ['Ngày nhập']):
+        return pd.DataFrame(columns=LOT_COLUMNS)
+
+    as_of = pd.Timestamp(as_of if as_of is not None else pd.Timestamp.now()).normalize()
+    dates = df['Ngày nhập']
+    if not pd.api.types.is_datetime64_any_dtype(dates):
+        dates = pd.to_datetime(dates, errors='coerce')
+    # Giao dịch sau as_of (hoặc không có ngày) không được tính
+    in_range = (dates < as_of + pd.Timedelta(days=1)).to_numpy()
+    df = df[in_range]
+    dates = dates[in_range].to_numpy(dtype='datetime64[ns]')
+    if df.empty:
+        return pd.DataFrame(columns=LOT_COLUMNS)
+
+    # Sắp theo thời gian rồi gom từng nhóm thành khối liên tục (stable nên giữ thứ tự thời gian)
+    order = chronological_order(df)
+    codes = group_codes(df)
+    order = order[np.argsort(codes[order], kind='stable')]
+    groups = codes[order]
+    first = np.r_[True, groups[1:] != groups[:-1]]
+
+    result = {}
+    is_lot = np.zeros(len(order), dtype=bool)
+    for unit, (opening_col, import_col, usage_col, _) in BALANCE_UNITS.items():
+        qty = np.nan_to_num(numeric_column(df, import_col)[order])
+        qty = np.clip(qty + np.where(first, np.nan_to_num(numeric_column(df, opening_col)[order]), 0), 0, None)
+        used = np.bincount(groups, weights=np.nan_to_num(numeric_column(df, usage_col)[order]))[groups]
+        received = pd.Series(qty).groupby(groups, sort=False).cumsum().to_numpy()
+        result[unit] = (qty, np.clip(received - used, 0, qty))
+        is_lot |= result[unit][1] > 0
+
+    positions = order[is_lot]
+    ages = ((as_of.to_datetime64() - dates[positions]) // np.timedelta64(1, 'D')).astype('int64')
+    return pd.DataFrame({
+        'Name': df['Name'].to_numpy()[positions],
+        'Lock': df['Lock'].to_numpy()[positions],
+        'Ngày nhập': dates[positions],
+        'Nhập (Bag)': result['Bag'][0][is_lot],
+        'Còn lại (Bag)': result['Bag'][1][is_lot],
+        'Nhập (Weight)': result['Weight'][0][is_lot],
+        'Còn lại (Weight)': result['Weight'][1][is_lot],
+        'Tuổi lưu kho': ages,
+        'Nhóm tuổi': age_buckets(ages),
+    })
+
+def aging_summary(lots):
+    """Tổng số lượng còn lại theo nhóm tuổi (đủ mọi nhóm, kể cả nhóm rỗng)"""
+    buckets = lots['Nhóm tuổi'].astype(AGE_BUCKET_DTYPE)
+    return (
+        lots.groupby(buckets, observed=False)[['Còn lại (Bag)', 'Còn lại (Weight)']]
+        .sum()
+        .reset_index()
+    )
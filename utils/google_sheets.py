@@ -1,9 +1,126 @@
-import gspread
+import numpy as np
 import pandas as pd
-from google.oauth2.service_account import Credentials
 import streamlit as st
 from datetime import datetime
+from functools import wraps
 import os
+import threading
+
+from utils.data_cache import data_cache, SHEETS_NAMESPACE
+from utils.instrumentation import instrumented
+from utils.sheets_scheduler import sheets_scheduler
+
+# Cột chuẩn của worksheet Inventory
+INVENTORY_HEADERS = [
+    "ID", "Ngày nhập", "Name", "Lock",
+    "Tồn đầu (Bag)", "Tồn đầu (Weight)",
+    "Nhập (Bag)", "Nhập (Weight)",
+    "Sử dụng (Bag)", "Sử dụng (Weight)",
+    "Tồn cuối (Bag)", "Tồn cuối (Weight)",
+    "Trung bình", "Tuổi lưu kho",
+    "Code/NCC", "Ngày công thức", "Ngày sản xuất",
+    "Created_At", "Updated_At"
+]
+
+# Số dòng tối đa cho mỗi request ghi hàng loạt
+BULK_CHUNK_SIZE = 5000
+
+# Tỷ lệ dòng bị sửa tối đa để còn đồng bộ tăng dần (vượt quá thì tải lại toàn bộ)
+DELTA_MAX_CHANGED_RATIO = 0.2
+
+# Các cột ngày cần parse khi đọc từ Google Sheets
+DATE_COLUMNS = ['Ngày nhập', 'Ngày công thức', 'Ngày sản xuất']
+
+def to_cell_value(value):
+    """Chuyển một giá trị Python/numpy/pandas thành giá trị ô hợp lệ cho Google Sheets"""
+    if isinstance(value, np.datetime64):
+        value = pd.Timestamp(value)
+    if value is None or (not isinstance(value, (str, list, tuple, dict)) and pd.isna(value)):
+        return ''
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, datetime):
+        # Ngày không có giờ được ghi dạng YYYY-MM-DD như dữ liệu nhập tay
+        if value == datetime(value.year, value.month, value.day):
+            return value.strftime('%Y-%m-%d')
+        return value.isoformat()
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return value
+
+def build_transaction_row(transaction_data, row_id=""):
+    """Tạo dòng dữ liệu (theo INVENTORY_HEADERS) cho một transaction mới (ID do log giao dịch cấp)"""
+    now = datetime.now().isoformat()
+    row_data = [
+        str(row_id),
+        transaction_data.get('Ngày nhập', ''),
+        transaction_data.get('Name', ''),
+        transaction_data.get('Lock', ''),
+        transaction_data.get('Tồn đầu (Bag)', 0),
+        transaction_data.get('Tồn đầu (Weight)', 0),
+        transaction_data.get('Nhập (Bag)', 0),
+        transaction_data.get('Nhập (Weight)', 0),
+        transaction_data.get('Sử dụng (Bag)', 0),
+        transaction_data.get('Sử dụng (Weight)', 0),
+        transaction_data.get('Tồn cuối (Bag)', 0),
+        transaction_data.get('Tồn cuối (Weight)', 0),
+        transaction_data.get('Trung bình', ''),
+        transaction_data.get('Tuổi lưu kho', ''),
+        transaction_data.get('Code/NCC', ''),
+        transaction_data.get('Ngày công thức', ''),
+        transaction_data.get('Ngày sản xuất', ''),
+        now,  # Created_At
+        now   # Updated_At
+    ]
+    return [to_cell_value(value) for value in row_data]
+
+def parse_date_columns(df):
+    """Parse các cột ngày của dữ liệu inventory"""
+    for col in DATE_COLUMNS:
+        if col in df.columns:
+            df[col] = pd.to_datetime(df[col], errors='coerce')
+    return df
+
+def _column_letter(index):
+    """Chữ cái của cột thứ index (bắt đầu từ 1)"""
+    from gspread.utils import rowcol_to_a1
+    return rowcol_to_a1(1, index)[:-1]
+
+def _column_values(value_range):
+    """Làm phẳng kết quả đọc một cột (mỗi dòng là list 0 hoặc 1 phần tử) thành list chuỗi"""
+    return [str(row[0]) if row else '' for row in value_range]
+
+def rows_to_dataframe(header, rows, index=None):
+    """Tạo DataFrame từ các dòng giá trị thô, numericise giống get_all_records"""
+    from gspread.utils import numericise_all
+    width = len(header)
+    rows = [
+        numericise_all(list(row[:width]) + [''] * (width - len(row)))
+        for row in rows
+    ]
+    return pd.DataFrame(rows, columns=header, index=index)
+
+def dataframe_to_values(df):
+    """Chuyển DataFrame thành list các dòng giá trị có thể gửi lên Google Sheets"""
+    columns = []
+    for col in df.columns:
+        series = df[col]
+        if pd.api.types.is_datetime64_any_dtype(series):
+            series = series.dt.strftime('%Y-%m-%d')
+        elif series.dtype == object:
+            series = series.map(lambda v: v.isoformat() if hasattr(v, 'isoformat') and not pd.isna(v) else v)
+        columns.append(series.astype(object).where(series.notna(), ''))
+    if not columns:
+        return [[] for _ in range(len(df))]
+    return pd.concat(columns, axis=1).values.tolist()
+
+def _holds_sync_lock(method):
+    """Chạy method dưới khoá của _sync_state (luồng nền và luồng script dùng chung bản sao local)"""
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self._sync_lock:
+            return method(self, *args, **kwargs)
+    return wrapper
 
 class GoogleSheetsManager:
     def __init__(self):
@@ -11,9 +128,28 @@ class GoogleSheetsManager:
         self.sheet_id = None  # Will be set from Streamlit secrets
         self.client = None
         self.sheet = None
+        self.scheduler = sheets_scheduler
+        # Handle worksheet theo tên, tránh tra metadata lại mỗi lần thao tác
+        self._worksheets = {}
+        self._client_lock = threading.Lock()
+        # Bản sao local và watermark cho đồng bộ tăng dần, theo từng worksheet
+        self._sync_state = {}
+        self._sync_lock = threading.RLock()
         
+    @instrumented("sheets.initialize_client")
     def initialize_client(self):
-        """Khởi tạo client Google Sheets"""
+        """Khởi tạo client Google Sheets (một lần cho cả process, các lần gọi sau dùng lại)"""
+        if self.sheet is not None:
+            return True
+        with self._client_lock:
+            if self.sheet is not None:
+                return True
+            return self._connect()
+    
+    def _connect(self):
+        # gspread và google-auth chỉ được tải khi thật sự kết nối
+        import gspread
+        from google.oauth2.service_account import Credentials
         try:
             # Cách 1: Dùng Streamlit secrets (recommended for deployment)
             if 'GOOGLE_CREDENTIALS' in st.secrets and 'SHEET_ID' in st.secrets:
@@ -37,7 +173,8 @@ class GoogleSheetsManager:
                 return False
                 
             # Mở sheet
-            self.sheet = self.client.open_by_key(self.sheet_id)
+            self.sheet = self.scheduler.read(("open", self.sheet_id), lambda: self.client.open_by_key(self.sheet_id))
+            self._worksheets = {}
             st.success("✅ Đã kết nối Google Sheets thành công!")
             return True
             
@@ -45,80 +182,86 @@ class GoogleSheetsManager:
             st.error(f"❌ Lỗi kết nối Google Sheets: {e}")
             return False
     
+    @instrumented("sheets.get_worksheet")
     def get_worksheet(self, worksheet_name="Inventory"):
         """Lấy worksheet theo tên"""
+        from gspread import WorksheetNotFound
         try:
             if not self.sheet:
                 if not self.initialize_client():
                     return None
             
+            worksheet = self._worksheets.get(worksheet_name)
+            if worksheet is not None:
+                return worksheet
+            
             # Thử lấy worksheet có sẵn
             try:
-                worksheet = self.sheet.worksheet(worksheet_name)
-            except gspread.WorksheetNotFound:
+                worksheet = self.scheduler.read(
+                    ("worksheet", self.sheet_id, worksheet_name), lambda: self.sheet.worksheet(worksheet_name)
+                )
+            except WorksheetNotFound:
                 # Nếu không tồn tại, tạo mới
-                worksheet = self.sheet.add_worksheet(
+                worksheet = self.scheduler.write(lambda: self.sheet.add_worksheet(
                     title=worksheet_name, 
                     rows="1000", 
                     cols="20"
-                )
+                ), idempotent=False)
                 # Tạo headers
-                headers = [
-                    "ID", "Ngày nhập", "Name", "Lock", 
-                    "Tồn đầu (Bag)", "Tồn đầu (Weight)",
-                    "Nhập (Bag)", "Nhập (Weight)", 
-                    "Sử dụng (Bag)", "Sử dụng (Weight)",
-                    "Tồn cuối (Bag)", "Tồn cuối (Weight)",
-                    "Trung bình", "Tuổi lưu kho",
-                    "Code/NCC", "Ngày công thức", "Ngày sản xuất",
-                    "Created_At", "Updated_At"
-                ]
-                worksheet.append_row(headers)
+                self.scheduler.write(lambda: worksheet.append_row(INVENTORY_HEADERS), idempotent=False)
             
+            self._worksheets[worksheet_name] = worksheet
             return worksheet
             
         except Exception as e:
             st.error(f"❌ Lỗi khi lấy worksheet: {e}")
             return None
     
+    @instrumented("sheets.append_transaction")
     def append_transaction(self, transaction_data, worksheet_name="Inventory"):
-        """Thêm transaction mới vào Google Sheets"""
+        """Thêm transaction mới: ghi vào log giao dịch (cấp ID), outbox đẩy lên Google Sheets"""
         try:
-            worksheet = self.get_worksheet(worksheet_name)
-            if not worksheet:
-                return False
-            
-            # Chuẩn bị dữ liệu row
-            row_data = [
-                str(datetime.now().timestamp()),  # ID unique
-                transaction_data.get('Ngày nhập', ''),
-                transaction_data.get('Name', ''),
-                transaction_data.get('Lock', ''),
-                transaction_data.get('Tồn đầu (Bag)', 0),
-                transaction_data.get('Tồn đầu (Weight)', 0),
-                transaction_data.get('Nhập (Bag)', 0),
-                transaction_data.get('Nhập (Weight)', 0),
-                transaction_data.get('Sử dụng (Bag)', 0),
-                transaction_data.get('Sử dụng (Weight)', 0),
-                transaction_data.get('Tồn cuối (Bag)', 0),
-                transaction_data.get('Tồn cuối (Weight)', 0),
-                transaction_data.get('Trung bình', ''),
-                transaction_data.get('Tuổi lưu kho', ''),
-                transaction_data.get('Code/NCC', ''),
-                transaction_data.get('Ngày công thức', ''),
-                transaction_data.get('Ngày sản xuất', ''),
-                datetime.now().isoformat(),  # Created_At
-                datetime.now().isoformat()   # Updated_At
-            ]
-            
-            # Thêm row mới
-            worksheet.append_row(row_data)
+            from utils.outbox import transaction_outbox
+            transaction_outbox.enqueue(transaction_data, worksheet_name)
+            # Dòng mới chỉ có trong log, bản dữ liệu trong cache chưa có -> tải lại (gộp dòng chờ)
+            data_cache.bump(SHEETS_NAMESPACE.format(worksheet_name))
             return True
             
         except Exception as e:
             st.error(f"❌ Lỗi khi thêm transaction: {e}")
             return False
     
+    @instrumented("sheets.append_rows")
+    def append_rows(self, rows, worksheet_name="Inventory"):
+        """
+        Thêm nhiều dòng đã chuẩn bị sẵn trong một request (ném lỗi để bên gọi retry)
+
+        Không bump cache: các dòng đến từ log giao dịch, vốn đã có trong bản dữ liệu đang cache
+        (gộp từ dòng chờ khi tải hoặc thêm trực tiếp khi lưu); lần sync_data sau tự nhận các dòng này.
+        """
+        worksheet = self.get_worksheet(worksheet_name)
+        if not worksheet:
+            raise RuntimeError(f"Không lấy được worksheet {worksheet_name}")
+        self.scheduler.write(lambda: worksheet.append_rows(rows), idempotent=False)
+        return True
+    
+    @instrumented("sheets.row_ids")
+    def row_ids(self, worksheet_name="Inventory"):
+        """Tập ID đang có trên worksheet (đọc dòng tiêu đề và cột ID; ném lỗi để bên gọi retry)"""
+        worksheet = self.get_worksheet(worksheet_name)
+        if not worksheet:
+            raise RuntimeError(f"Không lấy được worksheet {worksheet_name}")
+        header = self.scheduler.read(self._read_key(worksheet_name, "1:1"), lambda: worksheet.row_values(1))
+        if 'ID' not in header:
+            return set()
+        id_pos = header.index('ID') + 1
+        ids = self.scheduler.read(
+            self._read_key(worksheet_name, "col", id_pos), lambda: worksheet.col_values(id_pos)
+        )
+        return {str(v) for v in ids[1:] if v != ''}
+    
+    @instrumented("sheets.get_all_data")
+    @_holds_sync_lock
     def get_all_data(self, worksheet_name="Inventory"):
         """Lấy tất cả dữ liệu từ Google Sheets"""
         try:
@@ -126,20 +269,26 @@ class GoogleSheetsManager:
             if not worksheet:
                 return pd.DataFrame()
             
-            # Lấy tất cả records
-            records = worksheet.get_all_records()
+            # Lấy tất cả giá trị (một request)
+            values = self.scheduler.read(self._read_key(worksheet_name, "all"), worksheet.get_all_values)
+            self._sync_state.pop(worksheet_name, None)
             
-            if not records:
+            if len(values) < 2:
                 return pd.DataFrame()
             
-            # Chuyển thành DataFrame
-            df = pd.DataFrame(records)
+            # Chuyển thành DataFrame, xử lý datetime columns
+            header, rows = values[0], values[1:]
+            df = parse_date_columns(rows_to_dataframe(header, rows))
             
-            # Xử lý datetime columns
-            date_columns = ['Ngày nhập', 'Ngày công thức', 'Ngày sản xuất']
-            for col in date_columns:
-                if col in df.columns:
-                    df[col] = pd.to_datetime(df[col], errors='coerce')
+            # Lưu watermark: ID và Updated_At của từng dòng
+            if 'ID' in header and 'Updated_At' in header:
+                id_pos, updated_pos = header.index('ID'), header.index('Updated_At')
+                self._sync_state[worksheet_name] = {
+                    'df': df,
+                    'header': header,
+                    'ids': [str(row[id_pos]) if len(row) > id_pos else '' for row in rows],
+                    'updated': [str(row[updated_pos]) if len(row) > updated_pos else '' for row in rows],
+                }
             
             return df
             
@@ -147,24 +296,140 @@ class GoogleSheetsManager:
             st.error(f"❌ Lỗi khi lấy dữ liệu: {e}")
             return pd.DataFrame()
     
-    def update_inventory_data(self, df, worksheet_name="Inventory"):
-        """Cập nhật toàn bộ dữ liệu inventory"""
+    @instrumented("sheets.sync_data")
+    @_holds_sync_lock
+    def sync_data(self, worksheet_name="Inventory"):
+        """Đồng bộ tăng dần: chỉ tải các dòng mới thêm hoặc đã sửa kể từ lần tải trước"""
+        state = self._sync_state.get(worksheet_name)
+        if state is None:
+            return self.get_all_data(worksheet_name)
+        
+        try:
+            worksheet = self.get_worksheet(worksheet_name)
+            if not worksheet:
+                return pd.DataFrame()
+            
+            header = state['header']
+            id_col = _column_letter(header.index('ID') + 1)
+            updated_col = _column_letter(header.index('Updated_At') + 1)
+            last_col = _column_letter(len(header))
+            
+            # Một request: header, cột ID và cột Updated_At
+            watermark_ranges = ["1:1", f"{id_col}2:{id_col}", f"{updated_col}2:{updated_col}"]
+            header_range, id_range, updated_range = self.scheduler.read(
+                self._read_key(worksheet_name, *watermark_ranges), lambda: worksheet.batch_get(watermark_ranges)
+            )
+            remote_header = [str(v) for v in (header_range[0] if header_range else [])]
+            ids = _column_values(id_range)
+            updated = _column_values(updated_range)
+            n_rows = max(len(ids), len(updated))
+            ids += [''] * (n_rows - len(ids))
+            updated += [''] * (n_rows - len(updated))
+            
+            # Thay đổi cấu trúc (header, xoá/chèn/sắp xếp lại dòng) -> tải lại toàn bộ
+            n_cached = len(state['ids'])
+            if remote_header != header or n_rows < n_cached or ids[:n_cached] != state['ids']:
+                return self.get_all_data(worksheet_name)
+            
+            changed = [i for i in range(n_cached) if updated[i] != state['updated'][i]]
+            if len(changed) > DELTA_MAX_CHANGED_RATIO * max(n_cached, 1):
+                return self.get_all_data(worksheet_name)
+            if not changed and n_rows == n_cached:
+                return state['df']
+            
+            # Một request: các dòng đã sửa và các dòng mới ở cuối
+            ranges = [f"A{i + 2}:{last_col}{i + 2}" for i in changed]
+            if n_rows > n_cached:
+                ranges.append(f"A{n_cached + 2}:{last_col}{n_rows + 1}")
+            fetched = self.scheduler.read(
+                self._read_key(worksheet_name, *ranges), lambda: worksheet.batch_get(ranges)
+            )
+            
+            parts = [state['df']]
+            if changed:
+                changed_rows = [value_range[0] if value_range else [] for value_range in fetched[:len(changed)]]
+                parts = [
+                    state['df'].drop(index=changed),
+                    parse_date_columns(rows_to_dataframe(header, changed_rows, index=changed)),
+                ]
+            if n_rows > n_cached:
+                new_rows = list(fetched[-1])
+                new_rows += [[]] * (n_rows - n_cached - len(new_rows))
+                parts.append(parse_date_columns(
+                    rows_to_dataframe(header, new_rows, index=range(n_cached, n_rows))
+                ))
+            
+            df = pd.concat(parts)
+            if changed:
+                df = df.sort_index()
+            
+            state.update(df=df, ids=ids, updated=updated)
+            return df
+            
+        except Exception as e:
+            st.error(f"❌ Lỗi khi đồng bộ dữ liệu: {e}")
+            return pd.DataFrame()
+    
+    def _read_key(self, worksheet_name, *ranges):
+        """Khoá gộp request đọc: cùng sheet, cùng worksheet, cùng range"""
+        return ("read", self.sheet_id, worksheet_name) + ranges
+    
+    @instrumented("sheets.sync_watermark")
+    @_holds_sync_lock
+    def sync_watermark(self, worksheet_name="Inventory"):
+        """(df, header, ids, updated) của lần đồng bộ gần nhất, None nếu chưa đồng bộ"""
+        state = self._sync_state.get(worksheet_name)
+        if state is None:
+            return None
+        return state['df'], state['header'], state['ids'], state['updated']
+    
+    @instrumented("sheets.restore_sync_state")
+    @_holds_sync_lock
+    def restore_sync_state(self, df, header, ids, updated, worksheet_name="Inventory"):
+        """Khôi phục bản sao local (vd. từ snapshot) để lần sync_data sau chỉ tải phần thay đổi"""
+        self._sync_state[worksheet_name] = {
+            'df': df,
+            'header': list(header),
+            'ids': list(ids),
+            'updated': list(updated),
+        }
+    
+    @instrumented("sheets.update_inventory_data")
+    @_holds_sync_lock
+    def update_inventory_data(self, df, worksheet_name="Inventory", chunk_size=BULK_CHUNK_SIZE):
+        """Cập nhật toàn bộ dữ liệu inventory (ghi hàng loạt theo từng khối dòng)"""
+        from gspread.utils import rowcol_to_a1
         try:
             worksheet = self.get_worksheet(worksheet_name)
             if not worksheet:
                 return False
             
-            # Clear worksheet
-            worksheet.clear()
+            # Header và dữ liệu được ghi cùng một lượt
+            values = [[str(col) for col in df.columns]] + dataframe_to_values(df)
+            n_rows = len(values)
+            n_cols = max(len(df.columns), 1)
             
-            # Thêm headers
-            headers = df.columns.tolist()
-            worksheet.append_row(headers)
+            # Không clear trước: chỉ mở rộng lưới khi cần, ghi đè từng khối rồi mới thu lưới về đúng
+            # kích thước dữ liệu, lỗi giữa chừng không để lại worksheet bị cắt cụt
+            if n_rows > worksheet.row_count or n_cols > worksheet.col_count:
+                self.scheduler.write(lambda: worksheet.resize(
+                    rows=max(worksheet.row_count, n_rows), cols=max(worksheet.col_count, n_cols)
+                ))
             
-            # Thêm dữ liệu
-            for _, row in df.iterrows():
-                worksheet.append_row(row.fillna('').tolist())
+            # Mỗi khối là một request update theo range
+            chunk_size = max(int(chunk_size), 1)
+            for start in range(0, n_rows, chunk_size):
+                chunk = values[start:start + chunk_size]
+                first_cell = rowcol_to_a1(start + 1, 1)
+                last_cell = rowcol_to_a1(start + len(chunk), n_cols)
+                self.scheduler.write(
+                    lambda: worksheet.update(values=chunk, range_name=f"{first_cell}:{last_cell}")
+                )
             
+            # Bỏ các dòng/cột cũ nằm ngoài dữ liệu mới
+            self.scheduler.write(lambda: worksheet.resize(rows=n_rows, cols=n_cols))
+            self._sync_state.pop(worksheet_name, None)
+            data_cache.bump(SHEETS_NAMESPACE.format(worksheet_name))
             return True
             
         except Exception as e:
@@ -0,0 +1,82 @@
+"""
+Đo thời gian import của từng module (dựa trên python -X importtime, chạy trong process mới)
+
+Chạy: python -m utils.import_profile utils.google_sheets database --top 20
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+# Các module được đo mặc định: những gì các trang import khi khởi động
+DEFAULT_MODULES = [
+    "streamlit",
+    "database",
+    "utils.google_sheets",
+    "utils.outbox",
+    "utils.calculations",
+    "utils.kpis",
+    "utils.snapshot",
+    "utils.excel_ingest",
+]
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def parse_importtime(output):
+    """
+    Các dòng 'import time: self [us] | cumulative | name' -> list dict
+
+    Mỗi dict gồm module, self_ms, cumulative_ms và depth (mức lồng import).
+    """
+    entries = []
+    for line in output.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        try:
+            self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+            entries.append({
+                "module": name.strip(),
+                "self_ms": int(self_us) / 1000,
+                "cumulative_ms": int(cumulative_us) / 1000,
+                "depth": (len(name) - len(name.lstrip())) // 2,
+            })
+        except ValueError:
+            continue
+    return entries
+
+def _importtime(code):
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=ROOT, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+    return parse_importtime(result.stderr)
+
+def profile_imports(modules=DEFAULT_MODULES):
+    """Import các module trong một interpreter mới, bỏ các module interpreter tự tải khi khởi động"""
+    startup = {entry["module"] for entry in _importtime("pass")}
+    entries = _importtime("; ".join(f"import {module}" for module in modules))
+    return [entry for entry in entries if entry["module"] not in startup]
+
+def report(entries, top=25):
+    """Bảng văn bản: tổng thời gian, các module import trực tiếp, các module tốn nhiều nhất"""
+    total = sum(entry["self_ms"] for entry in entries)
+    lines = [f"Tổng thời gian import: {total:.0f} ms ({len(entries)} module)", ""]
+    lines.append(f"{'cumulative':>12} {'self':>9}  module (cấp cao nhất)")
+    for entry in sorted((e for e in entries if e["depth"] == 0), key=lambda e: -e["cumulative_ms"]):
+        lines.append(f"{entry['cumulative_ms']:>10.1f}ms {entry['self_ms']:>7.1f}ms  {entry['module']}")
+    lines += ["", f"{'self':>12}  module (tốn nhiều nhất)"]
+    for entry in sorted(entries, key=lambda e: -e["self_ms"])[:top]:
+        lines.append(f"{entry['self_ms']:>10.1f}ms  {entry['module']}")
+    return "\n".join(lines)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("modules", nargs="*", default=DEFAULT_MODULES)
+    parser.add_argument("--top", type=int, default=25)
+    args = parser.parse_args()
+    print(report(profile_imports(args.modules), args.top))
+
+if __name__ == "__main__":
+    main()
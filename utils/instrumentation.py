@@ -0,0 +1,210 @@
+import bisect
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from functools import wraps
+
+# Bật đo cho cả process bằng biến môi trường CHECKSTOCK_METRICS=1 (sidebar chỉ bật/tắt phần hiển thị)
+METRICS_ENV = "CHECKSTOCK_METRICS"
+
+# File xuất số liệu tổng hợp (.json là JSON, còn lại là định dạng text của Prometheus)
+METRICS_FILE = os.getenv("CHECKSTOCK_METRICS_FILE", "metrics.prom")
+
+# Khoảng thời gian tối thiểu giữa hai lần ghi file số liệu (giây)
+EXPORT_INTERVAL = 10.0
+
+# Biên trên các bucket của histogram thời gian (giây)
+HISTOGRAM_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+def _size_of(value):
+    """(số dòng, số byte) của DataFrame hoặc list (hoặc phần tử đầu của tuple kết quả)"""
+    if isinstance(value, tuple) and value:
+        value = value[0]
+    if hasattr(value, "memory_usage") and hasattr(value, "columns"):
+        return len(value), int(value.memory_usage(deep=False).sum())
+    if isinstance(value, list):
+        return len(value), None
+    return None, None
+
+class Metrics:
+    """
+    Bộ đếm, histogram thời gian và số dòng/byte của các lời gọi trên đường nóng
+
+    Số liệu tổng hợp dùng chung cho cả process; các sự kiện của lần rerun hiện tại lưu theo thread
+    (mỗi session Streamlit chạy script trên thread riêng). Khi tắt, mỗi lời gọi chỉ tốn một phép
+    kiểm tra thuộc tính.
+    """
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._last_export = 0.0
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.counters = defaultdict(float)
+            # name -> [đếm theo bucket..., +Inf], tổng thời gian, số lần gọi
+            self.histograms = {}
+
+    def start_rerun(self):
+        """Bắt đầu một lần rerun mới: xoá các sự kiện của lần trước trên thread này"""
+        self._local.events = []
+        if self.enabled:
+            self.maybe_export()
+
+    def rerun_events(self):
+        return list(getattr(self._local, "events", []))
+
+    def count(self, name, value=1):
+        if not self.enabled:
+            return
+        with self._lock:
+            self.counters[name] += value
+
+    def observe(self, name, seconds, rows=None, nbytes=None, error=False):
+        """Ghi một lời gọi: thời gian vào histogram, số dòng/byte/lỗi vào bộ đếm"""
+        with self._lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = {
+                    "buckets": [0] * (len(HISTOGRAM_BUCKETS) + 1), "sum": 0.0, "count": 0
+                }
+            histogram["buckets"][bisect.bisect_left(HISTOGRAM_BUCKETS, seconds)] += 1
+            histogram["sum"] += seconds
+            histogram["count"] += 1
+            if rows is not None:
+                self.counters[f"{name}.rows"] += rows
+            if nbytes is not None:
+                self.counters[f"{name}.bytes"] += nbytes
+            if error:
+                self.counters[f"{name}.errors"] += 1
+        events = getattr(self._local, "events", None)
+        if events is not None:
+            events.append((name, seconds, rows, nbytes))
+
+    def export_json(self):
+        with self._lock:
+            return {
+                "counters": dict(self.counters),
+                "histograms": {
+                    name: {"le": list(HISTOGRAM_BUCKETS) + ["+Inf"], **histogram}
+                    for name, histogram in self.histograms.items()
+                },
+            }
+
+    def export_prometheus(self):
+        """Số liệu tổng hợp ở định dạng text của Prometheus (bucket cộng dồn)"""
+        lines = ["# TYPE checkstock_call_seconds histogram"]
+        data = self.export_json()
+        for name, histogram in sorted(data["histograms"].items()):
+            cumulative = 0
+            for bound, count in zip(histogram["le"], histogram["buckets"]):
+                cumulative += count
+                lines.append(f'checkstock_call_seconds_bucket{{name="{name}",le="{bound}"}} {cumulative}')
+            lines.append(f'checkstock_call_seconds_sum{{name="{name}"}} {histogram["sum"]:.6f}')
+            lines.append(f'checkstock_call_seconds_count{{name="{name}"}} {histogram["count"]}')
+        lines.append("# TYPE checkstock_total counter")
+        for name, value in sorted(data["counters"].items()):
+            lines.append(f'checkstock_total{{name="{name}"}} {value:g}')
+        return "\n".join(lines) + "\n"
+
+    def write(self, path=METRICS_FILE):
+        """Ghi số liệu tổng hợp ra file (file tạm rồi đổi tên)"""
+        text = (json.dumps(self.export_json(), ensure_ascii=False) if path.endswith(".json")
+                else self.export_prometheus())
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(tmp_path, path)
+
+    def maybe_export(self, path=METRICS_FILE):
+        """Ghi file số liệu nếu đã quá EXPORT_INTERVAL kể từ lần ghi trước"""
+        now = time.monotonic()
+        if now - self._last_export < EXPORT_INTERVAL:
+            return
+        self._last_export = now
+        try:
+            self.write(path)
+        except OSError:
+            pass
+
+# Singleton instance
+metrics = Metrics(enabled=os.getenv(METRICS_ENV, "") not in ("", "0"))
+
+def instrumented(name=None):
+    """Decorator đo thời gian, số dòng/byte của kết quả (hoặc của DataFrame đầu vào) và lỗi"""
+    def decorate(func):
+        label = name or f"{func.__module__}.{func.__qualname__}"
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if not metrics.enabled:
+                return func(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                result = func(*args, **kwargs)
+            except BaseException:
+                metrics.observe(label, time.perf_counter() - start, error=True)
+                raise
+            rows, nbytes = _size_of(result)
+            if rows is None:
+                rows, nbytes = next(
+                    (size for size in map(_size_of, args) if size[0] is not None), (None, None)
+                )
+            metrics.observe(label, time.perf_counter() - start, rows, nbytes)
+            return result
+        return wrapper
+    return decorate
+
+def timed_iter(name, iterable):
+    """Đo thời gian tạo từng phần tử của một iterator (vd. từng khối khi đọc Excel)"""
+    if not metrics.enabled:
+        return iterable
+    return _timed_iter(name, iterable)
+
+def _timed_iter(name, iterable):
+    iterator = iter(iterable)
+    while True:
+        start = time.perf_counter()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            return
+        rows, nbytes = _size_of(item)
+        metrics.observe(name, time.perf_counter() - start, rows, nbytes)
+        yield item
+
+def render_metrics_panel():
+    """
+    Sidebar: bảng thời gian của lần rerun hiện tại theo từng lời gọi
+
+    Việc đo bật/tắt cho cả process qua METRICS_ENV; ô chọn ở đây chỉ ẩn/hiện bảng trong session
+    hiện tại (lưu trong st.session_state), không ảnh hưởng session khác.
+    """
+    import streamlit as st
+
+    with st.sidebar.expander("⏱️ Hiệu năng"):
+        if not metrics.enabled:
+            st.caption(f"Chưa bật đo hiệu năng. Khởi động app với {METRICS_ENV}=1 để bật.")
+            return
+        if not st.checkbox("Hiện bảng thời gian", value=True, key="metrics_panel"):
+            return
+        summary = {}
+        for name, seconds, rows, _ in metrics.rerun_events():
+            entry = summary.setdefault(name, {"Lời gọi": name, "Số lần": 0, "ms": 0.0, "Dòng": 0})
+            entry["Số lần"] += 1
+            entry["ms"] += seconds * 1000
+            entry["Dòng"] += rows or 0
+        if summary:
+            rows = sorted(summary.values(), key=lambda entry: -entry["ms"])
+            for entry in rows:
+                entry["ms"] = round(entry["ms"], 1)
+            st.dataframe(rows, hide_index=True, use_container_width=True)
+        else:
+            st.caption("Lần rerun này chưa có lời gọi nào được đo.")
+        st.download_button("Tải số liệu (Prometheus)", metrics.export_prometheus(),
+                           file_name="metrics.prom", mime="text/plain")
@@ -0,0 +1,32 @@
+from datetime import date
+
+from data.locks import LOCKS
+from database import load_aggregate, load_aging, load_daily_series, load_totals
+from utils.data_cache import data_cache, DB_NAMESPACE
+from utils.transaction_log import transaction_log
+
+# KPI tính từ các bảng tổng hợp, hết hạn khi bảng inventory được ghi
+KPI_NAMESPACE = DB_NAMESPACE.format("inventory")
+
+def _compute_kpis(today):
+    by_material = load_aggregate("agg_material")
+    by_lock = load_aggregate("agg_lock")
+    active_locks = set(by_lock.loc[by_lock["so_bao"] > 0, "lo"]) & set(LOCKS)
+    return {
+        "totals": load_totals(),
+        "by_material": by_material,
+        "by_lock": by_lock,
+        "by_material_lock": load_aggregate("agg_material_lock"),
+        "material_count": int((by_material["so_bao"] > 0).sum()),
+        "active_locks": len(active_locks),
+        "lock_count": len(LOCKS),
+        "aging": load_aging(today),
+        "series": load_daily_series(),
+    }
+
+def load_kpis(today=None):
+    """KPI cho dashboard và trang chủ (vài truy vấn nhỏ trên bảng tổng hợp, cache theo phiên bản dữ liệu)"""
+    today = today or date.today()
+    kpis = data_cache.get_or_load(KPI_NAMESPACE, ("kpis", today.isoformat()), lambda: _compute_kpis(today))
+    # Giao dịch hôm nay đếm theo Nhập/Sử dụng trong log (gồm cả giao dịch nhập từ form), không cache
+    return dict(kpis, today=transaction_log.day_summary(today))
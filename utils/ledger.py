@@ -0,0 +1,113 @@
+import numpy as np
+import pandas as pd
+
+# Khoá của sổ cái: mỗi nguyên liệu tại mỗi vị trí kho
+LEDGER_KEYS = ['Name', 'Lock']
+
+# (cột tồn đầu, cột nhập, cột sử dụng, cột tồn cuối) cho từng đơn vị
+BALANCE_UNITS = {
+    'Bag': ('Tồn đầu (Bag)', 'Nhập (Bag)', 'Sử dụng (Bag)', 'Tồn cuối (Bag)'),
+    'Weight': ('Tồn đầu (Weight)', 'Nhập (Weight)', 'Sử dụng (Weight)', 'Tồn cuối (Weight)'),
+}
+
+# Thứ tự thời gian của giao dịch
+ORDER_COLS = ['Ngày nhập', 'Created_At']
+
+def numeric_column(df, col):
+    """Giá trị float64 của một cột (0 nếu thiếu cột hoặc không phải số)"""
+    if col not in df.columns:
+        return np.zeros(len(df))
+    return pd.to_numeric(df[col], errors='coerce').to_numpy(dtype='float64', na_value=np.nan)
+
+def chronological_order(df):
+    """Vị trí các dòng theo thứ tự thời gian (ổn định với các dòng cùng ngày)"""
+    sort_keys = []
+    if 'Created_At' in df.columns:
+        sort_keys.append(df['Created_At'].astype(str).to_numpy())
+    if 'Ngày nhập' in df.columns:
+        dates = df['Ngày nhập']
+        if not pd.api.types.is_datetime64_any_dtype(dates):
+            dates = pd.to_datetime(dates, errors='coerce')
+        # NaT được xếp cuối
+        sort_keys.append(dates.to_numpy(dtype='datetime64[ns]'))
+    if not sort_keys:
+        return np.arange(len(df))
+    if len(sort_keys) == 1:
+        return np.argsort(sort_keys[0], kind='stable')
+    return np.lexsort(sort_keys)
+
+def group_codes(df):
+    """Mã nhóm số nguyên liên tục cho mỗi cặp (Name, Lock)"""
+    codes = np.zeros(len(df), dtype='int64')
+    for col in LEDGER_KEYS:
+        col_codes, uniques = pd.factorize(df[col], use_na_sentinel=False)
+        codes = codes * (len(uniques) + 1) + col_codes
+    return pd.factorize(codes)[0]
+
+def rebuild_balances(df, inplace=False):
+    """
+    Tính lại Tồn đầu/Tồn cuối cho toàn bộ lịch sử theo (Name, Lock)
+    
+    Số dư mở đầu của mỗi nhóm lấy từ Tồn đầu của giao dịch sớm nhất, các giao dịch sau
+    được tính bằng một lượt cumsum theo nhóm (không lặp qua từng dòng).
+    """
+    df_calc = df if inplace else df.copy(deep=False)
+    if df_calc.empty or not all(col in df_calc.columns for col in LEDGER_KEYS):
+        return df_calc
+    
+    order = chronological_order(df_calc)
+    groups = group_codes(df_calc)[order]
+    
+    for opening_col, import_col, usage_col, ending_col in BALANCE_UNITS.values():
+        net = np.nan_to_num(numeric_column(df_calc, import_col) - numeric_column(df_calc, usage_col))[order]
+        seed = np.nan_to_num(numeric_column(df_calc, opening_col))[order]
+    
+        grouped = pd.Series(net).groupby(groups, sort=False)
+        ending_sorted = pd.Series(seed).groupby(groups, sort=False).transform('first').to_numpy() + grouped.cumsum().to_numpy()
+    
+        opening = np.empty(len(order))
+        ending = np.empty(len(order))
+        opening[order] = ending_sorted - net
+        ending[order] = ending_sorted
+        df_calc[opening_col] = opening
+        df_calc[ending_col] = ending
+    
+    return df_calc
+
+class InventoryLedger:
+    """Số dư hiện tại theo (Name, Lock), tra cứu và cập nhật O(1) cho mỗi giao dịch mới"""
+
+    def __init__(self, balances=None):
+        # {(name, lock): (bags, weight)}
+        self.balances = dict(balances or {})
+
+    @classmethod
+    def from_dataframe(cls, df):
+        """Tạo sổ cái từ dữ liệu đã chạy rebuild_balances"""
+        if df.empty or not all(col in df.columns for col in LEDGER_KEYS + ['Tồn cuối (Bag)', 'Tồn cuối (Weight)']):
+            return cls()
+        order = chronological_order(df)
+        # Vị trí giao dịch muộn nhất của mỗi nhóm
+        last_pos = pd.Series(order).groupby(group_codes(df)[order], sort=False).last().to_numpy()
+        names = df['Name'].to_numpy()[last_pos]
+        locks = df['Lock'].to_numpy()[last_pos]
+        bags = numeric_column(df, 'Tồn cuối (Bag)')[last_pos]
+        weight = numeric_column(df, 'Tồn cuối (Weight)')[last_pos]
+        return cls(zip(zip(names, locks), zip(bags.tolist(), weight.tolist())))
+
+    def copy(self):
+        """Bản sao độc lập (mỗi revision của bản tồn kho giữ sổ cái riêng)"""
+        return InventoryLedger(self.balances)
+
+    def opening_balance(self, name, lock):
+        """Số dư hiện tại (bags, weight) dùng làm Tồn đầu cho giao dịch mới"""
+        return self.balances.get((name, lock), (0, 0.0))
+
+    def apply(self, transaction):
+        """Cộng giao dịch vào số dư, trả về số dư mới (bags, weight)"""
+        key = (transaction.get('Name'), transaction.get('Lock'))
+        bags, weight = self.opening_balance(*key)
+        bags += float(transaction.get('Nhập (Bag)', 0) or 0) - float(transaction.get('Sử dụng (Bag)', 0) or 0)
+        weight += float(transaction.get('Nhập (Weight)', 0) or 0) - float(transaction.get('Sử dụng (Weight)', 0) or 0)
+        self.balances[key] = (bags, weight)
+        return bags, weight
@@ -0,0 +1,62 @@
+import numpy as np
+import pandas as pd
+
+from utils.calculations import TOTAL_COLS
+
+class MaterialIndex:
+    """
+    Chỉ mục theo nguyên liệu cho một phiên bản dữ liệu
+    
+    Giữ vị trí các dòng và tổng các cột số của từng nguyên liệu, nên chọn một nguyên liệu
+    chỉ cần lấy k dòng của nó (không quét và không cộng lại toàn bộ bảng).
+    """
+
+    def __init__(self, positions=None, totals=None, size=0):
+        # {name: mảng vị trí dòng}, {name: {cột: tổng}}
+        self.positions = dict(positions or {})
+        self.totals = dict(totals or {})
+        self.size = size
+
+    @classmethod
+    def from_dataframe(cls, df):
+        if df.empty or 'Name' not in df.columns:
+            return cls(size=len(df))
+        grouped = df.groupby('Name', observed=True, sort=False)
+        cols = [col for col in TOTAL_COLS if col in df.columns]
+        totals = grouped[cols].sum().to_dict('index') if cols else {}
+        return cls(grouped.indices, totals, len(df))
+
+    def names(self):
+        """Danh sách nguyên liệu (đã sắp xếp)"""
+        return sorted(self.positions, key=str)
+
+    def rows(self, df, name):
+        """Các dòng của một nguyên liệu trong df (df là dữ liệu đã tạo chỉ mục)"""
+        return df.iloc[self.positions.get(name, np.empty(0, dtype='int64'))]
+
+    def material_totals(self, name):
+        """Tổng các cột số của một nguyên liệu, cùng dạng với calculate_totals"""
+        return self.totals.get(name, {})
+
+    def append(self, new_rows):
+        """
+        Chỉ mục mới sau khi nối new_rows vào cuối dữ liệu
+        
+        Chỉ các nguyên liệu liên quan được cập nhật; chỉ mục cũ giữ nguyên cho các session
+        còn đang đọc phiên bản dữ liệu trước.
+        """
+        index = MaterialIndex(self.positions, self.totals, self.size + len(new_rows))
+        if 'Name' not in new_rows.columns:
+            return index
+        cols = [col for col in TOTAL_COLS if col in new_rows.columns]
+        for offset, (name, values) in enumerate(zip(new_rows['Name'], new_rows[cols].itertuples(index=False))):
+            position = self.size + offset
+            index.positions[name] = np.append(index.positions.get(name, np.empty(0, dtype='int64')), position)
+            material_totals = dict(index.totals.get(name, {}))
+            for col, value in zip(cols, values):
+                # sum() bỏ qua NaN, giữ cùng quy ước
+                if pd.isna(value):
+                    value = 0
+                material_totals[col] = material_totals.get(col, 0) + value
+            index.totals[name] = material_totals
+        return index
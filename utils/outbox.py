@@ -0,0 +1,190 @@
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+
+from database import DB
+from utils.google_sheets import google_sheets_manager
+from utils.transaction_log import transaction_log
+
+# Journal riêng của phiên bản cũ (trước khi có log giao dịch), được chuyển vào log khi khởi động
+LEGACY_OUTBOX_DB = os.path.join(os.path.dirname(os.path.abspath(DB)), "outbox.db")
+
+# Số dòng tối đa gộp vào một request append_rows
+OUTBOX_BATCH_SIZE = 500
+
+# Thời gian chờ gom thêm dòng trước khi gửi (giây)
+OUTBOX_LINGER = 0.2
+
+# Backoff khi gửi thất bại (giây)
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 60.0
+
+
+class TransactionOutbox:
+    """
+    Đẩy các giao dịch trong log lên Google Sheets theo lô bằng một luồng nền
+
+    Giao dịch được ghi vào log (utils.transaction_log) ngay khi nhập; outbox chỉ giữ ID cuối cùng
+    đã đẩy lên của từng worksheet, các dòng có ID lớn hơn là đang chờ.
+
+    append_rows và việc lưu ID cuối không nằm trong cùng một transaction: process dừng giữa hai
+    bước (hoặc request lỗi sau khi Sheets đã nhận) thì lô đó còn chờ dù đã lên sheet. Lần đẩy đầu
+    tiên của process và lần đẩy sau một lỗi đối chiếu cột ID trên sheet, bỏ qua các dòng đã có.
+    """
+
+    def __init__(self, log=None, manager=None, batch_size=OUTBOX_BATCH_SIZE,
+                 flush_interval=1.0, linger=OUTBOX_LINGER, legacy_db_path=LEGACY_OUTBOX_DB):
+        self.log = log or transaction_log
+        self.manager = manager or google_sheets_manager
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.linger = linger
+        self.legacy_db_path = legacy_db_path
+        self.last_error = None
+        # Worksheet đã đối chiếu cột ID trên sheet với log kể từ lần lỗi gần nhất
+        self._verified = set()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    def enqueue(self, transaction_data, worksheet_name="Inventory"):
+        """Ghi transaction vào log và trả về dòng dữ liệu (theo INVENTORY_HEADERS, đã có ID)"""
+        row_data = self.log.append(transaction_data, worksheet_name)
+        self.start()
+        self._wakeup.set()
+        return row_data
+
+    def _cursor(self, conn, worksheet_name):
+        row = conn.execute(
+            "SELECT last_id FROM sheets_cursor WHERE worksheet = ?", (worksheet_name,)
+        ).fetchone()
+        return row[0] if row else 0
+
+    def pending_count(self):
+        """Số transaction chưa được đẩy lên Google Sheets"""
+        with self.log.snapshot() as conn:
+            return conn.execute("""
+                SELECT COUNT(*) FROM transactions t
+                LEFT JOIN sheets_cursor c ON c.worksheet = t.worksheet
+                WHERE t.id > COALESCE(c.last_id, 0)
+            """).fetchone()[0]
+
+    def pending_rows(self, worksheet_name="Inventory"):
+        """Các dòng còn chờ (theo thứ tự nhập) của một worksheet"""
+        with self.log.snapshot() as conn:
+            return self.log.rows(worksheet_name, after_id=self._cursor(conn, worksheet_name))
+
+    def flush_once(self):
+        """Đẩy một lô lên Google Sheets; trả về số dòng đã xử lý (0 nếu không còn dòng chờ)"""
+        with self.log.snapshot() as conn:
+            first = conn.execute("""
+                SELECT t.worksheet FROM transactions t
+                LEFT JOIN sheets_cursor c ON c.worksheet = t.worksheet
+                WHERE t.id > COALESCE(c.last_id, 0) ORDER BY t.id LIMIT 1
+            """).fetchone()
+            if first is None:
+                return 0
+            worksheet_name = first[0]
+            rows = self.log.rows(worksheet_name, self._cursor(conn, worksheet_name), self.batch_size)
+
+        try:
+            unsent = rows
+            if worksheet_name not in self._verified:
+                # Dòng mang ID của log: ID đã có trên sheet là lô trước đã lên nhưng chưa lưu ID cuối
+                present = self.manager.row_ids(worksheet_name)
+                unsent = [row for row in rows if str(row[0]) not in present]
+            if unsent:
+                self.manager.append_rows(unsent, worksheet_name)
+        except Exception as e:
+            self._verified.discard(worksheet_name)
+            self.last_error = str(e)
+            self.log.write(lambda conn: conn.execute("""
+                INSERT INTO sheets_cursor (worksheet, attempts, last_error) VALUES (?, 1, ?)
+                ON CONFLICT (worksheet) DO UPDATE SET attempts = attempts + 1, last_error = excluded.last_error
+            """, (worksheet_name, self.last_error)))
+            raise
+
+        last_id = int(rows[-1][0])
+        self.log.write(lambda conn: conn.execute("""
+            INSERT INTO sheets_cursor (worksheet, last_id) VALUES (?, ?)
+            ON CONFLICT (worksheet) DO UPDATE SET last_id = MAX(last_id, excluded.last_id),
+                attempts = 0, last_error = NULL
+        """, (worksheet_name, last_id)))
+        self._verified.add(worksheet_name)
+        self.last_error = None
+        return len(rows)
+
+    def migrate_legacy_journal(self):
+        """
+        Chuyển các dòng còn chờ trong journal cũ (outbox.db) vào log; trả về số dòng đã chuyển
+
+        ID cũ được ghi vào bảng legacy_migrated cùng transaction với các dòng mới: nếu process dừng
+        trước khi xoá khỏi journal, lần chạy sau bỏ qua các ID đã chuyển thay vì chuyển lại.
+        """
+        if not os.path.exists(self.legacy_db_path):
+            return 0
+        conn = sqlite3.connect(self.legacy_db_path, timeout=30)
+        try:
+            if conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'outbox'"
+            ).fetchone() is None:
+                return 0
+            moved = 0
+            entries = conn.execute("SELECT id, worksheet, payload FROM outbox ORDER BY id").fetchall()
+            for worksheet_name in dict.fromkeys(worksheet for _, worksheet, _ in entries):
+                batch = [(row_id, json.loads(payload)) for row_id, worksheet, payload in entries
+                         if worksheet == worksheet_name]
+                # Dòng cũ mang ID theo timestamp, được cấp lại ID của log
+                moved += self.log.write(lambda log_conn: self._import_legacy(log_conn, batch, worksheet_name))
+                conn.executemany("DELETE FROM outbox WHERE id = ?", [(row_id,) for row_id, _ in batch])
+                conn.commit()
+            return moved
+        finally:
+            conn.close()
+
+    def _import_legacy(self, conn, batch, worksheet_name):
+        """Chèn các dòng cũ chưa chuyển lần nào (chạy trên luồng ghi của log); trả về số dòng đã chèn"""
+        fresh = [(row_id, list(row)) for row_id, row in batch if conn.execute(
+            "SELECT 1 FROM legacy_migrated WHERE legacy_id = ?", (row_id,)
+        ).fetchone() is None]
+        rows = self.log.insert_rows(conn, [row for _, row in fresh], worksheet_name)
+        conn.executemany(
+            "INSERT INTO legacy_migrated (legacy_id, log_id) VALUES (?, ?)",
+            [(row_id, int(row[0])) for (row_id, _), row in zip(fresh, rows)]
+        )
+        return len(fresh)
+
+    def _run(self):
+        failures = 0
+        while True:
+            if self._wakeup.wait(self.flush_interval):
+                # Chờ thêm một chút để gom các transaction đến gần nhau vào cùng một lô
+                time.sleep(self.linger)
+            self._wakeup.clear()
+            try:
+                while self.flush_once():
+                    failures = 0
+            except Exception:
+                # Exponential backoff có jitter, log giữ nguyên dữ liệu để gửi lại
+                failures += 1
+                delay = min(BACKOFF_BASE * 2 ** (failures - 1), BACKOFF_MAX)
+                time.sleep(delay * random.uniform(0.5, 1.0))
+
+    def start(self):
+        """Khởi động luồng nền (chỉ một lần cho mỗi process)"""
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                if self._thread is None:
+                    try:
+                        self.migrate_legacy_journal()
+                    except sqlite3.Error as e:
+                        self.last_error = f"Không chuyển được journal cũ: {e}"
+                self._thread = threading.Thread(target=self._run, name="sheets-outbox", daemon=True)
+                self._thread.start()
+
+
+# Singleton instance
+transaction_outbox = TransactionOutbox()
@@ -0,0 +1,112 @@
+import streamlit as st
+
+from database import DEFAULT_PAGE_SIZE, PAGE_SORT_COLUMNS, count_rows, load_aggregate, load_page
+from utils.export import export_button, iter_table_chunks
+
+# Các cột số được cộng ở dòng tổng khi xuất bảng SQLite
+SQLITE_TOTAL_COLS = ["so_bao", "khoiluong"]
+
+# Các lựa chọn số dòng mỗi trang
+PAGE_SIZE_OPTIONS = [25, 50, 100, 200, 500]
+
+SORT_LABELS = {
+    "ngay_nhap": "Ngày nhập",
+    "ten_nguyen_lieu": "Tên nguyên liệu",
+    "lo": "Vị trí kho",
+    "id": "Thứ tự nhập",
+}
+
+def _page_state(key, signature):
+    """Trạng thái phân trang của một bảng, reset về trang đầu khi bộ lọc/sắp xếp thay đổi"""
+    state = st.session_state.setdefault(f"{key}_pages", {"signature": None, "cursors": [None], "next": None})
+    if state["signature"] != signature:
+        state.update(signature=signature, cursors=[None], next=None)
+    return state
+
+def _go_next(state):
+    if state["next"] is not None:
+        state["cursors"].append(state["next"])
+
+def _go_prev(state):
+    if len(state["cursors"]) > 1:
+        state["cursors"].pop()
+
+def _pager(key, state, page_number, total_pages):
+    """Nút chuyển trang; callback chạy trước lần render sau nên trang mới được tải ngay"""
+    col_prev, col_info, col_next = st.columns([1, 3, 1])
+    col_prev.button("◀ Trang trước", key=f"{key}_prev", on_click=_go_prev, args=(state,),
+                    disabled=page_number == 0)
+    col_info.caption(f"Trang {page_number + 1}/{max(total_pages, 1)}")
+    col_next.button("Trang sau ▶", key=f"{key}_next", on_click=_go_next, args=(state,),
+                    disabled=state["next"] is None)
+
+def _page_size(key):
+    return st.selectbox("Số dòng mỗi trang", PAGE_SIZE_OPTIONS,
+                        index=PAGE_SIZE_OPTIONS.index(DEFAULT_PAGE_SIZE), key=f"{key}_size")
+
+def sqlite_table(key, table="inventory"):
+    """
+    Bảng phân trang đọc từ SQLite
+
+    Bộ lọc và thứ tự được đẩy xuống câu SQL có index, mỗi lần rerun chỉ đọc và gửi một trang.
+    """
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        materials = st.multiselect(
+            "Nguyên liệu", load_aggregate("agg_material", "ten_nguyen_lieu ASC")["ten_nguyen_lieu"].tolist(),
+            key=f"{key}_materials"
+        )
+        locks = st.multiselect(
+            "Vị trí kho", load_aggregate("agg_lock", "lo ASC")["lo"].tolist(), key=f"{key}_locks"
+        )
+    with col2:
+        dates = st.date_input("Khoảng ngày nhập", value=(), key=f"{key}_dates")
+        sort_by = st.selectbox("Sắp xếp theo", PAGE_SORT_COLUMNS, format_func=SORT_LABELS.get,
+                               key=f"{key}_sort")
+    with col3:
+        descending = st.checkbox("Giảm dần", value=True, key=f"{key}_desc")
+        page_size = _page_size(key)
+
+    filters = {
+        "ten_nguyen_lieu": materials,
+        "lo": locks,
+        "ngay_tu": dates[0] if len(dates) > 0 else None,
+        "ngay_den": dates[1] if len(dates) > 1 else None,
+    }
+    signature = (tuple(materials), tuple(locks), tuple(dates), sort_by, descending, page_size)
+    state = _page_state(key, signature)
+
+    page, state["next"] = load_page(table, filters, sort_by, descending, page_size, state["cursors"][-1])
+    total = count_rows(table, filters)
+
+    st.caption(f"{total:,} dòng khớp bộ lọc")
+    st.dataframe(page, use_container_width=True, hide_index=True)
+    _pager(key, state, len(state["cursors"]) - 1, -(-total // page_size))
+
+    # Xuất mọi dòng khớp bộ lọc, đọc lại từ SQLite theo từng khối
+    export_button(
+        key, lambda: iter_table_chunks(table, filters, sort_by, descending), table,
+        signature=signature + (total,),
+        totals=lambda chunk: {col: chunk[col].sum() for col in SQLITE_TOTAL_COLS if col in chunk.columns}
+    )
+    return page
+
+def dataframe_table(key, df, height=400):
+    """Bảng phân trang cho DataFrame đã có trong bộ nhớ: chỉ trang đang xem được gửi lên trình duyệt"""
+    page_size = _page_size(key)
+    total_pages = max(-(-len(df) // page_size), 1)
+
+    state = st.session_state.setdefault(f"{key}_page", {"page": 0})
+    state["page"] = min(state["page"], total_pages - 1)
+    start = state["page"] * page_size
+    page = df.iloc[start:start + page_size]
+
+    st.dataframe(page, use_container_width=True, height=height)
+
+    col_prev, col_info, col_next = st.columns([1, 3, 1])
+    col_prev.button("◀ Trang trước", key=f"{key}_prev", disabled=state["page"] == 0,
+                    on_click=lambda: state.update(page=state["page"] - 1))
+    col_info.caption(f"Trang {state['page'] + 1}/{total_pages} · {len(df):,} dòng")
+    col_next.button("Trang sau ▶", key=f"{key}_next", disabled=state["page"] >= total_pages - 1,
+                    on_click=lambda: state.update(page=state["page"] + 1))
+    return page
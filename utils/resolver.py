@@ -0,0 +1,144 @@
+import difflib
+import re
+import unicodedata
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+from data.locks import LOCKS
+from data.materials import MATERIALS
+
+# Độ giống tối thiểu (0..1) để gợi ý tên chuẩn gần nhất cho một cách viết lạ (chỉ gợi ý, không tự gộp)
+SUGGEST_CUTOFF = 0.85
+
+# Số cách viết lạ được nhớ kết quả gợi ý
+SUGGEST_CACHE_SIZE = 4096
+
+_NON_ALNUM = re.compile(r"[^0-9a-z]+")
+_WHITESPACE = re.compile(r"\s+")
+
+def _fold(value):
+    """Bỏ dấu tiếng Việt và không phân biệt hoa thường"""
+    if value is None or (isinstance(value, float) and np.isnan(value)):
+        return ""
+    text = unicodedata.normalize("NFKD", str(value).replace("đ", "d").replace("Đ", "D"))
+    return "".join(ch for ch in text if not unicodedata.combining(ch)).casefold()
+
+def normalize_key(value):
+    """Khoá so khớp tên cột: bỏ dấu, không phân biệt hoa thường, bỏ khoảng trắng và dấu câu"""
+    return _NON_ALNUM.sub("", _fold(value))
+
+def name_key(value):
+    """
+    Khoá nhận tên chuẩn: chỉ bỏ qua khác biệt về dấu, hoa thường và khoảng trắng
+
+    Chữ số và ký hiệu được giữ nguyên để "BIOFIL YELLOW 3%" không thành "BIOFIL YELLOW 2%".
+    """
+    return _WHITESPACE.sub("", _fold(value))
+
+class CanonicalResolver:
+    """
+    Ánh xạ tên nhập tự do -> ID số nguyên của tên chuẩn
+
+    Bảng băm name_key -> ID được dựng một lần; chỉ khớp khi khoá trùng hẳn. So khớp gần đúng
+    (difflib) chỉ dùng cho suggest() để người dùng xác nhận. ID là vị trí trong self.names,
+    -1 là không khớp.
+    """
+
+    def __init__(self, names, cutoff=SUGGEST_CUTOFF):
+        self.cutoff = cutoff
+        # Tên chuẩn không trùng lặp (giữ cách viết xuất hiện đầu tiên)
+        self.names = []
+        self._ids = {}
+        for name in names:
+            key = name_key(name)
+            if key and key not in self._ids:
+                self._ids[key] = len(self.names)
+                self.names.append(name)
+        self._keys = list(self._ids)
+        self._suggest_id = lru_cache(maxsize=SUGGEST_CACHE_SIZE)(self._closest_id)
+
+    def _closest_id(self, key):
+        match = difflib.get_close_matches(key, self._keys, n=1, cutoff=self.cutoff)
+        return self._ids[match[0]] if match else -1
+
+    def resolve_id(self, value):
+        """ID của tên chuẩn trùng khoá với value, -1 nếu không có"""
+        return self._ids.get(name_key(value), -1)
+
+    def suggest(self, value):
+        """Tên chuẩn gần giống nhất để gợi ý cho một cách viết không khớp, None nếu không có"""
+        key = name_key(value)
+        if not key or key in self._ids:
+            return None
+        found = self._suggest_id(key)
+        return self.names[found] if found >= 0 else None
+
+    def resolve(self, value):
+        """Tên chuẩn khớp với value, None nếu không có"""
+        found = self.resolve_id(value)
+        return self.names[found] if found >= 0 else None
+
+    def codes(self, values):
+        """ID cho cả một cột: chỉ tra các giá trị khác nhau rồi ánh xạ lại bằng mảng"""
+        inverse, uniques = pd.factorize(pd.Series(values), use_na_sentinel=True)
+        ids = np.fromiter((self.resolve_id(u) for u in uniques), dtype="int32", count=len(uniques))
+        # Thêm -1 cuối mảng để mã NA (-1) tra ra -1
+        return np.append(ids, -1)[inverse]
+
+    def categorical(self, values):
+        """
+        Cột categorical theo tên chuẩn
+
+        Giá trị không khớp được giữ nguyên (bỏ khoảng trắng thừa) thành category riêng, NA giữ NA.
+        """
+        values = pd.Series(values)
+        inverse, uniques = pd.factorize(values, use_na_sentinel=True)
+        ids = np.fromiter((self.resolve_id(u) for u in uniques), dtype="int64", count=len(uniques))
+        categories = list(self.names)
+        unknown = {}
+        for i in np.flatnonzero(ids < 0):
+            label = str(uniques[i]).strip()
+            if label not in unknown:
+                unknown[label] = len(categories)
+                categories.append(label)
+            ids[i] = unknown[label]
+        codes = np.append(ids, -1)[inverse]
+        return pd.Series(pd.Categorical.from_codes(codes, categories=categories), index=values.index,
+                         name=values.name)
+
+# Dựng sẵn khi import
+material_resolver = CanonicalResolver(MATERIALS)
+lock_resolver = CanonicalResolver(LOCKS)
+
+# Cột đã chuẩn hoá -> resolver tương ứng
+CANONICAL_COLUMNS = {
+    "ten_nguyen_lieu": material_resolver,
+    "lo": lock_resolver,
+}
+
+def unmatched_names(df, columns=CANONICAL_COLUMNS):
+    """
+    Các tên không khớp tên chuẩn nào trong df (đã canonicalize_columns) kèm gợi ý
+
+    Trả về danh sách dict {"column", "value", "suggestion"}; gợi ý chỉ để người dùng sửa file nguồn.
+    """
+    found = []
+    for col, resolver in columns.items():
+        if col not in df.columns or not isinstance(df[col].dtype, pd.CategoricalDtype):
+            continue
+        codes = np.unique(df[col].cat.codes.to_numpy())
+        categories = df[col].cat.categories
+        for code in codes[codes >= len(resolver.names)]:
+            value = categories[code]
+            found.append({"column": col, "value": value, "suggestion": resolver.suggest(value)})
+    return found
+
+def canonicalize_columns(df, columns=CANONICAL_COLUMNS):
+    """Thay các cột tên nguyên liệu/vị trí bằng categorical theo tên chuẩn (bản sao nông)"""
+    df = df.copy(deep=False)
+    for col, resolver in columns.items():
+        if col in df.columns:
+            df[col] = resolver.categorical(df[col])
+    return df
@@ -0,0 +1,348 @@
+import re
+import threading
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+
+from utils.resolver import normalize_key
+
+# Ngày gốc của số serial ngày trong Excel
+EXCEL_EPOCH = "1899-12-30"
+
+# Định dạng ngày thử lần lượt khi nhận diện (ưu tiên ngày/tháng/năm)
+DATE_FORMATS = (
+    "%d/%m/%Y", "%d/%m/%Y %H:%M:%S", "%d/%m/%Y %H:%M",
+    "%d-%m-%Y", "%d.%m.%Y",
+    "%Y-%m-%d", "%Y-%m-%d %H:%M:%S", "%Y/%m/%d",
+    "%m/%d/%Y", "%m/%d/%Y %H:%M:%S",
+)
+
+# Số giá trị lấy mẫu để nhận diện định dạng ngày và dấu phân cách số
+SAMPLE_SIZE = 500
+
+# Cột có tỷ lệ giá trị khác nhau dưới mức này được chuyển đổi trên các giá trị khác nhau
+UNIQUE_RATIO = 0.5
+
+# Số bộ tiêu đề cột nguồn được nhớ kết quả ánh xạ cột
+MAX_LAYOUTS = 256
+
+# Dấu phân cách (hàng nghìn, thập phân) khi cả file không có giá trị nào phân biệt được
+DEFAULT_SEPARATORS = (",", ".")
+
+# Cột đích -> các cách viết tiêu đề (so khớp sau khi bỏ dấu, khoảng trắng, dấu câu)
+COLUMN_ALIASES = {
+    "ngay_nhap": ["Ngày nhập", "Ngày", "Ngày giao dịch", "Ngày nhập kho", "Date"],
+    "ten_nguyen_lieu": ["Tên nguyên liệu", "Nguyên liệu", "Tên hàng", "Name", "Material"],
+    "lo": ["Lô", "Số lô", "Vị trí", "Lock", "Lot"],
+    "so_bao": ["Số bao", "Số lượng bao", "Bao", "Bag", "Bags"],
+    "khoiluong": ["Khối lượng", "Trọng lượng", "Weight", "Kg"],
+    "code/ncc": ["Code/NCC", "Mã NCC", "Nhà cung cấp", "NCC", "Supplier"],
+}
+
+# Cột đích dẫn xuất từ các cột theo bố cục Google Sheets khi không có cột trực tiếp:
+# (nhập, sử dụng) -> nhập - sử dụng; bố cục kiểm kê chỉ có tồn cuối
+DERIVED_ALIASES = {
+    "so_bao": (("Nhập (Bag)", "Sử dụng (Bag)"), "Tồn cuối (Bag)"),
+    "khoiluong": (("Nhập (Weight)", "Sử dụng (Weight)"), "Tồn cuối (Weight)"),
+}
+
+# Schema của bảng inventory: cột -> kiểu ("date", "text", "number"); cột không bắt buộc chỉ có
+# khi nguồn có dữ liệu tương ứng
+INVENTORY_SCHEMA = {
+    "ngay_nhap": "date",
+    "ten_nguyen_lieu": "text",
+    "lo": "text",
+    "so_bao": "number",
+    "khoiluong": "number",
+    "code/ncc": "text",
+}
+OPTIONAL_COLUMNS = {"code/ncc"}
+
+_THOUSANDS_GROUPS = {sep: re.compile(rf"^-?\d{{1,3}}(\{sep}\d{{3}})+$") for sep in ",."}
+
+def _value_kind(series):
+    """Loại giá trị của cột: "number", "date", "text" hoặc "mixed" (lẫn nhiều loại)"""
+    if pd.api.types.is_bool_dtype(series):
+        return "mixed"
+    if pd.api.types.is_numeric_dtype(series):
+        return "number"
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return "date"
+    if pd.api.types.is_string_dtype(series) and series.dtype != object:
+        return "text"
+    kind = pd.api.types.infer_dtype(series, skipna=True)
+    if kind in ("string", "empty"):
+        return "text"
+    if kind in ("integer", "floating", "mixed-integer-float", "decimal"):
+        return "number"
+    if kind in ("datetime", "datetime64", "date"):
+        return "date"
+    return "mixed"
+
+def _map_unique(series, func):
+    """Áp func lên các giá trị khác nhau của cột rồi trải lại theo mã (cột lặp lại nhiều)"""
+    codes, uniques = pd.factorize(series, use_na_sentinel=True)
+    if len(uniques) > len(series) * UNIQUE_RATIO:
+        return func(series)
+    mapped = func(pd.Series(uniques))
+    return pd.Series(mapped.array.take(codes, allow_fill=True), index=series.index, name=series.name)
+
+def _text_values(series):
+    """Các giá trị kiểu chuỗi (đã bỏ khoảng trắng) của một cột"""
+    if pd.api.types.is_string_dtype(series) and series.dtype != object:
+        return series.dropna().str.strip()
+    values = series.dropna()
+    return values[values.map(type) == str].astype(str).str.strip()
+
+def detect_date_format(sample):
+    """Định dạng trong DATE_FORMATS đọc được nhiều giá trị mẫu nhất, None nếu không đọc được giá trị nào"""
+    sample = sample[sample != ""]
+    if sample.empty:
+        return None
+    best, best_count = None, 0
+    for fmt in DATE_FORMATS:
+        count = int(pd.to_datetime(sample, format=fmt, errors="coerce").notna().sum())
+        if count == len(sample):
+            return fmt
+        if count > best_count:
+            best, best_count = fmt, count
+    return best
+
+def detect_separators(sample):
+    """
+    (dấu phân cách hàng nghìn, dấu thập phân) của các giá trị số dạng chuỗi
+
+    None nếu mẫu không đủ để phân biệt: không có dấu nào, chỉ có giá trị một nhóm ba chữ số như
+    "1.000" / "1,234" (hàng nghìn hay thập phân đều được), hoặc các giá trị mâu thuẫn nhau.
+    """
+    sample = sample.str.replace(r"[\s ]", "", regex=True)
+    has_comma = sample.str.contains(",", regex=False)
+    has_dot = sample.str.contains(".", regex=False)
+    both = sample[has_comma & has_dot]
+    if not both.empty:
+        # Dấu xuất hiện sau cùng là dấu thập phân: 1.234,5 hoặc 1,234.5
+        return (".", ",") if (both.str.rfind(",") > both.str.rfind(".")).mean() >= 0.5 else (",", ".")
+    verdicts = set()
+    for sep, other in ((",", "."), (".", ",")):
+        with_sep = sample[has_comma if sep == "," else has_dot]
+        if with_sep.empty:
+            continue
+        if not with_sep.str.match(_THOUSANDS_GROUPS[sep]).all():
+            # "1,5" hoặc "12.34": dấu thập phân
+            verdicts.add((other, sep))
+        elif (with_sep.str.count(re.escape(sep)) > 1).any():
+            # "1.234.567": phân cách hàng nghìn
+            verdicts.add((sep, other))
+    return verdicts.pop() if len(verdicts) == 1 else None
+
+def _clean_text(series):
+    text = series.astype(str).str.strip()
+    return text.where(text != "")
+
+class SchemaNormalizer:
+    """
+    Chuẩn hoá DataFrame thô (tiêu đề tự do, ngày/số dạng chuỗi) về đúng schema của bảng
+
+    Ánh xạ tiêu đề được nhớ theo bộ tiêu đề cột. Định dạng ngày và dấu phân cách số được nhận
+    diện trên mẫu của từng khối và không dùng lại giữa các file: hai file cùng tiêu đề vẫn có thể
+    ghi số theo hai kiểu khác nhau. Các khối của cùng một file dùng chung kết quả qua for_file().
+    """
+
+    def __init__(self, schema=INVENTORY_SCHEMA, aliases=COLUMN_ALIASES, derived=DERIVED_ALIASES,
+                 optional=OPTIONAL_COLUMNS):
+        self.schema = schema
+        self.optional = set(optional)
+        self._aliases = {normalize_key(alias): target
+                         for target, names in aliases.items() for alias in [target, *names]}
+        self._derived = derived
+        self._mappings = {}
+        self._lock = threading.Lock()
+
+    def _map_columns(self, columns):
+        """Cột đích -> cột nguồn (cột đầu tiên khớp), dẫn xuất -> (nhập, sử dụng) hoặc tồn cuối"""
+        sources = {}
+        keys = {}
+        for col in columns:
+            keys.setdefault(normalize_key(col), col)
+            target = self._aliases.get(normalize_key(col))
+            if target and target not in sources:
+                sources[target] = col
+        for target, (pair, balance) in self._derived.items():
+            if target in sources:
+                continue
+            found = [keys.get(normalize_key(name)) for name in pair]
+            if all(found):
+                sources[target] = tuple(found)
+            elif keys.get(normalize_key(balance)):
+                sources[target] = keys[normalize_key(balance)]
+        return sources
+
+    def _sources(self, columns):
+        """(bộ tiêu đề, ánh xạ cột) được nhớ theo bộ tiêu đề"""
+        key = tuple(map(str, columns))
+        with self._lock:
+            found = self._mappings.get(key)
+        if found is None:
+            found = self._map_columns(columns)
+            with self._lock:
+                if len(self._mappings) >= MAX_LAYOUTS:
+                    self._mappings.clear()
+                self._mappings[key] = found
+        return key, found
+
+    def layout(self, df, previous=None):
+        """
+        Kết quả nhận diện trên mẫu của df; previous là kết quả của khối trước trong cùng file
+
+        Cột số không tự phân biệt được dấu phân cách (vd. chỉ có "1.000") lấy kết quả chắc chắn
+        của chính cột đó ở khối trước, rồi kiểu chiếm đa số của các cột số khác trong file, cuối
+        cùng mới là DEFAULT_SEPARATORS.
+        """
+        key, sources = self._sources(df.columns)
+        if previous is not None and previous["columns"] != key:
+            previous = None
+        formats = {}
+        detected = {}
+        for target, kind in self.schema.items():
+            source = sources.get(target)
+            if source is None:
+                continue
+            for col in source if isinstance(source, tuple) else (source,):
+                sample = _text_values(df[col].head(SAMPLE_SIZE))
+                if kind == "date":
+                    formats[col] = detect_date_format(sample)
+                elif kind == "number" and not sample.empty:
+                    detected[col] = detect_separators(sample)
+
+        decided = dict(previous["decided"]) if previous else {}
+        decided.update((col, found) for col, found in detected.items() if found)
+        votes = Counter(decided.values()).most_common(1)
+        file_separators = votes[0][0] if votes else DEFAULT_SEPARATORS
+        for col in detected:
+            formats[col] = decided.get(col, file_separators)
+        return {"columns": key, "sources": sources, "formats": formats, "decided": decided}
+
+    def for_file(self):
+        """Bộ chuẩn hoá cho các khối của một file/sheet (xem FileSchema)"""
+        return FileSchema(self)
+
+    def _parse_date(self, series, fmt):
+        kind = _value_kind(series)
+        if kind == "date":
+            parsed = pd.to_datetime(series, errors="coerce")
+            return parsed.dt.tz_localize(None) if parsed.dt.tz is not None else parsed
+        if kind == "number":
+            return pd.to_datetime(series, unit="D", origin=EXCEL_EPOCH, errors="coerce")
+        if kind == "text":
+            return self._parse_date_text(series, fmt)
+        # Cột lẫn ô ngày thật (datetime/date) và ô chuỗi
+        is_text = series.map(type) == str
+        result = pd.to_datetime(series.where(~is_text), errors="coerce")
+        result[is_text] = self._parse_date_text(series[is_text], fmt)
+        return result
+
+    @staticmethod
+    def _parse_date_text(series, fmt):
+        values = series.astype(str).str.strip()
+        parsed = pd.to_datetime(values, format=fmt, errors="coerce") if fmt else \
+            pd.Series(pd.NaT, index=values.index, dtype="datetime64[us]")
+        missed = parsed.isna() & values.notna() & (values != "")
+        if missed.any():
+            # Giá trị khác định dạng đã nhận diện (hiếm): nhận diện lại riêng cho chúng
+            retry = detect_date_format(values[missed])
+            if retry:
+                parsed[missed] = pd.to_datetime(values[missed], format=retry, errors="coerce")
+        return parsed
+
+    def _parse_number(self, series, separators):
+        kind = _value_kind(series)
+        if kind == "number":
+            return pd.to_numeric(series, errors="coerce").astype("float64")
+        if kind == "text":
+            return self._parse_number_text(series, separators)
+        is_text = series.map(type) == str
+        result = pd.to_numeric(series.where(~is_text), errors="coerce").astype("float64")
+        result[is_text] = self._parse_number_text(series[is_text], separators)
+        return result
+
+    @staticmethod
+    def _parse_number_text(series, separators):
+        thousands, decimal = separators or (",", ".")
+        values = series.astype(str).str.replace(" ", "", regex=False).str.replace("\u00a0", "", regex=False)
+        values = values.str.replace(thousands, "", regex=False)
+        if decimal != ".":
+            values = values.str.replace(decimal, ".", regex=False)
+        try:
+            # Đường nhanh: mọi giá trị đều là số hợp lệ
+            return values.where(values != "").astype("float64")
+        except ValueError:
+            return pd.to_numeric(values, errors="coerce").astype("float64")
+
+    def _column(self, df, source, kind, formats):
+        if isinstance(source, tuple):
+            first, second = (self._parse_number(df[col], formats.get(col)) for col in source)
+            return (first.fillna(0) - second.fillna(0)).where(first.notna() | second.notna())
+        if kind == "date":
+            return _map_unique(df[source], lambda values: self._parse_date(values, formats.get(source)))
+        if kind == "number":
+            return _map_unique(df[source], lambda values: self._parse_number(values, formats.get(source)))
+        return _map_unique(df[source], _clean_text)
+
+    def normalize(self, df, today=None, layout=None):
+        """DataFrame đúng schema: các cột theo thứ tự schema, kiểu đã chuyển đổi, cột age"""
+        detected = layout if layout is not None else self.layout(df)
+        sources, formats = detected["sources"], detected["formats"]
+        columns = {}
+        for target, kind in self.schema.items():
+            source = sources.get(target)
+            if source is None:
+                if target in self.optional:
+                    continue
+                columns[target] = pd.Series(
+                    pd.NaT if kind == "date" else np.nan if kind == "number" else None,
+                    index=df.index, dtype="datetime64[us]" if kind == "date" else
+                    "float64" if kind == "number" else "str"
+                )
+                continue
+            columns[target] = self._column(df, source, kind, formats)
+        out = pd.DataFrame(columns, index=df.index)
+
+        # Bỏ dòng trống hoàn toàn (thường là dòng tổng/ghi chú cuối sheet)
+        out = out[out.notna().any(axis=1)]
+        out = self.downcast(out)
+        today = pd.Timestamp(today) if today is not None else pd.Timestamp.today()
+        age = (today - out["ngay_nhap"]).dt.days
+        out["age"] = age.astype("int32") if age.notna().all() else age.astype("Int32")
+        return out.reset_index(drop=True)
+
+    @staticmethod
+    def downcast(df):
+        """Cột số nguyên (không thiếu giá trị) -> int32; số thực giữ float64 như REAL trong SQLite"""
+        for col in df.columns:
+            series = df[col]
+            if series.dtype != "float64" or series.isna().any() or series.empty:
+                continue
+            values = series.to_numpy()
+            if (np.mod(values, 1) == 0).all() and np.abs(values).max() < 2 ** 31:
+                df[col] = series.astype("int32")
+        return df
+
+class FileSchema:
+    """
+    Chuẩn hoá lần lượt các khối của cùng một file/sheet
+
+    Mỗi khối vẫn được nhận diện lại trên mẫu của chính nó (khối sau khác kiểu thì theo khối sau);
+    kết quả chắc chắn của các khối trước chỉ dùng cho những cột mà khối hiện tại không tự phân biệt.
+    """
+
+    def __init__(self, normalizer):
+        self.normalizer = normalizer
+        self.layout = None
+
+    def normalize(self, df, today=None):
+        self.layout = self.normalizer.layout(df, previous=self.layout)
+        return self.normalizer.normalize(df, today, layout=self.layout)
+
+# Singleton instance
+inventory_schema = SchemaNormalizer()
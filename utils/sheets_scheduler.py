@@ -0,0 +1,121 @@
+import random
+import threading
+import time
+from concurrent.futures import Future
+
+from utils.instrumentation import metrics
+
+# Quota mặc định của Sheets API cho một user (service account): request mỗi phút
+READ_QUOTA_PER_MINUTE = 60
+WRITE_QUOTA_PER_MINUTE = 60
+
+# Retry khi bị giới hạn quota (429) hoặc lỗi phía server (5xx)
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+MAX_RETRIES = 5
+RETRY_BASE = 1.0
+RETRY_MAX = 32.0
+
+class TokenBucket:
+    """Giới hạn tốc độ: mỗi request lấy một token, token hồi lại đều theo quota mỗi phút"""
+
+    def __init__(self, per_minute, capacity=None):
+        self.rate = per_minute / 60.0
+        self.capacity = capacity or per_minute
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Chờ tới khi có token; trả về thời gian đã chờ (giây)"""
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return waited
+                delay = (1 - self.tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+def _status_code(error):
+    response = getattr(error, "response", None)
+    return getattr(response, "status_code", None)
+
+def _retry_after(error):
+    """Giá trị header Retry-After (giây) nếu server gửi kèm"""
+    response = getattr(error, "response", None)
+    try:
+        return float(response.headers.get("Retry-After"))
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+class SheetsScheduler:
+    """
+    Mọi request Google Sheets của process đi qua đây
+
+    - token bucket riêng cho đọc và ghi theo quota mỗi phút
+    - các lần đọc giống hệt nhau đang chạy đồng thời được gộp thành một request
+    - 429/5xx được retry với exponential backoff có jitter (ghi không idempotent chỉ retry 429)
+    """
+
+    def __init__(self, read_quota=READ_QUOTA_PER_MINUTE, write_quota=WRITE_QUOTA_PER_MINUTE,
+                 max_retries=MAX_RETRIES):
+        self.read_bucket = TokenBucket(read_quota)
+        self.write_bucket = TokenBucket(write_quota)
+        self.max_retries = max_retries
+        self.stats = {"requests": 0, "retries": 0, "coalesced": 0, "throttled_seconds": 0.0}
+        self._inflight = {}
+        self._lock = threading.Lock()
+
+    def read(self, key, func):
+        """Chạy một request đọc; cùng key đang chạy thì chờ và dùng chung kết quả"""
+        with self._lock:
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                future = self._inflight[key] = Future()
+            else:
+                self.stats["coalesced"] += 1
+                metrics.count("sheets.coalesced")
+        if not owner:
+            return future.result()
+        try:
+            future.set_result(self._execute(self.read_bucket, func, idempotent=True))
+        except BaseException as e:
+            future.set_exception(e)
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+        return future.result()
+
+    def write(self, func, idempotent=True):
+        """Chạy một request ghi (idempotent=False: chỉ retry khi request chắc chắn chưa được thực hiện)"""
+        return self._execute(self.write_bucket, func, idempotent=idempotent)
+
+    def _execute(self, bucket, func, idempotent):
+        from gspread.exceptions import APIError
+        for attempt in range(self.max_retries + 1):
+            waited = bucket.acquire()
+            with self._lock:
+                self.stats["requests"] += 1
+                self.stats["throttled_seconds"] += waited
+            metrics.count("sheets.requests")
+            metrics.count("sheets.throttled_seconds", waited)
+            try:
+                return func()
+            except APIError as e:
+                status = _status_code(e)
+                retryable = status == 429 or (idempotent and status in RETRYABLE_STATUS)
+                if not retryable or attempt == self.max_retries:
+                    raise
+                delay = _retry_after(e) or min(RETRY_BASE * 2 ** attempt, RETRY_MAX) * random.uniform(0.5, 1.0)
+                with self._lock:
+                    self.stats["retries"] += 1
+                metrics.count(f"sheets.retries.{status}")
+                time.sleep(delay)
+
+# Singleton instance
+sheets_scheduler = SheetsScheduler()
@@ -0,0 +1,100 @@
+import json
+import os
+import threading
+from datetime import datetime
+
+import pandas as pd
+
+from database import DB
+
+# Snapshot nằm cạnh inventory.db
+SNAPSHOT_DIR = os.path.join(os.path.dirname(os.path.abspath(DB)), "snapshots")
+
+# Tăng khi đổi cột hoặc cách tính của dữ liệu trong snapshot; snapshot khác phiên bản bị bỏ qua
+SNAPSHOT_VERSION = 1
+
+# Khoá metadata trong schema Arrow
+METADATA_KEY = b"checkstock"
+
+# Cột watermark đồng bộ (giá trị thô của ID và Updated_At trên sheet)
+WATERMARK_COLS = ("__sync_id", "__sync_updated")
+
+def _arrow_safe(df):
+    """Cột object lẫn kiểu (vd. Code/NCC vừa số vừa chữ) được đưa về chuỗi để ghi Arrow"""
+    df = df.copy(deep=False)
+    for col in df.columns:
+        series = df[col]
+        if series.dtype == object and pd.api.types.infer_dtype(series, skipna=True) not in ("string", "empty"):
+            df[col] = series.map(lambda v: v if pd.isna(v) else str(v))
+    return df
+
+class SnapshotStore:
+    """Snapshot dạng cột (Feather, không nén để đọc bằng memory-map) của dữ liệu đã tính"""
+
+    def __init__(self, directory=SNAPSHOT_DIR):
+        self.directory = directory
+        self._lock = threading.Lock()
+        self.last_error = None
+        self._pending = {}
+        self._thread = None
+
+    def path(self, name):
+        return os.path.join(self.directory, f"{name}.feather")
+
+    def read(self, name):
+        """(df, header, ids, updated) nếu có snapshot cùng SNAPSHOT_VERSION, ngược lại None"""
+        if not os.path.exists(self.path(name)):
+            return None
+        # pyarrow chỉ được tải khi có snapshot để đọc/ghi
+        import pyarrow as pa
+        import pyarrow.feather as feather
+        try:
+            table = feather.read_table(self.path(name), memory_map=True)
+            meta = json.loads((table.schema.metadata or {}).get(METADATA_KEY, b"{}"))
+        except (OSError, pa.ArrowInvalid, ValueError):
+            return None
+        if meta.get("version") != SNAPSHOT_VERSION or not all(col in table.column_names for col in WATERMARK_COLS):
+            return None
+        ids = table.column(WATERMARK_COLS[0]).to_pylist()
+        updated = table.column(WATERMARK_COLS[1]).to_pylist()
+        df = table.drop_columns(list(WATERMARK_COLS)).to_pandas()
+        return df, meta["header"], ids, updated
+
+    def write(self, name, df, header, ids, updated):
+        """Ghi snapshot (file tạm rồi đổi tên, không bao giờ để lại file ghi dở)"""
+        import pyarrow as pa
+        import pyarrow.feather as feather
+        frame = _arrow_safe(df.reset_index(drop=True)).assign(
+            **{WATERMARK_COLS[0]: list(ids), WATERMARK_COLS[1]: list(updated)}
+        )
+        table = pa.Table.from_pandas(frame, preserve_index=False)
+        meta = {"version": SNAPSHOT_VERSION, "header": list(header), "written_at": datetime.now().isoformat()}
+        table = table.replace_schema_metadata({**(table.schema.metadata or {}), METADATA_KEY: json.dumps(meta)})
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_path = self.path(name) + ".tmp"
+        feather.write_feather(table, tmp_path, compression="uncompressed")
+        os.replace(tmp_path, self.path(name))
+
+    def write_async(self, name, *args):
+        """Ghi ở luồng nền; nhiều lần ghi liên tiếp chỉ giữ bản mới nhất"""
+        with self._lock:
+            self._pending[name] = args
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="snapshot-writer", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._lock:
+                if not self._pending:
+                    self._thread = None
+                    return
+                name, args = self._pending.popitem()
+            try:
+                self.write(name, *args)
+                self.last_error = None
+            except Exception as e:
+                self.last_error = f"{name}: {e}"
+
+# Singleton instance
+snapshot_store = SnapshotStore()
@@ -0,0 +1,325 @@
+import json
+import os
+import queue
+import sqlite3
+import threading
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from contextlib import contextmanager
+from datetime import datetime
+
+from database import DB
+from utils.google_sheets import INVENTORY_HEADERS, build_transaction_row
+
+# Log nằm cạnh inventory.db
+TRANSACTION_LOG_DB = os.path.join(os.path.dirname(os.path.abspath(DB)), "transactions.db")
+
+# Số lệnh ghi tối đa gộp vào một lần commit
+GROUP_COMMIT_MAX = 1000
+
+# Chu kỳ kiểm tra luồng ghi còn chạy trong lúc chờ một lệnh ghi được commit (giây)
+WRITE_POLL_SECONDS = 5.0
+
+# Thời gian chờ tối đa luồng ghi tạo bảng trước lần đọc đầu tiên (giây)
+SCHEMA_TIMEOUT = 60.0
+
+# Pragma của các kết nối tới log
+LOG_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA busy_timeout=30000",
+)
+
+# Vị trí các cột của một dòng theo INVENTORY_HEADERS
+_COL = {name: INVENTORY_HEADERS.index(name) for name in (
+    "ID", "Ngày nhập", "Name", "Lock", "Tồn đầu (Bag)", "Tồn đầu (Weight)",
+    "Nhập (Bag)", "Nhập (Weight)", "Sử dụng (Bag)", "Sử dụng (Weight)"
+)}
+
+def _number(value):
+    try:
+        return float(value or 0)
+    except (TypeError, ValueError):
+        return 0.0
+
+class TransactionLog:
+    """
+    Log giao dịch chỉ ghi thêm, dùng chung cho mọi phiên Streamlit của process
+
+    - ID là khoá AUTOINCREMENT của SQLite: tăng dần, không bao giờ dùng lại, kể cả khi có nhiều
+      phiên gửi cùng lúc hoặc khi dòng cuối bị xoá
+    - mọi lệnh ghi đi qua một hàng đợi và một luồng ghi duy nhất; các lệnh đang chờ được gộp vào
+      một transaction (group commit), nên không phiên nào gặp "database is locked"
+    - đọc dùng kết nối riêng của từng thread ở chế độ WAL: mỗi lần đọc thấy một snapshot đã
+      commit và không chờ luồng ghi
+    """
+
+    def __init__(self, db_path=TRANSACTION_LOG_DB, group_commit_max=GROUP_COMMIT_MAX):
+        self.db_path = db_path
+        self.group_commit_max = group_commit_max
+        self.stats = {"commits": 0, "writes": 0}
+        self._queue = queue.Queue()
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._schema_ready = threading.Event()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None, check_same_thread=False)
+        for pragma in LOG_PRAGMAS:
+            conn.execute(pragma)
+        return conn
+
+    def _ensure_schema(self, conn):
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS transactions (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                worksheet TEXT NOT NULL,
+                ngay_nhap TEXT,
+                ten_nguyen_lieu TEXT,
+                lo TEXT,
+                nhap_bao REAL NOT NULL DEFAULT 0,
+                nhap_kg REAL NOT NULL DEFAULT 0,
+                su_dung_bao REAL NOT NULL DEFAULT 0,
+                su_dung_kg REAL NOT NULL DEFAULT 0,
+                payload TEXT NOT NULL,
+                created_at TEXT NOT NULL,
+                -- Tồn trước log: Tồn đầu của dòng đầu tiên mỗi (nguyên liệu, lô), các dòng sau là 0
+                ton_dau_bao REAL NOT NULL DEFAULT 0,
+                ton_dau_kg REAL NOT NULL DEFAULT 0
+            );
+            CREATE INDEX IF NOT EXISTS idx_transactions_worksheet_id ON transactions (worksheet, id);
+            CREATE INDEX IF NOT EXISTS idx_transactions_ngay_nhap ON transactions (ngay_nhap);
+            -- ID cuối cùng đã đẩy lên Google Sheets của từng worksheet (utils.outbox)
+            CREATE TABLE IF NOT EXISTS sheets_cursor (
+                worksheet TEXT PRIMARY KEY,
+                last_id INTEGER NOT NULL DEFAULT 0,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                last_error TEXT
+            );
+            -- ID journal cũ (outbox.db) đã chuyển vào log, ghi cùng transaction với các dòng
+            CREATE TABLE IF NOT EXISTS legacy_migrated (
+                legacy_id INTEGER PRIMARY KEY,
+                log_id INTEGER NOT NULL
+            );
+        """)
+        if "ton_dau_bao" not in {row[1] for row in conn.execute("PRAGMA table_info(transactions)")}:
+            self._add_opening_balances(conn)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_transactions_pair ON transactions (ten_nguyen_lieu, lo, id)")
+
+    @staticmethod
+    def _add_opening_balances(conn):
+        """Log tạo trước khi có cột tồn trước log: lấy Tồn đầu từ payload của dòng đầu mỗi cặp"""
+        # payload là dòng bỏ cột ID
+        bags, weight = INVENTORY_HEADERS.index("Tồn đầu (Bag)") - 1, INVENTORY_HEADERS.index("Tồn đầu (Weight)") - 1
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("ALTER TABLE transactions ADD COLUMN ton_dau_bao REAL NOT NULL DEFAULT 0")
+            conn.execute("ALTER TABLE transactions ADD COLUMN ton_dau_kg REAL NOT NULL DEFAULT 0")
+            conn.execute(f"""
+                UPDATE transactions SET
+                    ton_dau_bao = COALESCE(CAST(json_extract(payload, '$[{bags}]') AS REAL), 0),
+                    ton_dau_kg = COALESCE(CAST(json_extract(payload, '$[{weight}]') AS REAL), 0)
+                WHERE id IN (SELECT MIN(id) FROM transactions GROUP BY ten_nguyen_lieu, lo)
+            """)
+            # Checkpoint dựng trước đó thiếu tồn trước log (utils.checkpoints)
+            for table in ("balance_checkpoints", "checkpoint_state"):
+                if conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)).fetchone():
+                    conn.execute(f"DELETE FROM {table}")
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    # --- Ghi ---
+
+    def start(self):
+        """Khởi động luồng ghi (chỉ một lần cho mỗi process)"""
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="transaction-log-writer", daemon=True)
+                self._thread.start()
+
+    def submit(self, func):
+        """
+        Đưa một lệnh ghi func(conn) vào hàng đợi; trả về Future với kết quả của func
+
+        func chạy trong transaction chung của cả nhóm: không tự BEGIN/COMMIT, lỗi của func chỉ
+        huỷ phần ghi của chính nó.
+        """
+        future = Future()
+        self.start()
+        self._queue.put((func, future))
+        return future
+
+    def write(self, func, poll=WRITE_POLL_SECONDS):
+        """
+        Chạy func(conn) trên luồng ghi và chờ tới khi đã commit hoặc thất bại
+
+        Không có timeout: lệnh đã vào hàng đợi vẫn sẽ được commit, báo lỗi khi nó còn chờ sẽ khiến
+        người dùng nhập lại và ghi trùng. Trong lúc chờ, luồng ghi được khởi động lại nếu đã dừng.
+        """
+        future = self.submit(func)
+        while True:
+            try:
+                return future.result(poll)
+            except FutureTimeoutError:
+                self.start()
+
+    def _run(self):
+        conn = self._connect()
+        self._ensure_schema(conn)
+        self._schema_ready.set()
+        while True:
+            batch = [self._queue.get()]
+            # Gộp các lệnh đã xếp hàng trong lúc commit lần trước
+            while len(batch) < self.group_commit_max:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._commit(conn, batch)
+            except BaseException as e:
+                # Kết nối hỏng: báo lỗi cho cả nhóm để không phiên nào chờ mãi, luồng mới sẽ chạy tiếp
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                raise
+
+    def _commit(self, conn, batch):
+        results = []
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            for i, (func, _) in enumerate(batch):
+                conn.execute(f"SAVEPOINT w{i}")
+                try:
+                    results.append((func(conn), None))
+                    conn.execute(f"RELEASE w{i}")
+                except Exception as e:
+                    conn.execute(f"ROLLBACK TO w{i}")
+                    conn.execute(f"RELEASE w{i}")
+                    results.append((None, e))
+            conn.execute("COMMIT")
+        except Exception as e:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        with self._lock:
+            self.stats["commits"] += 1
+            self.stats["writes"] += len(batch)
+        for (_, future), (result, error) in zip(batch, results):
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+    def append_rows(self, rows, worksheet_name="Inventory"):
+        """
+        Ghi các dòng (theo INVENTORY_HEADERS) vào log trong một transaction
+
+        Cột ID của mỗi dòng được thay bằng ID log vừa cấp; trả về các dòng đã có ID.
+        """
+        rows = [list(row) for row in rows]
+        return self.write(lambda conn: self.insert_rows(conn, rows, worksheet_name))
+
+    @staticmethod
+    def insert_rows(conn, rows, worksheet_name="Inventory"):
+        """
+        Chèn các dòng (list, theo INVENTORY_HEADERS) bằng kết nối của luồng ghi, gán ID log vào cột ID
+
+        Dùng bên trong một lệnh write() khi cần ghi thêm bảng khác trong cùng transaction.
+        """
+        created_at = datetime.now().isoformat()
+        for row in rows:
+            name, lock = row[_COL["Name"]], row[_COL["Lock"]]
+            # Dòng đầu tiên của cặp (nguyên liệu, lô) mang tồn có từ trước khi có log
+            first = conn.execute(
+                "SELECT 1 FROM transactions WHERE ten_nguyen_lieu IS ? AND lo IS ? LIMIT 1", (name, lock)
+            ).fetchone() is None
+            cursor = conn.execute(
+                "INSERT INTO transactions (worksheet, ngay_nhap, ten_nguyen_lieu, lo, nhap_bao, nhap_kg, "
+                "su_dung_bao, su_dung_kg, payload, created_at, ton_dau_bao, ton_dau_kg) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    worksheet_name,
+                    str(row[_COL["Ngày nhập"]])[:10] or None,
+                    name,
+                    lock,
+                    _number(row[_COL["Nhập (Bag)"]]),
+                    _number(row[_COL["Nhập (Weight)"]]),
+                    _number(row[_COL["Sử dụng (Bag)"]]),
+                    _number(row[_COL["Sử dụng (Weight)"]]),
+                    json.dumps(row[1:], ensure_ascii=False),
+                    created_at,
+                    _number(row[_COL["Tồn đầu (Bag)"]]) if first else 0.0,
+                    _number(row[_COL["Tồn đầu (Weight)"]]) if first else 0.0,
+                )
+            )
+            row[_COL["ID"]] = str(cursor.lastrowid)
+        return rows
+
+    def append(self, transaction_data, worksheet_name="Inventory"):
+        """Ghi một transaction mới; trả về dòng dữ liệu với ID log"""
+        return self.append_rows([build_transaction_row(transaction_data)], worksheet_name)[0]
+
+    # --- Đọc ---
+
+    def _reader(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+            conn.execute("PRAGMA query_only=ON")
+        if not self._schema_ready.is_set():
+            # Bảng được tạo bởi luồng ghi; đọc trước lần ghi đầu tiên cũng phải thấy bảng
+            self.start()
+            self._schema_ready.wait(SCHEMA_TIMEOUT)
+        return conn
+
+    @contextmanager
+    def snapshot(self):
+        """Kết nối đọc trong một transaction đọc: mọi truy vấn bên trong thấy cùng một snapshot"""
+        conn = self._reader()
+        if conn.in_transaction:
+            # Lồng trong một snapshot khác của cùng thread: dùng luôn snapshot đó
+            yield conn
+            return
+        conn.execute("BEGIN")
+        try:
+            yield conn
+        finally:
+            conn.execute("COMMIT")
+
+    def rows(self, worksheet_name="Inventory", after_id=0, limit=-1):
+        """Các dòng (theo INVENTORY_HEADERS) có ID lớn hơn after_id, theo thứ tự ID"""
+        with self.snapshot() as conn:
+            found = conn.execute(
+                "SELECT id, payload FROM transactions WHERE worksheet = ? AND id > ? ORDER BY id LIMIT ?",
+                (worksheet_name, after_id, limit)
+            ).fetchall()
+        return [[str(row_id)] + json.loads(payload) for row_id, payload in found]
+
+    def day_summary(self, day):
+        """Số giao dịch của một ngày: tổng, số dòng có nhập, số dòng có sử dụng (xuất)"""
+        with self.snapshot() as conn:
+            row = conn.execute("""
+                SELECT COUNT(*), COALESCE(SUM(nhap_bao > 0 OR nhap_kg > 0), 0),
+                       COALESCE(SUM(su_dung_bao > 0 OR su_dung_kg > 0), 0)
+                FROM transactions WHERE ngay_nhap = ?
+            """, (str(day)[:10],)).fetchone()
+        return dict(zip(["so_dong", "so_dong_nhap", "so_dong_xuat"], row))
+
+    def last_id(self):
+        with self.snapshot() as conn:
+            return conn.execute("SELECT COALESCE(MAX(id), 0) FROM transactions").fetchone()[0]
+
+    def close(self):
+        """Đóng kết nối đọc của thread hiện tại"""
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+# Singleton instance
+transaction_log = TransactionLog()